@@ -0,0 +1,200 @@
+import gzip, logging, os, shutil, sqlite3, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#The number of threads copying files to the archive in the background
+ARCHIVE_WORKERS = 2
+
+#The number of times a background copy is attempted, and the seconds to wait between attempts
+COPY_ATTEMPTS = 3
+COPY_RETRY_SECONDS = 5
+
+#The compression that can be applied to archived files, and the extension added for each
+COMPRESSION = {
+    '': '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+logger = logging.getLogger('archive')
+
+
+class Archiver:
+    """Moves files out of the watched directories once they have been imported, without holding up
+    the next import. A file is renamed into place when the archive is on the same volume. Otherwise,
+    or when archived files are compressed, it is copied by a background thread and removed once the
+    copy is complete.
+    Every move is recorded in a SQLite table before it starts and removed once it is done. A file
+    with a move recorded is never imported again, and moves interrupted by a crash are finished by
+    recover() when the service starts. Copies that fail every attempt are kept until retry_failed()
+    starts them again.
+    """
+
+    def __init__(self, path: str, workers=ARCHIVE_WORKERS, compression=''):
+        """
+        Args:
+            path (str): The SQLite database the moves are recorded in. It will be created if it does not exist
+            workers (int): The number of background copy threads
+            compression (str): One of COMPRESSION. Applied to files moved into the archive, files moved to the
+                errors directory are never compressed
+        """
+        if compression not in COMPRESSION:
+            raise ValueError("Unknown compression '{0}'. Choose one of {1}".format(compression, list(COMPRESSION)))
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+
+        self.path = path
+        self.compression = compression
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='archiver')
+        self.lock = threading.Lock()
+
+        # Source paths with a move in progress
+        self.pending = set()
+
+        # source -> (destination, compression) of the copies that failed every attempt. They stay pending
+        self.failed = {}
+
+        with closing(self.connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS moves ("
+                "source TEXT PRIMARY KEY, destination TEXT NOT NULL, compression TEXT NOT NULL, started TEXT NOT NULL)")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def archive(self, source: str, directory: str, compress=True):
+        """Move a file into a directory. The file is given a timestamp suffix so it never overwrites an
+        earlier file with the same name
+
+        Args:
+            source (str): The file to move
+            directory (str): The directory to move it to
+            compress (bool): Compress the file if the archiver was set up with compression
+
+        Returns:
+            str: The path the file will end up at
+        """
+        compression = self.compression if compress else ''
+        postfix = datetime.today().strftime('%Y-%m-%d-%H-%M-%S-%f')
+        destination = os.path.join(directory, "{0}.{1}{2}".format(os.path.basename(source), postfix,
+            COMPRESSION[compression]))
+
+        self.begin(source, destination, compression)
+        if not compression:
+            try:
+                # A rename on the same volume is atomic and instant
+                os.replace(source, destination)
+                self.finish(source)
+                logger.info("Moved '%s' to '%s'", source, destination)
+                return destination
+            except OSError as e:
+                logger.debug("Unable to rename '%s', copying it instead: %s", source, e)
+
+        logger.info("Copying '%s' to '%s' in the background", source, destination)
+        self.executor.submit(self.copy, source, destination, compression)
+        return destination
+
+    def begin(self, source, destination, compression):
+        """Record a move before it starts"""
+        with self.lock:
+            self.pending.add(os.path.normcase(os.path.abspath(source)))
+        with closing(self.connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO moves (source, destination, compression, started) VALUES (?, ?, ?, ?)",
+                (source, destination, compression, time.strftime('%Y-%m-%d %H:%M:%S')))
+
+    def finish(self, source):
+        """Forget a move once the file is gone from the watched directory"""
+        with closing(self.connect()) as conn, conn:
+            conn.execute("DELETE FROM moves WHERE source = ?", (source,))
+        with self.lock:
+            self.pending.discard(os.path.normcase(os.path.abspath(source)))
+
+    def is_pending(self, path: str):
+        """Returns true if the file is being moved and must not be imported again"""
+        with self.lock:
+            return os.path.normcase(os.path.abspath(path)) in self.pending
+
+    def copy(self, source, destination, compression):
+        """Copy a file to its destination then remove the original. The copy is written under a temporary
+        name and renamed once complete, so a partial copy is never mistaken for an archived file"""
+        for attempt in range(1, COPY_ATTEMPTS + 1):
+            try:
+                if os.path.exists(source):
+                    partial = destination + '.part'
+                    with open(source, 'rb') as src, open_archive(partial, compression) as dst:
+                        shutil.copyfileobj(src, dst, 1024 * 1024)
+                    os.replace(partial, destination)
+                    os.remove(source)
+                self.finish(source)
+                logger.info("Moved '%s' to '%s'", source, destination)
+                return
+            except Exception as e:
+                logger.warning("Attempt %s to copy '%s' to '%s' failed: %s", attempt, source, destination, e)
+                if attempt < COPY_ATTEMPTS:
+                    time.sleep(COPY_RETRY_SECONDS)
+        logger.error("Unable to move '%s' to '%s'. The move will be attempted again later", source, destination)
+        with self.lock:
+            self.failed[source] = (destination, compression)
+
+    def recover(self):
+        """Finish the moves that were interrupted when the service last stopped
+
+        Returns:
+            int: The number of moves that were restarted
+        """
+        with closing(self.connect()) as conn:
+            moves = conn.execute("SELECT source, destination, compression FROM moves").fetchall()
+
+        restarted = 0
+        for source, destination, compression in moves:
+            if not os.path.exists(source):
+                # The move completed but was not marked as finished
+                self.finish(source)
+                continue
+            logger.info("Finishing interrupted move of '%s' to '%s'", source, destination)
+            with self.lock:
+                self.pending.add(os.path.normcase(os.path.abspath(source)))
+            self.executor.submit(self.copy, source, destination, compression)
+            restarted += 1
+        return restarted
+
+    def retry_failed(self):
+        """Start the copies that failed every attempt again
+
+        Returns:
+            int: The number of moves that were restarted
+        """
+        with self.lock:
+            failed, self.failed = self.failed, {}
+        for source, (destination, compression) in failed.items():
+            logger.info("Trying the failed move of '%s' to '%s' again", source, destination)
+            self.executor.submit(self.copy, source, destination, compression)
+        return len(failed)
+
+    def depth(self):
+        """The number of moves still in progress, including the failed ones"""
+        with self.lock:
+            return len(self.pending)
+
+    def failures(self):
+        """The number of moves that failed every attempt and are waiting for retry_failed()"""
+        with self.lock:
+            return len(self.failed)
+
+    def close(self):
+        """Wait for the background copies to finish"""
+        self.executor.shutdown(wait=True)
+
+
+def open_archive(path, compression):
+    """Open a file for writing, compressed with one of COMPRESSION"""
+    if compression == 'gzip':
+        return gzip.open(path, 'wb')
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+    return open(path, 'wb')
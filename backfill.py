@@ -0,0 +1,254 @@
+"""Import exported files straight into a database from the command line, without the Windows service.
+Meant for loading years of old exports in one go on any platform. Files are parsed on every core while
+a single writer imports them into the database in the order they were given. Files that were already
+imported are skipped, so an interrupted backfill can simply be run again. Files are left where they are.
+
+Every option can also be set in a config file passed with -c, or in an environment variable named after
+the option, i.e. CONTAINER_TRACKING_DATABASE for --database.
+
+Usage: python backfill.py --sink sqlite --database shipments.sqlite exports/2019 exports/2020/week-01.xlsx
+"""
+import logging, os, sys, time
+
+import configargparse
+
+#Environment variables named with this prefix and the option name set the options, i.e. CONTAINER_TRACKING_SINK
+ENV_PREFIX = 'CONTAINER_TRACKING_'
+
+#The least number of seconds between progress updates when the output is not a terminal
+PROGRESS_INTERVAL = 10
+
+logger = logging.getLogger('backfill')
+
+
+def parse_args(argv=None):
+    parser = configargparse.ArgParser(description=__doc__.splitlines()[0], auto_env_var_prefix=ENV_PREFIX)
+    parser.add_argument('-c', '--config', is_config_file=True, help='a config file of option = value lines')
+    parser.add_argument('paths', nargs='+', help='the files to import, or directories to import every file from')
+    parser.add_argument('--database', required=True,
+        help='the database to import into. A file path for Access and SQLite, a connection string for PostgreSQL')
+    parser.add_argument('--sink', default='access', help='the kind of database: access, sqlite or postgresql')
+    parser.add_argument('--table', default=None, help='the table to write the rows into')
+    parser.add_argument('--import-mode', default='insert', help='how rows already in the table are handled: '
+        'insert, delta or upsert')
+    parser.add_argument('--bulk-threshold', type=int, default=0, help='load files with at least this many records '
+        'through a staged file. 0 always inserts in batches')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='the number of parser processes. '
+        'Defaults to the number of cores')
+    parser.add_argument('--history', default='imports.sqlite', help='the import history used to skip files that '
+        'were already imported. The journal is kept here too')
+    parser.add_argument('--journal', action='store_true', help='commit every batch and carry on from the last one '
+        'when a file is imported again after being interrupted')
+    parser.add_argument('--recursive', action='store_true', help='also import the files in subdirectories')
+    parser.add_argument('--log-file', help='write the log to this file')
+    parser.add_argument('--log-level', default='WARNING', help='the lowest level written to the log')
+    parser.add_argument('--metrics', help='write the import timings to this JSON file')
+    return parser.parse_args(argv)
+
+
+def find_files(paths, extensions, recursive=False):
+    """List the files to import, in the order given. Directories are expanded to the files in them,
+    sorted by name so exports named by date are imported oldest first
+
+    Returns:
+        list: The file paths
+    """
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            files.extend(os.path.join(root, name) for name in sorted(names)
+                if os.path.splitext(name)[1].lower() in extensions)
+            if not recursive:
+                break
+    return files
+
+
+class Progress:
+    """Reports how far through the files the backfill is. On a terminal a single line is redrawn
+    after every file, otherwise a line is printed every PROGRESS_INTERVAL seconds"""
+
+    def __init__(self, total: int, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.interactive = stream.isatty()
+        self.started = time.perf_counter()
+        self.shown = 0
+        self.done = 0
+        self.rows = 0
+        self.bytes = 0
+        self.outcomes = {}
+
+    def update(self, outcome: str, rows, size):
+        self.done += 1
+        self.rows += rows or 0
+        self.bytes += size or 0
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+        now = time.perf_counter()
+        if self.interactive:
+            self.stream.write('\r' + self.describe(now))
+            self.stream.flush()
+            self.shown = now
+        elif now - self.shown >= PROGRESS_INTERVAL or self.done == self.total:
+            self.stream.write(self.describe(now) + '\n')
+            self.shown = now
+
+    def describe(self, now):
+        elapsed = now - self.started
+        rate = self.rows / elapsed if elapsed > 0 else 0
+        remaining = elapsed / self.done * (self.total - self.done) if self.done else 0
+        return "[{0:>{width}}/{1}] {2:5.1f}%  {3:,} records  {4:,.0f} records/sec  {5} left".format(
+            self.done, self.total, 100 * self.done / self.total if self.total else 100, self.rows, rate,
+            format_seconds(remaining), width=len(str(self.total)))
+
+    def finish(self):
+        """Print the totals and the overall throughput"""
+        elapsed = time.perf_counter() - self.started
+        if self.interactive and self.done:
+            self.stream.write('\n')
+        self.stream.write("Imported {0:,} records from {1} files in {2} ({3:,.0f} records/sec, {4:.1f} MiB/sec)\n".format(
+            self.rows, self.done, format_seconds(elapsed), self.rows / elapsed if elapsed > 0 else 0,
+            self.bytes / 2**20 / elapsed if elapsed > 0 else 0))
+        self.stream.write("Outcomes: {}\n".format(", ".join("{0} {1}".format(n, o) for o, n in sorted(self.outcomes.items()))))
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{0}:{1:02}:{2:02}".format(hours, minutes, seconds)
+
+
+def import_parsed(path, future, args, sink, pool, history, journal):
+    """Write one parsed file to the database
+
+    Returns:
+        ImportTimer: The timings of the import, with its outcome and the number of rows written
+    """
+    # Imported here so the command starts without loading the readers
+    from importer import Importer, TABLE_NAME
+    from exceptions import DuplicateFileException, FileFormatException
+    from metrics import ImportTimer
+
+    timer = ImportTimer(path)
+    importer = None
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = None
+
+    try:
+        with pool.connection(timer) as conn:
+            importer = Importer(args.database, path, connection=conn, table=args.table or TABLE_NAME,
+                history=history, mode=args.import_mode, timer=timer, bulk_threshold=args.bulk_threshold,
+                sink=sink, journal=journal)
+            importer.begin_import(future.result())
+        outcome = 'Imported'
+    except DuplicateFileException as e:
+        logger.info("Skipping '%s': %s", path, e.message)
+        outcome = 'Duplicate'
+    except FileFormatException as e:
+        logger.error("Unable to import '%s': %s", path, e.message)
+        outcome = 'Error'
+    except sink.errors as e:
+        logger.error("Unable to import '%s': %s", path, e)
+        outcome = 'Error'
+    except Exception as e:
+        logger.error("Unable to import '%s' for an unknown reason", path)
+        logger.exception(e)
+        outcome = 'Error'
+
+    rows = importer.rows_written if importer is not None and outcome == 'Imported' else None
+    if outcome in ('Imported', 'Error') and importer is not None and importer.digest is not None:
+        # Recorded the same way as the service records the files it archives, so neither imports them again
+        history.record(importer.digest, path, 'Archived' if outcome == 'Imported' else outcome, rows)
+    timer.finish(outcome, rows, size)
+    return timer
+
+
+def run(args):
+    """Import every file given on the command line
+
+    Returns:
+        int: The exit status. 1 if any file could not be imported
+    """
+    from importer import IMPORT_MODES
+    from readers import IMPORT_FILE_TYPES
+    from sinks import make_sink
+    from history import ImportHistory
+    from journal import ImportJournal
+    from metrics import Metrics
+    from pipeline import ParserPool, PARSE_AHEAD
+
+    if args.import_mode not in IMPORT_MODES:
+        logger.error("Unknown import mode '%s'. Choose one of %s", args.import_mode, IMPORT_MODES)
+        return 2
+    try:
+        sink = make_sink(args.sink, args.database)
+    except ValueError as e:
+        logger.error(e)
+        return 2
+    problem = sink.check_driver() or sink.check_database()
+    if problem is not None:
+        logger.error(problem)
+        return 2
+
+    files = find_files(args.paths, IMPORT_FILE_TYPES, args.recursive)
+    if not files:
+        logger.error("No files to import")
+        return 2
+
+    history = ImportHistory(args.history)
+    journal = ImportJournal(args.history) if args.journal else None
+    metrics = Metrics(args.metrics)
+    progress = Progress(len(files))
+
+    pool = sink.pool(size=1)
+    parsers = ParserPool(max(1, args.workers), logging.getLogger().handlers[0])
+    try:
+        # Keep a few files parsed ahead of the writer for each process. Parsed files are written in the
+        # order they were given
+        ahead = max(1, args.workers) * PARSE_AHEAD
+        queued = [(path, parsers.submit(path, history)) for path in files[:ahead]]
+        waiting = iter(files[ahead:])
+        while queued:
+            path, future = queued.pop(0)
+            following = next(waiting, None)
+            if following is not None:
+                queued.append((following, parsers.submit(following, history)))
+
+            timer = import_parsed(path, future, args, sink, pool, history, journal)
+            metrics.record(timer)
+            progress.update(timer.outcome, timer.rows, timer.bytes)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted. Files not yet imported are imported when the backfill is run again")
+        for path, future in queued:
+            future.cancel()
+        return 130
+    finally:
+        parsers.close()
+        pool.close()
+        progress.finish()
+
+    return 1 if progress.outcomes.get('Error') else 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    handler = logging.FileHandler(args.log_file, encoding='utf-8') if args.log_file else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    # The records of the parser processes go straight to the handler, so it filters them too
+    handler.setLevel(args.log_level.upper())
+    root = logging.getLogger()
+    root.setLevel(args.log_level.upper())
+    root.addHandler(handler)
+
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
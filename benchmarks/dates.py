@@ -0,0 +1,41 @@
+"""Compare the per-cell date conversion against the column-wise conversion used by the xls reader
+
+Usage: python benchmarks/dates.py [number of rows]
+"""
+import os, sys, random, timeit
+import xlrd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from readers import xldates_as_datetimes
+
+REPEAT = 5
+
+
+def per_cell(values, datemode):
+    """The conversion the Importer used to do for every row"""
+    datetimes = []
+    strings = []
+    for v in values:
+        dt = xlrd.xldate_as_datetime(v, datemode)
+        datetimes.append(dt)
+        strings.append(dt.date().isoformat())
+    return datetimes, strings
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    # Whole days plus a time of day, roughly the years 2000 to 2030
+    values = [random.randint(36526, 47484) + random.random() for _ in range(rows)]
+
+    if per_cell(values, 0) != xldates_as_datetimes(values, 0):
+        print("Column-wise conversion does not match the per-cell conversion")
+        sys.exit(1)
+
+    for name, func in (('per-cell', per_cell), ('column-wise', xldates_as_datetimes)):
+        best = min(timeit.repeat(lambda: func(values, 0), number=1, repeat=REPEAT))
+        print("{0:<12} {1:>8.1f} ms  {2:>12,.0f} dates/sec".format(name, best * 1000, rows / best))
+
+
+if __name__ == '__main__':
+    main()
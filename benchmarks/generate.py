@@ -0,0 +1,110 @@
+"""Write synthetic shipment exports in the layout the Importer expects: a title row, a header row,
+the data rows and a footer row on a sheet named Page1_2
+
+Usage: python benchmarks/generate.py output.xlsx [number of rows]
+"""
+import csv, datetime, os, random, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from readers import ROW_HEADERS, SHEET_NAME
+
+TITLE = 'Weekly Tracked Pallets Shipped'
+CONTAINER_TYPES = ['CP', 'PL', 'TO', 'CR']
+CITIES = [('PENSACOLA', 'FL', '32501'), ('JACKSONVILLE', 'FL', '32212'), ('MOBILE', 'AL', '36602'),
+    ('SAVANNAH', 'GA', '31401'), ('TALLAHASSEE', 'FL', '32301')]
+
+
+def make_rows(count, dc=7, start=None, seed=None):
+    """Build the data rows. Every row has a unique (DC, store, date, container type) key
+
+    Args:
+        count (int): The number of rows
+        dc (int): The DC Id written on every row
+        start (datetime.date): The first transaction date. The rows cover the week starting on this date
+        seed: Seed for the random container counts
+
+    Returns:
+        list: The cell values of each row, in ROW_HEADERS order
+    """
+    rand = random.Random(seed)
+    start = start or datetime.date(2020, 6, 14)
+    rows = []
+    for i in range(count):
+        store, rest = divmod(i, 7 * len(CONTAINER_TYPES))
+        day, container = divmod(rest, len(CONTAINER_TYPES))
+        city, state, zip_code = CITIES[store % len(CITIES)]
+        rows.append([
+            float(dc),
+            'MDV - {}'.format(CITIES[dc % len(CITIES)][0].title()),
+            str(1000 + store),
+            'STORE {}'.format(1000 + store),
+            '{} MAIN ST'.format(100 + store),
+            city,
+            state,
+            zip_code + '0042',
+            datetime.datetime.combine(start + datetime.timedelta(days=day), datetime.time()),
+            CONTAINER_TYPES[container],
+            float(rand.randint(1, 60)),
+        ])
+    return rows
+
+
+def generate(path, count, dc=7, start=None, seed=None):
+    """Write a synthetic export. The format is picked from the extension: .xlsx, .xls or .csv.
+    Writing .xls files needs the xlwt package
+
+    Args:
+        path (str): The file to write
+        count (int): The number of data rows
+        dc (int): The DC Id written on every row
+        start (datetime.date): The first transaction date
+        seed: Seed for the random container counts
+    """
+    rows = make_rows(count, dc, start, seed)
+    footer = ['Total', '', '', '', '', '', '', '', '', '', sum(r[-1] for r in rows)]
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.xlsx':
+        import openpyxl
+        book = openpyxl.Workbook(write_only=True)
+        sheet = book.create_sheet(SHEET_NAME)
+        sheet.append([TITLE])
+        sheet.append(ROW_HEADERS)
+        for row in rows:
+            sheet.append(row)
+        sheet.append(footer)
+        book.save(path)
+    elif extension == '.xls':
+        import xlwt
+        book = xlwt.Workbook()
+        sheet = book.add_sheet(SHEET_NAME)
+        date_style = xlwt.easyxf(num_format_str='M/D/YYYY')
+        sheet.write(0, 0, TITLE)
+        for col, header in enumerate(ROW_HEADERS):
+            sheet.write(1, col, header)
+        for r, row in enumerate(rows, start=2):
+            for col, value in enumerate(row):
+                if isinstance(value, datetime.datetime):
+                    sheet.write(r, col, value, date_style)
+                else:
+                    sheet.write(r, col, value)
+        for col, value in enumerate(footer):
+            sheet.write(len(rows) + 2, col, value)
+        book.save(path)
+    elif extension == '.csv':
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow([TITLE])
+            writer.writerow(ROW_HEADERS)
+            for row in rows:
+                writer.writerow([v.strftime('%m/%d/%Y') if isinstance(v, datetime.datetime) else v for v in row])
+            writer.writerow(footer)
+    else:
+        raise ValueError("Unknown export format '{}'".format(extension))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    generate(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
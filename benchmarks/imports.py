@@ -0,0 +1,169 @@
+"""Measure import throughput against a local SQLite database standing in for Access.
+
+Synthetic exports are generated for each requested size and timed through three paths:
+  import_data  reading and converting the rows
+  insert_rows  writing rows that were already read
+  import_file  the whole service path: permission check, history, read, write and archive move
+Peak memory of each path is measured separately with tracemalloc, since tracing slows the timed runs.
+
+The Windows only modules are replaced with empty stand-ins so this runs on any platform.
+
+Usage: python benchmarks/imports.py [--rows 1000 10000] [--format xlsx] [--repeat 3] [--output results.json]
+"""
+import argparse, datetime, json, logging, os, platform, shutil, sqlite3, sys, tempfile, time, tracemalloc, types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+from generate import generate
+from windows import stand_in_windows_modules
+
+TABLE_SQL = ("CREATE TABLE [WeeklyShipments] ([DC ID] REAL, [DC Name] TEXT, [Store ID] TEXT, [Store Name] TEXT, "
+    "[Address] TEXT, [City] TEXT, [State] TEXT, [Zip] TEXT, [Transaction Date] TIMESTAMP, [Container Type] TEXT, "
+    "[Container Qty] REAL, PRIMARY KEY ([DC ID], [Store ID], [Transaction Date], [Container Type]))")
+
+
+def create_database(path):
+    """Create an empty SQLite database with the WeeklyShipments table"""
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(TABLE_SQL)
+    conn.commit()
+    return conn
+
+
+def measure(func, repeat):
+    """Time func over several runs then run it once more under tracemalloc
+
+    Returns:
+        dict: The best and mean run times in seconds and the peak traced memory in bytes
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'best_seconds': min(times), 'mean_seconds': sum(times) / len(times), 'peak_bytes': peak}
+
+
+def run(rows, fmt, repeat, workdir):
+    """Benchmark each import path for one export size
+
+    Returns:
+        dict: The results for each path
+    """
+    import watcher
+    from retry import RetryScheduler
+    from ingest import IngestQueue
+    from fingerprint import Fingerprinter
+    from archive import Archiver
+    from priority import Staleness
+    from routes import Route
+    from history import ImportHistory
+    from metrics import Metrics
+    from importer import Importer
+    from sinks import SQLiteSink
+
+    source = os.path.join(workdir, 'export-{0}.{1}'.format(rows, fmt))
+    generate(source, rows, seed=rows)
+    size = os.path.getsize(source)
+    db_path = os.path.join(workdir, 'bench.sqlite')
+    results = {'rows': rows, 'format': fmt, 'file_bytes': size}
+
+    def import_data():
+        return list(Importer(None, source).import_data())
+
+    parsed = import_data()
+
+    def insert_rows():
+        conn = create_database(db_path)
+        try:
+            Importer(db_path, source, connection=conn, sink=SQLiteSink(db_path)).insert_rows(parsed)
+        finally:
+            conn.close()
+
+    watch = os.path.join(workdir, 'watch')
+    for d in ('watch', 'archive', 'errors'):
+        os.makedirs(os.path.join(workdir, d), exist_ok=True)
+    route = Route('bench', watch, db_path, os.path.join(workdir, 'archive'), os.path.join(workdir, 'errors'),
+        sink='sqlite')
+    watcher.opts.import_mode = 'insert'
+    watcher.opts.bulk_threshold = 0
+
+    def import_file():
+        create_database(db_path).close()
+        history_path = os.path.join(workdir, 'imports.sqlite')
+        if os.path.exists(history_path):
+            os.remove(history_path)
+        service = types.SimpleNamespace(
+            history=ImportHistory(history_path),
+            journal=None,
+            cache=None,
+            retries=RetryScheduler(),
+            ingest=IngestQueue(),
+            fingerprints=Fingerprinter(),
+            archiver=Archiver(history_path),
+            staleness=Staleness(),
+            metrics=Metrics(None))
+        route.pool = route.sink.pool()
+        route.pipeline = types.SimpleNamespace(depth=lambda: 0, waiting=lambda: [])
+        target = os.path.join(watch, os.path.basename(source))
+        shutil.copy(source, target)
+        try:
+            watcher.import_file(target, service, route)
+        finally:
+            route.pool.close()
+            service.archiver.close()
+        if os.path.exists(target) or os.listdir(route.errors):
+            raise RuntimeError("Import of '{}' did not complete".format(target))
+
+    for name, func in (('import_data', import_data), ('insert_rows', insert_rows), ('import_file', import_file)):
+        result = measure(func, repeat)
+        result['rows_per_second'] = rows / result['best_seconds']
+        result['bytes_per_second'] = size / result['best_seconds']
+        results[name] = result
+        print("{0:>8} rows  {1:<12} {2:>9.3f} s  {3:>10,.0f} rows/sec  {4:>8.1f} MiB peak".format(
+            rows, name, result['best_seconds'], result['rows_per_second'], result['peak_bytes'] / 2**20))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000], help='the export sizes to test')
+    parser.add_argument('--format', choices=['xlsx', 'xls', 'csv'], default='xlsx', help='the export format')
+    parser.add_argument('--repeat', type=int, default=3, help='the number of timed runs of each path')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    stand_in_windows_modules()
+    # The import paths log every file, keep that out of the timings
+    logging.disable(logging.WARNING)
+
+    workdir = tempfile.mkdtemp(prefix='import-bench-')
+    try:
+        report = {
+            'started': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'results': [run(rows, args.format, args.repeat, workdir) for rows in args.rows],
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print("Results written to '{}'".format(args.output))
+
+
+if __name__ == '__main__':
+    main()
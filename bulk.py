@@ -0,0 +1,61 @@
+import csv, datetime, logging, os, shutil, tempfile
+
+from readers import ROW_HEADERS
+
+#The name of the staged file. The Access text driver refers to it as [rows#csv]
+STAGED_FILE = 'rows.csv'
+
+#The Access text driver type of each staged column, in ROW_HEADERS order
+SCHEMA_TYPES = ['Double', 'Text', 'Text', 'Text', 'Text', 'Text', 'Text', 'Text', 'DateTime', 'Text', 'Double']
+
+logger = logging.getLogger('bulk')
+
+
+class StagedRows:
+    """Rows written to a temporary delimited file in table column order so a Sink can load them
+    with its bulk path. Use as a context manager, the file is removed on exit.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.name = STAGED_FILE
+        self.path = None
+        self.file = None
+        self.writer = None
+        self.count = 0
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp(prefix='import-')
+        self.path = os.path.join(self.directory, STAGED_FILE)
+        self.write_schema()
+        self.file = open(self.path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(ROW_HEADERS)
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None and not self.file.closed:
+            self.file.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write_schema(self):
+        """Write the schema.ini the Access text driver uses to type the staged columns"""
+        with open(os.path.join(self.directory, 'schema.ini'), 'w', encoding='utf-8') as f:
+            f.write("[{}]\n".format(STAGED_FILE))
+            f.write("ColNameHeader=True\nFormat=CSVDelimited\nCharacterSet=65001\n")
+            f.write("DateTimeFormat=yyyy-mm-dd hh:nn:ss\n")
+            for i, (name, kind) in enumerate(zip(ROW_HEADERS, SCHEMA_TYPES), start=1):
+                f.write('Col{0}="{1}" {2}\n'.format(i, name, kind))
+
+    def write(self, rows):
+        """Add rows to the staged file"""
+        for row in rows:
+            self.writer.writerow([
+                v.strftime('%Y-%m-%d %H:%M:%S') if isinstance(v, datetime.datetime) else v
+                for v in row
+            ])
+        self.count += len(rows)
+
+    def close(self):
+        """Finish writing the staged file"""
+        self.file.close()
@@ -0,0 +1,197 @@
+import datetime, json, logging, os, shutil, tempfile
+
+import numpy
+
+from readers import Row
+
+#The largest total size of the cached files in bytes. The least recently used files are removed past this
+CACHE_SIZE = 256 * 1024 * 1024
+
+#The number of rows converted back from the arrays at a time when reading from the cache
+CHUNK_SIZE = 1000
+
+#The tag stored for each value of a column holding more than one type
+KIND_NONE, KIND_FLOAT, KIND_STR, KIND_DATE = range(4)
+
+logger = logging.getLogger('cache')
+
+
+class RowCache:
+    """Keeps the rows parsed from a file on disk, keyed by the SHA-1 of the file contents, so a file
+    that is attempted again after a database error does not have to be parsed again.
+    Each field is stored as a column of NumPy .npy arrays that are memory mapped when they are read
+    back. Because entries are keyed by the contents, a file that changes never matches its old entry.
+    The directory is kept under max_bytes by removing the least recently used entries.
+    """
+
+    def __init__(self, directory: str, max_bytes=CACHE_SIZE):
+        """
+        Args:
+            directory (str): The directory the cached files are kept in. It will be created if it does not exist
+            max_bytes (int): The largest total size of the cache
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def entry(self, sha1):
+        return os.path.join(self.directory, sha1)
+
+    def get(self, sha1: str):
+        """Find the rows of a file
+
+        Args:
+            sha1 (str): The hex digest of the file contents
+
+        Returns:
+            tuple: The number of rows, the date range of the file and an iterator over the rows. None if the
+                file is not in the cache
+        """
+        path = self.entry(sha1)
+        try:
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+            columns = [
+                {part: numpy.load(os.path.join(path, "{0}.{1}.npy".format(field, part)), mmap_mode='r')
+                    for part in meta['columns'][field]}
+                for field in Row._fields
+            ]
+            # Mark the entry as recently used
+            os.utime(path)
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.exists(path):
+                logger.warning("Discarding unreadable cache entry '%s': %s", path, e)
+                self.discard(sha1)
+            return None
+
+        date_range = tuple(meta['date_range']) if meta['date_range'] is not None else None
+        return meta['rows'], date_range, self.rows(meta['rows'], columns)
+
+    def dates(self, sha1: str):
+        """Find the date range of a cached file without loading its rows
+
+        Returns:
+            tuple: The first and last transaction dates as ISO date strings, or None if the file is not cached
+        """
+        try:
+            with open(os.path.join(self.entry(sha1), 'meta.json'), encoding='utf-8') as f:
+                date_range = json.load(f)['date_range']
+        except (OSError, ValueError, KeyError):
+            return None
+        return tuple(date_range) if date_range is not None else None
+
+    def rows(self, count, columns):
+        for start in range(0, count, CHUNK_SIZE):
+            stop = min(count, start + CHUNK_SIZE)
+            yield from map(Row._make, zip(*(decode_column(c, start, stop) for c in columns)))
+
+    def put(self, sha1: str, rows, date_range):
+        """Store the rows of a file
+
+        Args:
+            sha1 (str): The hex digest of the file contents
+            rows (list): Every Row read from the file
+            date_range (tuple): The first and last transaction dates in the file as ISO date strings
+
+        Returns:
+            bool: True if the rows were stored
+        """
+        if self.max_bytes <= 0:
+            return False
+
+        temp = tempfile.mkdtemp(prefix='.' + sha1, dir=self.directory)
+        try:
+            meta = {
+                'rows': len(rows),
+                'date_range': list(date_range) if date_range is not None else None,
+                'columns': {},
+            }
+            for i, field in enumerate(Row._fields):
+                arrays = encode_column([r[i] for r in rows])
+                if arrays is None:
+                    logger.debug("Not caching '%s', the %s column holds a value that can not be stored", sha1, field)
+                    return False
+                for part, array in arrays.items():
+                    numpy.save(os.path.join(temp, "{0}.{1}.npy".format(field, part)), array, allow_pickle=False)
+                meta['columns'][field] = list(arrays)
+            with open(os.path.join(temp, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+            # The entry only appears once it is complete
+            self.discard(sha1)
+            os.replace(temp, self.entry(sha1))
+            temp = None
+        except OSError as e:
+            logger.warning("Unable to cache the rows of '%s': %s", sha1, e)
+            return False
+        finally:
+            if temp is not None:
+                shutil.rmtree(temp, ignore_errors=True)
+
+        logger.info("Cached %s records for %s", len(rows), sha1)
+        self.evict()
+        return True
+
+    def discard(self, sha1: str):
+        """Remove a file from the cache"""
+        shutil.rmtree(self.entry(sha1), ignore_errors=True)
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_dir() or entry.name.startswith('.'):
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                    entries.append((entry.stat().st_mtime, size, entry.name))
+                except OSError:
+                    continue
+                total += size
+
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logger.debug("Evicting cache entry %s", name)
+            self.discard(name)
+            total -= size
+
+
+def encode_column(values):
+    """Convert a column of values to NumPy arrays. A column holding a single type is stored as one
+    array of that type. A column that mixes types is stored as a tag for each value plus one array
+    for each type
+
+    Returns:
+        dict: The arrays keyed by their part name, or None if the column holds a type that can't be stored
+    """
+    kinds = set(map(type, values))
+    if kinds <= {float}:
+        return {'f': numpy.array(values, dtype=numpy.float64)}
+    if kinds == {str}:
+        return {'s': numpy.array(values, dtype=numpy.str_)}
+    if kinds == {datetime.datetime}:
+        return {'d': numpy.array(values, dtype='datetime64[us]')}
+    if not kinds <= {type(None), float, str, datetime.datetime}:
+        return None
+
+    tags = {type(None): KIND_NONE, float: KIND_FLOAT, str: KIND_STR, datetime.datetime: KIND_DATE}
+    return {
+        'k': numpy.array([tags[type(v)] for v in values], dtype=numpy.uint8),
+        'f': numpy.array([v if type(v) is float else 0.0 for v in values], dtype=numpy.float64),
+        's': numpy.array([v if type(v) is str else '' for v in values], dtype=numpy.str_),
+        'd': numpy.array([v if type(v) is datetime.datetime else None for v in values], dtype='datetime64[us]'),
+    }
+
+
+def decode_column(arrays, start, stop):
+    """Convert a slice of a column stored by encode_column() back to Python values"""
+    if 'k' not in arrays:
+        (array,) = arrays.values()
+        return array[start:stop].tolist()
+
+    parts = {KIND_FLOAT: arrays['f'][start:stop].tolist(), KIND_STR: arrays['s'][start:stop].tolist(),
+        KIND_DATE: arrays['d'][start:stop].tolist()}
+    return [None if k == KIND_NONE else parts[k][i] for i, k in enumerate(arrays['k'][start:stop].tolist())]
@@ -0,0 +1,166 @@
+import logging, os, threading
+
+#Set to the path of a settings file to read the settings from it instead of the Windows registry
+CONFIG_ENV = 'CONTAINER_TRACKING_CONFIG'
+
+#Environment variables named with this prefix and the option name override the settings file, i.e.
+#CONTAINER_TRACKING_DATABASE. A double underscore stands for the dot in route options, i.e. CONTAINER_TRACKING_DC7__WATCH
+ENV_PREFIX = 'CONTAINER_TRACKING_'
+
+logger = logging.getLogger('config')
+
+
+class RegistrySource:
+    """The settings stored under HKLM\\SOFTWARE\\ContainerTracking. Every value is read in one pass and
+    the key's last write time tells when any of them changed"""
+
+    def __repr__(self):
+        from registry import REGISTRY_KEY_NAME
+        return "HKEY_LOCAL_MACHINE\\{}".format(REGISTRY_KEY_NAME)
+
+    def prepare(self):
+        """Fill in the settings that have not been set yet, so they can be found and changed in regedit"""
+        from registry import Registry
+        Registry.write_default_opts()
+
+    def stamp(self):
+        from registry import Registry
+        return Registry.modified()
+
+    def load(self):
+        from registry import Registry
+        return Registry.read_all()
+
+    def write_default(self, name: str, value: str):
+        from registry import Registry
+        Registry.write_default(name, value)
+
+
+class FileSource:
+    """Settings read from a file of 'name = value' lines, overridden by ENV_PREFIX environment variables.
+    Stands in for the registry on machines without one. Blank lines and lines starting with # or ; are ignored
+    """
+
+    def __init__(self, path: str, environ=None):
+        """
+        Args:
+            path (str): The settings file. A missing file has no settings in it
+            environ (dict): The environment variables. Defaults to os.environ
+        """
+        self.path = path
+        self.environ = environ if environ is not None else os.environ
+
+    def __repr__(self):
+        return "'{}'".format(self.path)
+
+    def prepare(self):
+        pass
+
+    def overrides(self):
+        """The settings given in environment variables"""
+        return {
+            key[len(ENV_PREFIX):].lower().replace('__', '.'): value
+            for key, value in self.environ.items()
+            if key.startswith(ENV_PREFIX) and key != CONFIG_ENV
+        }
+
+    def stamp(self):
+        try:
+            st = os.stat(self.path)
+            changed = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            changed = None
+        return (changed, tuple(sorted(self.overrides().items())))
+
+    def load(self):
+        values = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for number, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line or line[0] in '#;':
+                        continue
+                    name, sep, value = line.partition('=')
+                    if not sep:
+                        logger.warning("Ignoring line %s of '%s', it is not a 'name = value' setting", number, self.path)
+                        continue
+                    values[name.strip()] = value.strip()
+        except FileNotFoundError:
+            logger.warning("The settings file '%s' does not exist, using the defaults", self.path)
+        values.update(self.overrides())
+        return values
+
+    def write_default(self, name: str, value: str):
+        # The file belongs to whoever wrote it, the defaults are only used in memory
+        pass
+
+
+class Config:
+    """An in-memory snapshot of the service settings. Reading a setting never touches the source, and
+    reload() swaps in a new snapshot in one step when the source has changed, so a reader sees either
+    every old value or every new one.
+    """
+
+    def __init__(self, source):
+        """
+        Args:
+            source: Where the settings are read from, a RegistrySource or FileSource
+        """
+        self.source = source
+        self.lock = threading.Lock()
+        self.values = {}
+        self.last_stamp = None
+
+        #The settings whose default has already been written back to the source
+        self.written = set()
+
+        self.source.prepare()
+        self.reload()
+
+    @staticmethod
+    def from_environment():
+        """Read the settings from the file named by CONFIG_ENV if it is set, otherwise from the registry"""
+        path = os.environ.get(CONFIG_ENV)
+        return Config(FileSource(path) if path else RegistrySource())
+
+    def read_key(self, name: str, def_val):
+        """Read a setting from the snapshot
+
+        Args:
+            name (str): The name of the setting
+            def_val (str): The value to use if the setting has not been set. It is written back to the source
+                the first time, so it can be found and changed there
+
+        Returns:
+            str: The value of the setting or def_val
+        """
+        with self.lock:
+            values = self.values
+        if name in values:
+            return values[name]
+        if def_val is not None and name not in self.written:
+            self.written.add(name)
+            try:
+                self.source.write_default(name, def_val)
+            except Exception as e:
+                logger.warning("Unable to write the default value of '%s': %s", name, e)
+        return def_val
+
+    def reload(self):
+        """Read the settings again if the source has changed since they were last read
+
+        Returns:
+            bool: True if any setting changed
+        """
+        stamp = self.source.stamp()
+        if stamp is not None and stamp == self.last_stamp:
+            return False
+
+        values = self.source.load()
+        with self.lock:
+            changed = values != self.values
+            self.values = values
+            self.last_stamp = stamp
+        if changed:
+            logger.info("Read %s settings from %s", len(values), self.source)
+        return changed
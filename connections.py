@@ -0,0 +1,139 @@
+import logging, queue, threading
+from contextlib import contextmanager
+
+#The number of idle connections kept open by default
+POOL_SIZE = 2
+
+logger = logging.getLogger('connections')
+
+
+class ConnectionPool:
+    """Keeps a small number of database connections open between imports.
+    Opening a connection to an Access database is expensive since the driver has to lock the file
+    and build the .laccdb lock file. Connections are checked before they are handed out and
+    replaced if they have gone bad.
+    """
+
+    def __init__(self, connect, size=POOL_SIZE, health_check="SELECT 1", is_connection_error=None):
+        """
+        Args:
+            connect: A callable that opens and returns a new DB-API connection
+            size (int): The maximum number of idle connections to keep open
+            health_check (str): A cheap statement used to check an idle connection before it is reused
+            is_connection_error: Called with an exception raised while a connection was borrowed. A
+                connection is thrown away instead of being reused when this returns True. If None the
+                connection is always reused
+        """
+        self.connect = connect
+        self.size = size
+        self.health_check = health_check
+        self.is_connection_error = is_connection_error
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def warm(self):
+        """Open a connection ahead of the first import. Failures are logged but otherwise ignored,
+        the connection will be retried when it is first needed"""
+        try:
+            self.release(self.acquire())
+        except Exception as e:
+            logger.warning("Unable to open a connection to the database: %s", e)
+
+    def acquire(self):
+        """Get an open connection, reusing an idle connection if a healthy one is available
+
+        Returns:
+            A DB-API connection. Return it with release() or discard() when finished
+        """
+        if self.closed:
+            raise RuntimeError("Connection pool has been closed")
+
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            if self.is_healthy(conn):
+                return conn
+            logger.info("Discarding stale database connection")
+            self.close_connection(conn)
+
+        logger.info("Opening new database connection")
+        return self.connect()
+
+    def release(self, conn):
+        """Return a connection to the pool. Any uncommitted work is rolled back"""
+        with self.lock:
+            keep = not self.closed and self.idle.qsize() < self.size
+            if keep:
+                try:
+                    conn.rollback()
+                except Exception as e:
+                    logger.info("Discarding database connection that could not be rolled back: %s", e)
+                    keep = False
+            if keep:
+                self.idle.put(conn)
+                return
+        self.close_connection(conn)
+
+    def discard(self, conn):
+        """Close a connection that should not be reused"""
+        self.close_connection(conn)
+
+    @contextmanager
+    def connection(self, timer=None):
+        """Borrow a connection for the length of a with block.
+        The connection is thrown away if the block fails because the connection was lost
+
+        Args:
+            timer (ImportTimer): Records how long it took to get the connection
+        """
+        if timer is not None:
+            with timer.stage('connect'):
+                conn = self.acquire()
+        else:
+            conn = self.acquire()
+        try:
+            yield conn
+        except Exception as e:
+            if self.is_connection_error is not None and self.is_connection_error(e):
+                logger.warning("Lost connection to the database, it will be reopened for the next import")
+                self.discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self.release(conn)
+
+    def is_healthy(self, conn):
+        """Run the health check statement against a connection"""
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self.health_check)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception as e:
+            logger.debug("Connection failed health check: %s", e)
+            return False
+
+    def close(self):
+        """Close every idle connection. Connections still in use are closed when they are released"""
+        with self.lock:
+            self.closed = True
+        while True:
+            try:
+                self.close_connection(self.idle.get_nowait())
+            except queue.Empty:
+                break
+        logger.info("Closed database connections")
+
+    @staticmethod
+    def close_connection(conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug("Error closing connection: %s", e)
@@ -7,4 +7,16 @@ class FileFormatException(Exception):
     """Raised when the import file is the wrong format"""
     
     def __init__(self, message=""):
-        self.message = message
\ No newline at end of file
+        self.message = message
+
+class DuplicateFileException(Exception):
+    """Raised when the contents of the import file have already been imported"""
+
+    def __init__(self, message=""):
+        self.message = message
+
+class ConfigurationException(Exception):
+    """Raised when the service can not work with the settings it was given"""
+
+    def __init__(self, message=""):
+        self.message = message
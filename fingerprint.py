@@ -0,0 +1,94 @@
+import hashlib, logging, mmap, os, threading
+from collections import OrderedDict
+
+#The size of the buffer used to hash files that can't be memory mapped
+BUFFER_SIZE = 1024 * 1024
+
+#The number of files whose digest is remembered
+CAPACITY = 4096
+
+logger = logging.getLogger('fingerprint')
+
+#Each thread hashes the files that can't be memory mapped through its own buffer, allocated once
+local = threading.local()
+
+
+def stat_key(st: os.stat_result):
+    """The cheap fingerprint of a file. If the size, modification time and inode are all unchanged the
+    contents are assumed to be unchanged too"""
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+class Fingerprinter:
+    """Remembers the SHA-1 of each file against its stat_key(), so a file that has not changed since it
+    was last hashed is not read again. Safe to share between threads.
+    """
+
+    def __init__(self, capacity=CAPACITY):
+        """
+        Args:
+            capacity (int): The number of files to remember. The least recently used are forgotten first
+        """
+        self.capacity = capacity
+        self.digests = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, path: str, key):
+        """Find the digest of a file that has not changed since it was hashed
+
+        Args:
+            path (str): The file
+            key (tuple): The current stat_key() of the file
+
+        Returns:
+            str: The hex digest, or None if the file has not been hashed or has changed since
+        """
+        path = os.path.normcase(os.path.abspath(path))
+        with self.lock:
+            entry = self.digests.get(path)
+            if entry is None or entry[0] != key:
+                return None
+            self.digests.move_to_end(path)
+            return entry[1]
+
+    def remember(self, path: str, key, digest: str):
+        """Record the digest of a file as of its stat_key()"""
+        path = os.path.normcase(os.path.abspath(path))
+        with self.lock:
+            self.digests[path] = (key, digest)
+            self.digests.move_to_end(path)
+            while len(self.digests) > self.capacity:
+                self.digests.popitem(last=False)
+
+
+def hash_file(path: str):
+    """Hash a file without reading it into memory. The file is memory mapped so the whole file is
+    hashed in a single call. Files that can't be mapped, i.e. some network shares, are read through
+    a reused buffer instead
+
+    Returns:
+        str: The hex digest of the file contents
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    sha1.update(m)
+            return sha1.hexdigest()
+        except (OSError, ValueError) as e:
+            logger.debug("Unable to map '%s', reading it instead: %s", path, e)
+            sha1 = hashlib.sha1()
+            f.seek(0)
+
+        buffer = getattr(local, 'buffer', None)
+        if buffer is None:
+            buffer = local.buffer = bytearray(BUFFER_SIZE)
+        view = memoryview(buffer)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            sha1.update(view[:n])
+    return sha1.hexdigest()
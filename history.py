@@ -0,0 +1,62 @@
+import logging, sqlite3, time
+from collections import namedtuple
+from contextlib import closing
+
+logger = logging.getLogger('history')
+
+#A previous import of a file with the same contents
+HistoryEntry = namedtuple('HistoryEntry', ['sha1', 'filename', 'outcome', 'rows', 'imported'])
+
+
+class ImportHistory:
+    """A local SQLite index of every file the service has tried to import, keyed by the SHA-1 of
+    the file contents. Used to reject files that were already imported before they are parsed.
+    A new SQLite connection is opened for every call so the history can be shared between threads
+    and the parser processes.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): The SQLite database file. It will be created if it does not exist
+        """
+        self.path = path
+        with closing(self.connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS imports ("
+                "sha1 TEXT PRIMARY KEY, filename TEXT NOT NULL, outcome TEXT NOT NULL, "
+                "rows INTEGER, imported TEXT NOT NULL)")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def lookup(self, sha1: str):
+        """Find the previous import of a file
+
+        Args:
+            sha1 (str): The hex digest of the file contents
+
+        Returns:
+            HistoryEntry: The last recorded import of the file or None if it has not been seen before
+        """
+        with closing(self.connect()) as conn:
+            row = conn.execute("SELECT sha1, filename, outcome, rows, imported FROM imports WHERE sha1 = ?",
+                (sha1,)).fetchone()
+        return HistoryEntry._make(row) if row is not None else None
+
+    def record(self, sha1: str, filename: str, outcome: str, rows):
+        """Record the outcome of an import, replacing any earlier outcome for the same contents
+
+        Args:
+            sha1 (str): The hex digest of the file contents
+            filename (str): The path the file was imported from
+            outcome (str): 'Archived' or 'Error'
+            rows (int): The number of rows written, or None if the import failed
+        """
+        imported = time.strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            with closing(self.connect()) as conn, conn:
+                conn.execute("INSERT OR REPLACE INTO imports (sha1, filename, outcome, rows, imported) "
+                    "VALUES (?, ?, ?, ?, ?)", (sha1, filename, outcome, rows, imported))
+        except sqlite3.Error as e:
+            # Losing a history entry only costs us the early duplicate check, don't fail the import over it
+            logger.error("Unable to record import of '%s' in '%s': %s", filename, self.path, e)
@@ -1,9 +1,13 @@
 import csv, time, json, logging, traceback, os, datetime
-import xlrd
-from xlrd import open_workbook
-from exceptions import ImportException, FileFormatException
+from collections import namedtuple
+from itertools import islice, chain
+from exceptions import ImportException, FileFormatException, DuplicateFileException
+from sinks import AccessSink
+from fingerprint import stat_key, hash_file
+from readers import open_reader
+from metrics import ImportTimer
+from bulk import StagedRows
 
-import pyodbc
 import hashlib
 
 #The path to the access database file
@@ -13,100 +17,636 @@ TABLE_NAME = "WeeklyShipments"
 #The imported data will be considered stale after 4 days
 MAX_AGE_MS = 1000 * 60 * 60 * 24 * 4
 
+#The number of rows sent to the database with each executemany() call
+BATCH_SIZE = 1000
+
+INSERT_SQL = ("INSERT INTO [{0}] ([DC ID], [DC Name], [Store ID], [Store Name], [Address], [City], [State],"
+    "[Zip], [Transaction Date], [Container Type], [Container Qty]) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+#Files with at least this many rows are staged to a delimited file and loaded with a single statement.
+#0 turns the bulk load off
+BULK_THRESHOLD = 0
+
+#Used in delta mode to find the rows already in the table for a DC and range of transaction dates
+EXISTING_SQL = ("SELECT [DC ID], [Store ID], [Transaction Date], [Container Type], [Container Qty] FROM [{0}] "
+    "WHERE [DC ID] = ? AND [Transaction Date] >= ? AND [Transaction Date] < ?")
+
+#Used in upsert mode to correct the container count of a row that was already imported
+UPDATE_SQL = ("UPDATE [{0}] SET [Container Qty] = ? "
+    "WHERE [DC ID] = ? AND [Store ID] = ? AND [Transaction Date] = ? AND [Container Type] = ?")
+
+#How rows that already exist in the table are handled.
+#  insert: every row is inserted, a row that already exists fails the import
+#  delta:  rows that already exist are skipped
+#  upsert: rows that already exist are skipped unless the container count has changed, in which case it is updated
+#In delta and upsert mode a row with the same key as an earlier row of the same file is skipped too, the first
+#one in the file is the one written
+IMPORT_MODES = ['insert', 'delta', 'upsert']
+
+#The rows read from an import file by parse_file()
+ParsedFile = namedtuple('ParsedFile', ['rows', 'date_range', 'sha1', 'stat_key', 'timings'])
+
 logger = logging.getLogger('importer')
 
 class Importer:
-    def __init__(self, database, filename):
+    def __init__(self, database, filename, connection=None, batch_size=BATCH_SIZE, commit_each_batch=False,
+            fast_executemany=True, history=None, mode='insert', timer=None, bulk_threshold=BULK_THRESHOLD,
+            cache=None, table=TABLE_NAME, sink=None, fingerprints=None, journal=None):
+        """
+        Args:
+            database (str): The path to the Access database to import into
+            filename (str): The path to the Excel file to import
+            connection: An open DB-API connection to the sink's database to write into. If None a new
+                connection is opened for the import and closed afterwards
+            batch_size (int): The number of rows to send with each executemany() call
+            commit_each_batch (bool): Commit after every batch instead of once at the end of the file
+            fast_executemany (bool): Use the pyodbc fast_executemany parameter arrays if the sink says its
+                driver supports them
+            history (ImportHistory): Files found in the history as already imported are rejected before
+                they are parsed. If None every file is imported
+            mode (str): One of IMPORT_MODES. Controls what happens to rows that are already in the table
+            timer (ImportTimer): Records how long each stage of the import takes
+            bulk_threshold (int): Files with at least this many rows are bulk loaded from a staged file
+                instead of being inserted in batches. 0 always inserts in batches
+            cache (RowCache): Keeps the rows of a file that could not be written to the database so they
+                do not have to be read again on the next attempt. If None the rows are not cached
+            table (str): The table to write the rows into
+            sink (Sink): The kind of database being written to. If None the database is an Access database file
+            fingerprints (Fingerprinter): Remembers the digest of files that were hashed before, so a file
+                that has not changed is not read just to be hashed again. If None the file is always hashed
+            journal (ImportJournal): Records a checkpoint after every batch so an interrupted import of the
+                file carries on from the last committed batch. Every batch is committed as it is written when
+                set. If None an interrupted import starts again from the first row
+        """
+        if mode not in IMPORT_MODES:
+            raise ValueError("Unknown import mode '{}'".format(mode))
+
         self.database = database
         self.filename = filename
+        self.connection = connection
+        self.batch_size = batch_size
+        self.commit_each_batch = commit_each_batch
+        self.fast_executemany = fast_executemany
+        self.bulk_threshold = bulk_threshold
+        self.table = table
+        self.sink = sink if sink is not None else AccessSink(database)
 
-    def sha1(self):
-        hash_sha1 = hashlib.sha1()
-        with open (self.filename, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_sha1.update(chunk)
-        return hash_sha1.hexdigest()
+        self.history = history
+        self.cache = cache
+        self.fingerprints = fingerprints
+        self.journal = journal
+        self.mode = mode
+        self.timer = timer if timer is not None else ImportTimer(filename)
+
+        #The first and last transaction dates (as ISO date strings) in the file. Set once the file has been read
+        self.date_range = None
+
+        #The file contents and their hash. The file is read into memory once, when it is hashed, and the rows
+        #are read from the same contents. A file the fingerprints remember is only read if its rows are needed
+        self.contents = None
+        self.digest = None
+
+        #The stat_key() of the file when it was hashed. None if the file changed while it was being hashed
+        self.stat_key = None
+
+        #The number of rows in the file. Set once every row has been read and checked
+        self.rows_read = None
+
+        #The number of rows written to the database
+        self.rows_written = None
+        self.rows_updated = 0
+        self.rows_skipped = 0
+
+        #The skipped rows that repeat the key of an earlier row in the file
+        self.rows_repeated = 0
+
+    def load(self):
+        """Read the import file into memory, and hash it if the digest is not already known"""
+        if self.contents is None:
+            with self.timer.stage('read'):
+                with open(os.path.normpath(self.filename), "rb") as f:
+                    self.contents = f.read()
+            if self.digest is None:
+                with self.timer.stage('hash'):
+                    self.digest = hashlib.sha1(self.contents).hexdigest()
+        return self.contents
+
+    def sha1(self, keep=True):
+        """The SHA-1 of the file contents. When the file has not changed since the fingerprints last saw it
+        the remembered digest is used and the file is not read
+
+        Args:
+            keep (bool): Hash the file as it is read into memory, so the rows can be read from the same
+                contents without reading the file again. False hashes the file without holding it in
+                memory, for callers that only need the digest
+        """
+        if self.digest is not None:
+            return self.digest
 
-    def begin_import(self):
-        logger.info("Beginning import of file {0}".format(self.filename))
-        logger.info("Sha1 hash of file: {0}".format(self.sha1()))
-    
-        #pull the data from the import file.  This will be returned as a 2D array
-        importData = self.import_data()
-        self.insert_rows(importData)
-        
-        
-    def import_data(self):
-        logger.info('Reading records')
         path = os.path.normpath(self.filename)
-        book = open_workbook(path)
-        sheet = book.sheet_by_name('Page1_2')
+        key = stat_key(os.stat(path))
+        if self.fingerprints is not None:
+            self.digest = self.fingerprints.lookup(path, key)
+            if self.digest is not None:
+                logger.debug("File has not changed since it was last hashed")
+                self.stat_key = key
+                return self.digest
+
+        if keep:
+            self.load()
+            digest = self.digest
+        else:
+            with self.timer.stage('hash'):
+                digest = hash_file(path)
+        # Only trust the digest if the file did not change while it was being read
+        if stat_key(os.stat(path)) == key:
+            self.stat_key = key
+            if self.fingerprints is not None:
+                self.fingerprints.remember(path, key, digest)
+        self.digest = digest
+        return self.digest
+
+    def check_history(self):
+        """Reject the file if the same contents have already been imported
+
+        Raises:
+            DuplicateFileException: If the history shows the file was already imported
+        """
+        logger.info("Sha1 hash of file: %s", self.sha1())
+        if self.history is None:
+            return
+
+        with self.timer.stage('history'):
+            previous = self.history.lookup(self.digest)
+        if previous is not None and previous.outcome == 'Archived':
+            raise DuplicateFileException("The same file was already imported from '{0}' on {1} ({2} records)"
+                .format(previous.filename, previous.imported, previous.rows))
+
+    def begin_import(self, parsed=None):
+        """Import the file into the database
+
+        Args:
+            parsed (ParsedFile): The rows already read from the file by parse_file(). If None the
+                file will be read here
+        """
+        logger.info("Beginning import of file %s", self.filename)
+    
+        # The rows handed over by a parser process, kept so they can be cached if the database can't be written.
+        # Rows read here are read again from the file contents for the cache
+        read = None
+        if parsed is None:
+            self.check_history()
+            rows = self.cached_rows()
+            if rows is None:
+                # Read and check every row before any database work, so a file with bad rows fails here
+                # instead of part way through the inserts. The rows are not kept, they are read again from
+                # the file contents as they are written
+                self.check_rows()
+                rows = self.import_data()
+        else:
+            self.digest = parsed.sha1
+            self.date_range = parsed.date_range
+            if self.fingerprints is not None and parsed.stat_key is not None:
+                # So a retry of the file is not hashed again, and its age can be found from its cached dates
+                self.fingerprints.remember(os.path.normpath(self.filename), parsed.stat_key, parsed.sha1)
+            for name, seconds in parsed.timings.items():
+                self.timer.add(name, seconds)
+
+            # The parser process checked the history when the file was submitted. A copy of the same file
+            # submitted before the first one was written passed that check too, so it is checked again here
+            self.check_history()
+            logger.info('Using %s records read by a parser process', len(parsed.rows))
+            rows = parsed.rows
+            read = parsed.rows
 
-        # Rows and columns are indexed starting at 0.  Skip row 0 since this is a title row
+        try:
+            self.insert_rows(rows)
+        except self.sink.errors as e:
+            # Only files that will be attempted again are worth caching. A constraint violation sends the
+            # file to the errors directory, and its entry would only push out useful ones
+            retry = self.sink.error_code(e) == 'HY000' or self.sink.is_connection_error(e)
+            if retry and self.cache is not None and (read is not None or self.rows_read is not None):
+                with self.timer.stage('cache'):
+                    self.cache.put(self.digest, read if read is not None else list(self.import_data()),
+                        self.date_range)
+            raise
+        finally:
+            self.contents = None
 
-        # Pull the column names from row 1
-        keys = [sheet.cell(1, col).value for col in range(sheet.ncols)]
+        if self.cache is not None:
+            self.cache.discard(self.digest)
 
-        data = []
+    def cached_rows(self):
+        """Find the rows of the file in the cache
 
-        # Pull the row data from row 2 through the end of the sheet (skipping the trailing footer row)
-        for row in range(2, sheet.nrows -1):
-            d = {
-                keys[col]: sheet.cell(row, col).value 
-                for col in range(sheet.ncols)
-            }
-            # Excel stores the date as a number, convert back to a string
-            # Convert to a datetime date string in ISO format (YYYY-MM-DD)
-            dt_xl = d.get('Transaction Date')
-            # logger.debug("read date as {}".format(dt_xl))
+        Returns:
+            iterator: The cached rows, or None if the file has not been cached
+        """
+        if self.cache is None:
+            return None
 
-            dt = xlrd.xldate_as_datetime(dt_xl, book.datemode)
-            # logger.debug("As datetime {}".format(dt))
-            d['Transaction DateTime'] = dt
+        with self.timer.stage('cache'):
+            cached = self.cache.get(self.sha1())
+        if cached is None:
+            return None
+        count, self.date_range, rows = cached
+        logger.info('Using %s records cached by an earlier attempt', count)
+        return rows
 
-            dts = dt.date().isoformat()
-            # logger.debug("As date string {}".format(dts))
+    def check_rows(self):
+        """Read every row of the file to check it against the schema, without keeping the rows
 
-            d['Transaction Date String'] = dts
-            data.append(d)
+        Raises:
+            FileFormatException: If any row failed the checks
+        """
+        count = 0
+        for _ in self.import_data():
+            count += 1
+        self.rows_read = count
 
-            if row == 2:
-                logger.info("File appears to be for DC {}".format(d.get('DC Id')))
+    def import_data(self):
+        """Read the rows from the import file.
+        This is a generator, rows are yielded as they are read and checked against the schema. Once every
+        row has been read a FileFormatException is raised if any of them failed the checks. The reader is
+        chosen by the file signature or extension. The file contents are kept so the rows can be read again
+
+        Yields:
+            Row: The next data row from the sheet
+        """
+        # Only the first pass over the file is worth reporting
+        level = logging.INFO if self.rows_read is None else logging.DEBUG
+        logger.log(level, 'Reading records')
+        reader = open_reader(self.filename, self.load(), self.timer)
+
+        count = 0
+        rows = reader.read()
+        while True:
+            # Only the time spent in the reader counts, not the time the caller spends with each row
+            with self.timer.stage('rows'):
+                row = next(rows, None)
+            if row is None:
+                break
+
+            if count == 0:
+                logger.log(level, "File appears to be for DC %s", row.dc_id)
+                # Readers that load the whole sheet already know the dates the file covers. Others only
+                # know them once every row has been read, which an earlier pass may already have done
+                if reader.date_range is not None:
+                    self.date_range = reader.date_range
+
+            count += 1
+            yield row
         
-        logger.info('Read {0} records'.format(len(data)))
-        return data
+        self.date_range = reader.date_range
+        if self.date_range is not None:
+            logger.log(level, "File contains transactions from %s through %s", *self.date_range)
+        logger.log(level, 'Read %s records', count)
     
+    def connect(self):
+        """Open a new connection to the database"""
+        return self.sink.connect()
+
     def insert_rows(self, importData):
-        # Insert all rows into the database. If we encounter an exception the transaction will be rolled
-        # back to the time the database connection was established
+        # Insert the rows into the database. If we encounter an exception the current transaction will
+        # be rolled back. Unless commit_each_batch is set this will discard every row written from this file
         logger.info("Writing records into database")
         logger.debug(self.database)
-        conn_str = rf'Driver={{Microsoft Access Driver (*.mdb, *.accdb)}};DBQ={self.database};'
-        logger.debug("Connection string: '{}'".format(conn_str))
-        with pyodbc.connect(conn_str) as conn:
-            with conn.cursor() as cursor:
-                for row in importData:
-                    try:
-                        cursor.execute("INSERT INTO [{0}] ([DC ID], [DC Name], [Store ID], [Store Name], [Address], [City], [State],"
-                            "[Zip], [Transaction Date], [Container Type], [Container Qty]) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)".format(TABLE_NAME),
-                            row.get('DC Id'),
-                            row.get('DC Name'),
-                            row.get('Store Id'),
-                            row.get('Store Name'),
-                            row.get('Address'),
-                            row.get('City'),
-                            row.get('State'),
-                            row.get('Zip'),
-                            row.get('Transaction DateTime'),
-                            row.get('Container Type'),
-                            row.get('Container Qty')
-                        )
-                    except Exception as e:
-                        logger.error("Error importing row {}".format(row))
-                        raise e
-                logger.info('Wrote {0} records'.format(len(importData)))
-            
+        rows = iter(importData)
+
+        # Carry on from the last batch committed by an interrupted import of the same file. The rest of
+        # the file is written in batches so it can be checkpointed too
+        resume = None
+        if self.journal is not None:
+            resume = self.journal.resume(self.sha1(), self.database, self.table)
+
+        # Read far enough ahead to know whether this file is big enough for the bulk load
+        bulk = False
+        if self.bulk_threshold and resume is None:
+            head = list(islice(rows, self.bulk_threshold))
+            bulk = len(head) >= self.bulk_threshold
+            rows = chain(head, rows)
+
+        self.rows_written = 0
+        self.rows_updated = 0
+        self.rows_skipped = 0
+        self.rows_repeated = 0
+
+        conn = self.connection if self.connection is not None else self.connect()
+        cursor = conn.cursor()
+        try:
+            # Only pyodbc cursors know about parameter arrays, and not every ODBC driver handles them
+            if self.fast_executemany and self.sink.supports_fast_executemany and hasattr(cursor, 'fast_executemany'):
+                cursor.fast_executemany = True
+
+            start_time = time.perf_counter()
+            if bulk:
+                logger.info("File has at least %s records, loading through a staged file", self.bulk_threshold)
+                if not self.bulk_load(conn, cursor, rows):
+                    # The load was rolled back. Start again from the first row, one batch at a time
+                    self.rows_written = 0
+                    self.rows_updated = 0
+                    self.rows_skipped = 0
+                    self.rows_repeated = 0
+                    if isinstance(importData, list):
+                        rows = iter(importData)
+                    else:
+                        rows = self.import_data()
+                    bulk = False
+            if not bulk:
+                self.write_batches(conn, cursor, rows, resume)
+            if self.journal is not None:
+                self.journal.finish(self.digest, self.database, self.table)
+
+            elapsed = time.perf_counter() - start_time
+            logger.info('Wrote %s records in %.2f seconds (%.0f records/sec)',
+                self.rows_written, elapsed, self.rows_written / elapsed if elapsed > 0 else 0)
+            if self.mode != 'insert':
+                logger.info('Skipped %s records already in the database, updated %s records',
+                    self.rows_skipped, self.rows_updated)
+                if self.rows_repeated:
+                    logger.warning('%s of the skipped records repeat an earlier record of the file',
+                        self.rows_repeated)
+        finally:
+            cursor.close()
+            if self.connection is None:
+                conn.close()
+
+    def batches(self, cursor, rows):
+        """Split the rows into batches. In delta mode the rows already in the table are taken out of
+        each batch
+
+        Yields:
+            tuple: The rows to insert and the existing rows whose container count should be updated
+        """
+        # In delta mode this maps the key of every row already in the table to its container count.
+        # It is loaded when the first batch has been read since that is when the DC and dates are known,
+        # and extended if later batches contain dates outside the range already loaded
+        existing = {}
+        covered = None
+
+        # The keys of the rows from this file that have been written, so a key the file repeats is not
+        # inserted a second time
+        written = set()
+
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+
+            changed = []
+            if self.mode != 'insert':
+                with self.timer.stage('existing'):
+                    covered = self.load_existing(cursor, batch, existing, covered)
+                size = len(batch)
+                batch, changed = self.split_existing(batch, existing, written)
+                self.rows_skipped += size - len(batch) - len(changed)
+            yield batch, changed
+
+    def write_batches(self, conn, cursor, rows, resume=None):
+        """Insert the rows with one executemany() call per batch
+
+        Args:
+            conn: The connection to commit
+            cursor: A cursor on the connection
+            rows: An iterator over every row of the file
+            resume (Checkpoint): The last batch committed by an interrupted import of the file. The rows
+                it covers are not written again. If None the file is written from the first row
+        """
+        number = 0
+        offset = 0
+        if resume is not None:
+            logger.info("Resuming after record %s. %s batches were committed by an earlier attempt on %s",
+                resume.offset, resume.batch, resume.updated)
+            rows = islice(rows, resume.offset, None)
+            number, offset = resume.batch, resume.offset
+            self.rows_written = resume.rows
+            if self.mode == 'insert':
+                # The last batch may have been committed without its checkpoint being recorded
+                logger.info("Records already in the database will be skipped")
+                self.mode = 'delta'
+
+        # With a journal every batch is committed, since only committed batches can be carried on from
+        checkpoint = self.journal is not None
+        written = self.rows_written
+
+        # Rows are pulled from the reader one batch at a time. A Row is already a parameter tuple in
+        # the column order of INSERT_SQL so the batches can be handed straight to the driver
+        sql = self.sink.sql(INSERT_SQL.format(self.table))
+        for batch, changed in self.batches(cursor, rows):
+            try:
+                with self.timer.stage('insert'):
+                    if batch:
+                        cursor.executemany(sql, batch)
+                    if changed:
+                        self.update_rows(cursor, changed)
+            except Exception as e:
+                conn.rollback()
+                self.find_failing_row(cursor, sql, batch, self.rows_written)
+                conn.rollback()
+                raise e
+
+            self.rows_written += len(batch)
+            self.rows_updated += len(changed)
+            number += 1
+            if self.commit_each_batch or checkpoint:
+                with self.timer.stage('commit'):
+                    conn.commit()
+                logger.debug("Committed records %d through %d", self.rows_written - len(batch) + 1, self.rows_written)
+            if checkpoint:
+                # Every row read so far has been inserted, updated or skipped
+                read = offset + self.rows_written - written + self.rows_updated + self.rows_skipped
+                with self.timer.stage('checkpoint'):
+                    self.journal.checkpoint(self.digest, self.database, self.table, self.filename, number, read,
+                        self.rows_written)
+
+        with self.timer.stage('commit'):
+            conn.commit()
+
+    def bulk_load(self, conn, cursor, rows):
+        """Write the new rows to a staged file and insert them all with a single statement.
+        The number of rows inserted is checked against the number staged before committing
+
+        Returns:
+            bool: True if the rows were loaded. False if the load was rolled back because the row
+                counts did not match
+        """
+        with StagedRows() as staged:
+            with self.timer.stage('stage'):
+                for batch, changed in self.batches(cursor, rows):
+                    staged.write(batch)
+                    if changed:
+                        with self.timer.stage('insert'):
+                            self.update_rows(cursor, changed)
+                        self.rows_updated += len(changed)
+                staged.close()
+
+            try:
+                with self.timer.stage('insert'):
+                    inserted = self.sink.bulk_load(cursor, staged, self.table)
+            except Exception:
+                conn.rollback()
+                raise
+
+        if inserted not in (-1, staged.count):
+            logger.error("Bulk load inserted %s records but %s were staged. Rolling back", inserted, staged.count)
+            conn.rollback()
+            return False
+        if inserted == -1:
+            logger.warning("The database did not report how many records the bulk load inserted")
+
+        self.rows_written = staged.count
+        with self.timer.stage('commit'):
+            conn.commit()
+        return True
+
+    def load_existing(self, cursor, batch, existing, covered):
+        """Load the keys of the rows already in the table for this DC and the batch's range of dates.
+        When the reader knows the dates the whole file covers up front this is a single query for the
+        whole file, otherwise only the dates not already loaded are queried
+
+        Args:
+            cursor: The cursor to query with
+            batch (list): The rows about to be written
+            existing (dict): The container count of each existing row, keyed by row_key(). New keys are added to it
+            covered (tuple): The first and last dates already loaded, or None if nothing has been loaded yet
+
+        Returns:
+            tuple: The first and last dates now loaded
+        """
+        if self.date_range is not None:
+            first = datetime.date.fromisoformat(self.date_range[0])
+            last = datetime.date.fromisoformat(self.date_range[1])
+        else:
+            days = [row.transaction_date.date() for row in batch]
+            first = min(days)
+            last = max(days)
+
+        dc_id = batch[0].dc_id
+        one_day = datetime.timedelta(days=1)
+        if covered is None:
+            ranges = [(first, last)]
+        else:
+            ranges = []
+            if first < covered[0]:
+                ranges.append((first, covered[0] - one_day))
+            if last > covered[1]:
+                ranges.append((covered[1] + one_day, last))
+            first = min(first, covered[0])
+            last = max(last, covered[1])
+
+        table = self.sink.sql(EXISTING_SQL.format(self.table))
+        for start, end in ranges:
+            # The upper bound is exclusive so the whole of the last day is included
+            cursor.execute(table, (dc_id, datetime.datetime.combine(start, datetime.time()),
+                datetime.datetime.combine(end + one_day, datetime.time())))
+            found = 0
+            for dc, store, date, container, qty in cursor.fetchall():
+                existing[row_key(dc, store, date, container)] = qty
+                found += 1
+            logger.info("Found %s records already in the database for DC %s between %s and %s",
+                found, dc_id, start, end)
+        return (first, last)
+
+    def split_existing(self, batch, existing, written):
+        """Separate the rows that need to be inserted from the ones that are already in the table.
+        A row with the same key as an earlier row of the file is left out of both lists
+
+        Args:
+            batch (list): The rows to check
+            existing (dict): The container counts of the rows already in the table, filled by load_existing()
+            written (set): The keys of the rows from the file already inserted or updated. The keys of
+                the rows returned are added to it
+
+        Returns:
+            tuple: The new rows to insert, and the existing rows whose container count should be
+                updated. The second list is always empty unless running in upsert mode
+        """
+        new = []
+        changed = []
+        for row in batch:
+            key = row_key(row.dc_id, row.store_id, row.transaction_date, row.container_type)
+            if key in written:
+                self.rows_repeated += 1
+                logger.debug("Skipped row repeated in the file %s", row)
+                continue
+            if key not in existing:
+                new.append(row)
+            elif self.mode == 'upsert' and existing[key] != row.container_qty:
+                changed.append(row)
+            else:
+                continue
+            written.add(key)
+        return new, changed
+
+    def update_rows(self, cursor, changed):
+        """Update the container count of rows that were already imported"""
+        cursor.executemany(self.sink.sql(UPDATE_SQL.format(self.table)), [
+            (row.container_qty, row.dc_id, row.store_id, row.transaction_date, row.container_type)
+            for row in changed
+        ])
+        for row in changed:
+            # Arguments are passed separately so the row is only formatted if the record is written
+            logger.debug("Updated container count of row %s", row)
+
+    def find_failing_row(self, cursor, sql, batch, offset):
+        """Replay a failed batch one row at a time to find the row that the database rejected.
+        The batch should already have been rolled back, the caller is responsible for rolling back
+        the replayed rows.
+
+        Args:
+            cursor: The cursor the batch was executed on
+            sql (str): The insert statement
+            batch (list): The rows in the failed batch
+            offset (int): The number of rows in the file before this batch
+        """
+        for i, row in enumerate(batch):
+            try:
+                cursor.execute(sql, row)
+            except Exception as e:
+                logger.error("Error importing record %s: %s", offset + i + 1, e)
+                logger.error("Error importing row %s", row)
+                return
+        logger.error("Unable to find the failing row in records %s through %s", offset + 1, offset + len(batch))
+
+
+
+
+def row_key(dc_id, store_id, transaction_date, container_type):
+    """Build the key that identifies a row in the table.
+    Values read from Excel and from the database may not have the same types (7.0 and 7), so every
+    part of the key is normalized to a string
+
+    Returns:
+        tuple: The normalized key
+    """
+    def normalize(value):
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value).strip()
+    return (normalize(dc_id), normalize(store_id), normalize(transaction_date), normalize(container_type))
+
+
+def parse_file(filename, history=None, cache=None, fingerprint=None):
+    """Read every row from an import file without touching the database.
+    Runs in the parser processes when the service is in pipeline mode
+
+    Args:
+        filename (str): The path to the Excel file to read
+        history (ImportHistory): Used to reject files that were already imported before they are parsed
+        cache (RowCache): The rows are taken from the cache instead of the file when they are there
+        fingerprint (tuple): The current stat_key() of the file and the digest remembered for it. If None
+            the file is hashed
 
+    Returns:
+        ParsedFile: The rows read from the file
+    """
+    importer = Importer(None, filename, history=history, cache=cache)
+    if fingerprint is not None:
+        importer.stat_key, importer.digest = fingerprint
+    importer.check_history()
+    rows = importer.cached_rows()
+    rows = list(rows if rows is not None else importer.import_data())
+    return ParsedFile(rows, importer.date_range, importer.digest, importer.stat_key, importer.timer.stages)
 
 
 def to_dict(obj):
@@ -0,0 +1,136 @@
+import logging, os, threading, time
+
+#A file must keep the same size and modification time for this many seconds before it is imported
+SETTLE_SECONDS = 2
+
+logger = logging.getLogger('ingest')
+
+
+class IngestQueue:
+    """Collects the files found by the file system observer and by directory scans and holds them
+    until they have finished being written. A path is only queued once no matter how many events
+    are raised for it, and a file that has already been handed off is not queued again unless it
+    changes or a full scan asks for it.
+    """
+
+    def __init__(self, settle=SETTLE_SECONDS):
+        """
+        Args:
+            settle (float): The number of seconds a file's size and modification time must stay the
+                same before it is ready to import
+        """
+        self.settle = settle
+        self.lock = threading.Lock()
+
+        # path -> ((size, mtime), time the size and mtime were last seen to change)
+        self.pending = {}
+
+        # path -> (size, mtime) of each file at the time it was handed off
+        self.dispatched = {}
+
+        # directory -> mtime at the last scan
+        self.dir_mtimes = {}
+
+    def offer(self, path: str, force=False):
+        """Queue a file to be imported once it has settled
+
+        Args:
+            path (str): The file to queue
+            force (bool): Queue the file even if it was already handed off and has not changed since
+
+        Returns:
+            bool: True if the file was added to the queue
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return self._offer(path, st, force)
+
+    def _offer(self, path, st, force):
+        fingerprint = (st.st_size, st.st_mtime_ns)
+        with self.lock:
+            if path in self.pending:
+                return False
+            if not force and self.dispatched.get(path) == fingerprint:
+                return False
+            self.pending[path] = (fingerprint, time.monotonic())
+        logger.debug("Queued '%s'", path)
+        return True
+
+    def ready(self):
+        """Take the files that have stopped changing off the queue
+
+        Returns:
+            list: The paths that are ready to import
+        """
+        now = time.monotonic()
+        with self.lock:
+            items = list(self.pending.items())
+
+        ready = []
+        for path, (fingerprint, since) in items:
+            try:
+                st = os.stat(path)
+            except OSError:
+                # The file was removed before we got to it
+                with self.lock:
+                    self.pending.pop(path, None)
+                continue
+
+            current = (st.st_size, st.st_mtime_ns)
+            with self.lock:
+                if current != fingerprint:
+                    # Still being written, start waiting again
+                    self.pending[path] = (current, now)
+                elif now - since >= self.settle:
+                    del self.pending[path]
+                    self.dispatched[path] = current
+                    ready.append(path)
+        return ready
+
+    def scan(self, directories, full=False):
+        """Queue the files in each directory.
+        A quick scan skips directories whose modification time has not changed since the last scan
+        and files that were already handed off. A full scan lists every directory and queues every
+        file, which is how files left behind by a failed import are retried.
+
+        Args:
+            directories: The directories to scan
+            full (bool): Perform a full scan
+
+        Returns:
+            int: The number of files added to the queue
+        """
+        found = 0
+        present = set()
+        for d in directories:
+            directory = os.path.normpath(d)
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+                if not full and self.dir_mtimes.get(directory) == mtime:
+                    continue
+                self.dir_mtimes[directory] = mtime
+
+                logger.debug("Checking directory '%s'", directory)
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            present.add(entry.path)
+                            # On Windows the stat result comes from the directory listing itself
+                            if self._offer(entry.path, entry.stat(), full):
+                                found += 1
+            except OSError as e:
+                logger.error("Unable to scan directory '%s': %s", directory, e)
+
+        if full:
+            # Forget files that are no longer in the watched directories
+            with self.lock:
+                for path in [p for p in self.dispatched if p not in present]:
+                    del self.dispatched[path]
+        return found
+
+    def depth(self):
+        """The number of files waiting to settle"""
+        with self.lock:
+            return len(self.pending)
@@ -0,0 +1,94 @@
+import logging, sqlite3, time
+from collections import namedtuple
+from contextlib import closing
+
+logger = logging.getLogger('journal')
+
+#How far the import of a file into a table got before it was interrupted
+#  batch:  The number of batches committed
+#  offset: The number of rows of the file committed, including rows that were skipped as already imported
+#  rows:   The number of rows inserted
+Checkpoint = namedtuple('Checkpoint', ['sha1', 'database', 'table', 'filename', 'batch', 'offset', 'rows', 'updated'])
+
+
+class ImportJournal:
+    """A local SQLite journal of the batches committed for each file being imported. A checkpoint is
+    written after every batch is committed and removed once the whole file has been written, so an
+    import that was interrupted by a crash or a lost connection can carry on from the last committed
+    batch instead of writing the whole file again.
+    A new SQLite connection is opened for every call so the journal can be shared between the writer threads.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): The SQLite database file. It will be created if it does not exist
+        """
+        self.path = path
+        with closing(self.connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS checkpoints ("
+                "sha1 TEXT NOT NULL, database TEXT NOT NULL, target TEXT NOT NULL, filename TEXT NOT NULL, "
+                "batch INTEGER NOT NULL, offset INTEGER NOT NULL, rows INTEGER NOT NULL, updated TEXT NOT NULL, "
+                "PRIMARY KEY (sha1, database, target))")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def resume(self, sha1: str, database: str, table: str):
+        """Find where an interrupted import of a file stopped
+
+        Args:
+            sha1 (str): The hex digest of the file contents
+            database (str): The database the file is being imported into
+            table (str): The table the file is being imported into
+
+        Returns:
+            Checkpoint: The last committed batch, or None if the import has nothing to carry on from
+        """
+        with closing(self.connect()) as conn:
+            row = conn.execute("SELECT sha1, database, target, filename, batch, offset, rows, updated FROM checkpoints "
+                "WHERE sha1 = ? AND database = ? AND target = ?", (sha1, database, table)).fetchone()
+        return Checkpoint._make(row) if row is not None else None
+
+    def checkpoint(self, sha1: str, database: str, table: str, filename: str, batch: int, offset: int, rows: int):
+        """Record that a batch has been committed. Must only be called once the database has committed it
+
+        Args:
+            sha1 (str): The hex digest of the file contents
+            database (str): The database the file is being imported into
+            table (str): The table the file is being imported into
+            filename (str): The path the file is being imported from
+            batch (int): The number of batches committed so far
+            offset (int): The number of rows of the file committed so far
+            rows (int): The number of rows inserted so far
+        """
+        try:
+            with closing(self.connect()) as conn, conn:
+                conn.execute("INSERT OR REPLACE INTO checkpoints "
+                    "(sha1, database, target, filename, batch, offset, rows, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (sha1, database, table, filename, batch, offset, rows, time.strftime('%Y-%m-%d %H:%M:%S')))
+        except sqlite3.Error as e:
+            # Without the checkpoint an interrupted import starts again from an earlier batch, and the rows
+            # committed since are skipped as already imported. Don't fail the import over it
+            logger.error("Unable to record checkpoint of '%s' in '%s': %s", filename, self.path, e)
+
+    def finish(self, sha1: str, database: str, table: str):
+        """Forget the checkpoint of a file once every row has been written"""
+        try:
+            with closing(self.connect()) as conn, conn:
+                conn.execute("DELETE FROM checkpoints WHERE sha1 = ? AND database = ? AND target = ?",
+                    (sha1, database, table))
+        except sqlite3.Error as e:
+            # A file that was completely imported is rejected by the history before the checkpoint is looked at
+            logger.error("Unable to remove checkpoint of '%s' from '%s': %s", sha1, self.path, e)
+
+    def unfinished(self):
+        """List the imports that were interrupted, oldest first
+
+        Returns:
+            list: The Checkpoint of every file that has not been completely written
+        """
+        with closing(self.connect()) as conn:
+            rows = conn.execute("SELECT sha1, database, target, filename, batch, offset, rows, updated FROM checkpoints "
+                "ORDER BY updated").fetchall()
+        return [Checkpoint._make(row) for row in rows]
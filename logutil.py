@@ -0,0 +1,101 @@
+import atexit, logging, queue, threading, time
+from logging.handlers import QueueHandler, QueueListener
+
+#DEBUG messages logged from the same line of code are limited to RATE_LIMIT messages every RATE_INTERVAL seconds
+RATE_LIMIT = 20
+RATE_INTERVAL = 60
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Puts log records on a queue without formatting them first. The handlers on the other end of the
+    queue format the records on the listener thread instead of the thread doing the logging.
+    Records keep references to their arguments, so this is only safe for a queue inside one process.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """Limits the number of low level records logged from any one line of code.
+    Lines that log once per row or once per file in a directory can otherwise flood the log.
+    When a line is allowed to log again the first record notes how many were dropped.
+    """
+
+    def __init__(self, limit=RATE_LIMIT, interval=RATE_INTERVAL, level=logging.DEBUG):
+        """
+        Args:
+            limit (int): The number of records allowed from a line during each interval
+            interval (float): The length of each interval in seconds
+            level (int): Records above this level are never limited
+        """
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.level = level
+        self.lock = threading.Lock()
+
+        # (path, line) -> [interval start, records allowed, records dropped]
+        self.windows = {}
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                dropped = window[2] if window is not None else 0
+                self.windows[key] = [now, 1, 0]
+                if dropped:
+                    record.msg = "{0} ({1} similar messages suppressed)".format(record.msg, dropped)
+                return True
+            if window[1] < self.limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class LogQueue:
+    """Moves log output off the calling thread. Loggers write to a queue and a listener thread passes the
+    records on to the real handlers, so a slow disk or event log never holds up an import.
+    """
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.handler = DeferredQueueHandler(self.queue)
+        self.handler.addFilter(RateLimitFilter())
+        self.listener = QueueListener(self.queue, respect_handler_level=True)
+        self.listener.start()
+        self.running = True
+
+        # Make sure everything queued reaches the handlers, even when exiting with sys.exit()
+        atexit.register(self.stop)
+
+    def add_handler(self, handler: logging.Handler):
+        """Add a handler to the listener. The handler level is respected"""
+        self.listener.handlers = self.listener.handlers + (handler,)
+
+    def stop(self):
+        """Write out any queued records and stop the listener thread"""
+        if self.running:
+            self.running = False
+            self.listener.stop()
+
+
+def log_to_queue(q):
+    """Send all logging in a worker process back to the parent process.
+    Used as the initializer of the parser processes. Records are formatted here since they have to be
+    pickled to cross the process boundary
+
+    Args:
+        q (multiprocessing.Queue): The queue the parent process is listening on
+    """
+    handler = QueueHandler(q)
+    handler.addFilter(RateLimitFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(logging.DEBUG)
@@ -0,0 +1,168 @@
+import json, logging, os, threading, time
+from collections import deque
+from contextlib import contextmanager
+
+#The stages of an import, in the order they happen
+STAGES = ['read', 'hash', 'history', 'cache', 'open_workbook', 'dates', 'rows', 'connect', 'existing', 'stage', 'insert', 'commit', 'checkpoint', 'archive']
+
+#The number of recent imports kept for the rolling aggregates
+WINDOW = 100
+
+logger = logging.getLogger('metrics')
+
+
+class ImportTimer:
+    """Records how long each stage of a single import takes.
+    Stages may be nested, the time spent in an inner stage is not counted towards the outer one.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.stages = {}
+        self.stack = []
+        self.started = time.perf_counter()
+        self.finished = None
+        self.rows = 0
+        self.bytes = 0
+        self.outcome = None
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the body of a with block as the named stage"""
+        entry = [time.perf_counter(), 0.0]
+        self.stack.append(entry)
+        try:
+            yield
+        finally:
+            self.stack.pop()
+            elapsed = time.perf_counter() - entry[0]
+            self.add(name, elapsed - entry[1])
+            if self.stack:
+                self.stack[-1][1] += elapsed
+
+    def add(self, name: str, seconds: float):
+        """Add time to a stage. Used to merge the timings of a parser process"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self, outcome: str, rows, size):
+        """Stop the clock for the import
+
+        Args:
+            outcome (str): The status of the import
+            rows (int): The number of rows written
+            size (int): The size of the file in bytes
+        """
+        self.finished = time.perf_counter()
+        self.outcome = outcome
+        self.rows = rows or 0
+        self.bytes = size or 0
+
+    @property
+    def total(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def summary(self):
+        """The timings as a dictionary"""
+        total = self.total
+        return {
+            'file': self.filename,
+            'outcome': self.outcome,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'seconds': total,
+            'rows_per_second': self.rows / total if total > 0 else 0,
+            'bytes_per_second': self.bytes / total if total > 0 else 0,
+            'stages': {name: self.stages[name] for name in STAGES + sorted(self.stages) if name in self.stages},
+        }
+
+    def describe(self):
+        """The timings as a single line for the log"""
+        return ", ".join("{0} {1:.3f}s".format(name, seconds)
+            for name, seconds in self.summary()['stages'].items())
+
+
+class Metrics:
+    """Rolling aggregates of the import timings, written to a JSON snapshot file after every import
+    so they can be checked without reading through the logs
+    """
+
+    def __init__(self, path: str, window=WINDOW):
+        """
+        Args:
+            path (str): The JSON snapshot file. If None the snapshot is only kept in memory
+            window (int): The number of recent imports the averages are taken over
+        """
+        self.path = path
+        self.recent = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+        # Every route's writer records its imports, the snapshot file is written by one of them at a time
+        self.write_lock = threading.Lock()
+        self.started = time.time()
+        self.files = 0
+        self.rows = 0
+        self.bytes = 0
+        self.outcomes = {}
+
+        #Extra values reported by other parts of the service, i.e. queue depths
+        self.gauges = {}
+
+    def record(self, timer: ImportTimer):
+        """Add a finished import to the aggregates and write the snapshot"""
+        summary = timer.summary()
+        with self.lock:
+            self.recent.append(summary)
+            self.files += 1
+            self.rows += summary['rows']
+            self.bytes += summary['bytes']
+            self.outcomes[summary['outcome']] = self.outcomes.get(summary['outcome'], 0) + 1
+        self.write()
+
+    def gauge(self, name: str, value):
+        """Set a value that is reported as is in the snapshot"""
+        with self.lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        """The current aggregates as a dictionary"""
+        with self.lock:
+            recent = list(self.recent)
+            snapshot = {
+                'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'uptime_seconds': time.time() - self.started,
+                'files': self.files,
+                'rows': self.rows,
+                'bytes': self.bytes,
+                'outcomes': dict(self.outcomes),
+                'gauges': dict(self.gauges),
+            }
+
+        stages = {}
+        for summary in recent:
+            for name, seconds in summary['stages'].items():
+                stages.setdefault(name, []).append(seconds)
+        seconds = sum(s['seconds'] for s in recent)
+        snapshot['recent'] = {
+            'files': len(recent),
+            'rows_per_second': sum(s['rows'] for s in recent) / seconds if seconds > 0 else 0,
+            'bytes_per_second': sum(s['bytes'] for s in recent) / seconds if seconds > 0 else 0,
+            'stages': {
+                name: {'mean': sum(values) / len(values), 'max': max(values), 'total': sum(values)}
+                for name, values in stages.items()
+            },
+        }
+        snapshot['last'] = recent[-1] if recent else None
+        return snapshot
+
+    def write(self):
+        """Write the snapshot file. The file is replaced in one step so readers never see a partial file"""
+        if self.path is None:
+            return
+        try:
+            temp = self.path + '.tmp'
+            with self.write_lock:
+                with open(temp, 'w', encoding='utf-8') as f:
+                    json.dump(self.snapshot(), f, indent=2)
+                os.replace(temp, self.path)
+        except OSError as e:
+            logger.warning("Unable to write metrics to '%s': %s", self.path, e)
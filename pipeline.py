@@ -0,0 +1,212 @@
+import heapq, itertools, logging, os, sys, threading, time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from logging.handlers import QueueListener
+
+from importer import parse_file
+from fingerprint import stat_key
+from logutil import log_to_queue
+
+#The number of files parsed ahead of the writer for each parser process. Parsed files are held in memory
+#until they are written, so this keeps a backlog of thousands of files from being read all at once
+PARSE_AHEAD = 2
+
+logger = logging.getLogger('pipeline')
+
+
+class ParserPool:
+    """A pool of worker processes that parse workbooks. Parsing is CPU bound and can run on every
+    core, so a single pool is shared by the pipelines of every route.
+    """
+
+    def __init__(self, workers: int, log_handler=None, fingerprints=None):
+        """
+        Args:
+            workers (int): The number of parser processes to start
+            log_handler (logging.Handler): Receives the log records of the parser processes. If None the
+                parser processes keep their default logging
+            fingerprints (Fingerprinter): Files that have not changed since they were last hashed are not
+                hashed again by the parser processes. If None every file is hashed
+        """
+        # When running as a service sys.executable is the service host, not the interpreter
+        if os.path.basename(sys.executable).lower().startswith('pythonservice'):
+            multiprocessing.set_executable(os.path.join(sys.exec_prefix, 'python.exe'))
+
+        self.workers = workers
+        self.fingerprints = fingerprints
+        self.log_listener = None
+        if log_handler is not None:
+            log_records = multiprocessing.Queue()
+            self.log_listener = QueueListener(log_records, log_handler, respect_handler_level=True)
+            self.log_listener.start()
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=log_to_queue, initargs=(log_records,))
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        logger.info("Started %s parser processes", workers)
+
+    def submit(self, path: str, history=None, cache=None):
+        """Parse a file in one of the worker processes
+
+        Returns:
+            Future: Resolves to the ParsedFile
+        """
+        fingerprint = None
+        if self.fingerprints is not None:
+            try:
+                key = stat_key(os.stat(path))
+            except OSError:
+                key = None
+            digest = self.fingerprints.lookup(path, key) if key is not None else None
+            fingerprint = (key, digest) if digest is not None else None
+        return self.executor.submit(parse_file, path, history, cache, fingerprint)
+
+    def close(self):
+        """Wait for the files being parsed then stop the worker processes"""
+        self.executor.shutdown(wait=True)
+        if self.log_listener is not None:
+            self.log_listener.stop()
+        logger.info("Parser processes stopped")
+
+
+class Pipeline:
+    """Hands files to a single writer thread, by priority and then in the order they were submitted.
+    Writes to the Access database have to happen one at a time. When a ParserPool is given the next few
+    files are parsed in the worker processes while earlier files are being written.
+    """
+
+    #Sorts ahead of every priority so the writer stops before the files still waiting
+    STOP = (-1,)
+
+    def __init__(self, write, parsers=None, history=None, cache=None, name='pipeline-writer', priority=None):
+        """
+        Args:
+            write: Called from the writer thread as write(path, future) for each submitted file. The
+                future resolves to the ParsedFile read by a parser process, or is None when there is no
+                ParserPool and the file still has to be read
+            parsers (ParserPool): The processes to parse the files in. If None the files are parsed by write()
+            history (ImportHistory): Passed to the parser processes to reject files that were already imported
+            cache (RowCache): Passed to the parser processes so files that failed earlier are not parsed again
+            name (str): The name of the writer thread
+            priority: Called as priority(path) when a file is submitted. Returns a tuple, the files with the
+                lowest are written first. If None the files are written in the order they were submitted
+        """
+        self.write = write
+        self.parsers = parsers
+        self.history = history
+        self.cache = cache
+        self.priority = priority
+
+        # The files waiting to be written, a heap of [priority, sequence, path, future] entries. The future
+        # is None until the file is handed to a parser process
+        self.queue = []
+        self.ready = threading.Condition()
+
+        # Parsed files are held in memory until they are written, so only the next few files in the queue
+        # are parsed ahead of the writer. The rest wait to be parsed until the writer catches up
+        self.ahead = parsers.workers * PARSE_AHEAD if parsers is not None else 0
+        self.parsing = 0
+
+        # Breaks ties between files with the same priority, so they are written in the order submitted
+        self.sequence = itertools.count()
+
+        # The priority and submission time of each path that has been submitted but not yet written. A
+        # file can be found by both the file system observer and a manual sweep, only the first one counts
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stopping = False
+
+        self.writer = threading.Thread(target=self.run, name=name, daemon=True)
+        self.writer.start()
+
+    def submit(self, path: str):
+        """Queue a file to be parsed and written
+
+        Returns:
+            bool: False if the file was already waiting to be written
+        """
+        priority = self.priority(path) if self.priority is not None else (0,)
+        with self.lock:
+            if self.stopping or path in self.pending:
+                logger.debug("File '%s' is already queued, skipping", path)
+                return False
+            self.pending[path] = (priority, time.monotonic())
+
+        with self.ready:
+            heapq.heappush(self.queue, [priority, next(self.sequence), path, None])
+            self.parse_ahead()
+            self.ready.notify()
+            waiting = len(self.queue)
+        logger.info("Queued '%s' for import (%s files waiting)", path, waiting)
+        return True
+
+    def parse_ahead(self):
+        """Hand the first files in the queue that are not being parsed yet to the parser processes, until
+        the parse-ahead window is full. Must be called with the ready condition held"""
+        if self.parsers is None or self.parsing >= self.ahead:
+            return
+        waiting = (entry for entry in self.queue if entry[3] is None and entry[2] is not None)
+        for entry in heapq.nsmallest(self.ahead - self.parsing, waiting):
+            entry[3] = self.parsers.submit(entry[2], self.history, self.cache)
+            self.parsing += 1
+
+    def run(self):
+        """The writer loop. Takes the files in priority order and hands them to write()"""
+        while True:
+            with self.ready:
+                while not self.queue:
+                    self.ready.wait()
+                _, _, path, future = heapq.heappop(self.queue)
+                if path is None:
+                    break
+
+                if future is not None:
+                    self.parsing -= 1
+                elif self.parsers is not None and not self.stopping:
+                    # A file that jumped ahead of the files already being parsed
+                    future = self.parsers.submit(path, self.history, self.cache)
+                if not self.stopping:
+                    self.parse_ahead()
+
+            try:
+                if not self.stopping:
+                    self.write(path, future)
+            except Exception as e:
+                logger.error("Unhandled error writing file '%s'", path)
+                logger.exception(e)
+            finally:
+                with self.lock:
+                    self.pending.pop(path, None)
+
+    def depth(self):
+        """The number of files waiting to be written"""
+        with self.ready:
+            return len(self.queue)
+
+    def waiting(self):
+        """The files that have not been written yet
+
+        Returns:
+            list: The priority of each file and the number of seconds it has been waiting
+        """
+        now = time.monotonic()
+        with self.lock:
+            return [(priority, now - submitted) for priority, submitted in self.pending.values()]
+
+    def close(self):
+        """Stop the pipeline. The file being written is allowed to finish, anything still queued
+        is left in place to be picked up when the service starts again"""
+        with self.lock:
+            self.stopping = True
+        with self.ready:
+            heapq.heappush(self.queue, [self.STOP, next(self.sequence), None, None])
+            self.ready.notify()
+        self.writer.join()
+
+        # Don't bother parsing files that will never be written
+        with self.ready:
+            for entry in self.queue:
+                if entry[3] is not None:
+                    entry[3].cancel()
+            self.queue = []
+            self.parsing = 0
+        logger.info("Pipeline stopped")
@@ -0,0 +1,102 @@
+import datetime, logging, os, time
+
+from fingerprint import stat_key
+from importer import MAX_AGE_MS
+
+#The lanes waiting files are imported in. Every current file is imported before any stale one
+CURRENT_LANE = 0
+STALE_LANE = 1
+
+logger = logging.getLogger('priority')
+
+
+def data_age_ms(date_range, now=None):
+    """The age of the data in a file, from the start of its last transaction date
+
+    Args:
+        date_range (tuple): The first and last transaction dates as ISO date strings
+        now (float): The current time in epoch seconds. Defaults to the time now
+
+    Returns:
+        float: The age in milliseconds
+    """
+    now = now if now is not None else time.time()
+    last = datetime.datetime.fromisoformat(date_range[1])
+    return max(0.0, (now - last.timestamp()) * 1000)
+
+
+class Staleness:
+    """Orders the files waiting to be imported so current data reaches the database first. After an
+    outage the newest files are imported before the backlog, and files whose data is older than
+    max_age_ms wait in a lane of their own until every current file has been imported.
+    A file's age is taken from its transaction dates when they are already known, because its rows were
+    cached by an earlier attempt, and from its modification time otherwise.
+    """
+
+    def __init__(self, max_age_ms=MAX_AGE_MS, fingerprints=None, cache=None):
+        """
+        Args:
+            max_age_ms (int): Files older than this are stale
+            fingerprints (Fingerprinter): Finds the digest of files that were hashed before, to look up their
+                dates in the cache without reading the file. If None the modification time is always used
+            cache (RowCache): Holds the dates of files that were parsed by an earlier attempt
+        """
+        self.max_age_ms = max_age_ms
+        self.fingerprints = fingerprints
+        self.cache = cache
+
+    def age(self, path: str, now=None):
+        """Find how old the data in a file is
+
+        Returns:
+            tuple: The age in milliseconds and where it came from, 'transactions' or 'modified'
+
+        Raises:
+            OSError: If the file can not be found
+        """
+        now = now if now is not None else time.time()
+        st = os.stat(path)
+        if self.fingerprints is not None and self.cache is not None:
+            digest = self.fingerprints.lookup(path, stat_key(st))
+            date_range = self.cache.dates(digest) if digest is not None else None
+            if date_range is not None:
+                return data_age_ms(date_range, now), 'transactions'
+        return max(0.0, (now - st.st_mtime) * 1000), 'modified'
+
+    def priority(self, path: str):
+        """The priority of a waiting file. The freshest file in the current lane sorts first
+
+        Returns:
+            tuple: The lane and the age of the file in milliseconds
+        """
+        try:
+            age, source = self.age(path)
+        except OSError:
+            # The file is gone. The writer will find that out, don't hold anything up for it
+            return (CURRENT_LANE, 0.0)
+
+        if age > self.max_age_ms:
+            logger.debug("File '%s' is stale, %.1f days old by its %s", path, age / 86400000, source)
+            return (STALE_LANE, age)
+        return (CURRENT_LANE, age)
+
+    def is_stale(self, date_range, now=None):
+        """Check whether the transactions read from a file are older than max_age_ms"""
+        return date_range is not None and data_age_ms(date_range, now) > self.max_age_ms
+
+
+def queue_gauges(waiting):
+    """Summarize the files waiting on a pipeline whose priorities came from Staleness.priority()
+
+    Args:
+        waiting (list): The priority of each waiting file and the seconds it has waited, from Pipeline.waiting().
+            A pipeline without a priority function gives every file the priority (0,), with no age
+
+    Returns:
+        dict: The age in milliseconds of the oldest waiting file, counting the time it has spent waiting,
+            and the number of waiting files in the stale lane
+    """
+    oldest = max(((priority[1] if len(priority) > 1 else 0) + seconds * 1000 for priority, seconds in waiting),
+        default=0)
+    stale = sum(1 for priority, _ in waiting if priority[0] == STALE_LANE)
+    return {'oldest_ms': oldest, 'stale': stale}
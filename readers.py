@@ -0,0 +1,385 @@
+import abc, csv, datetime, io, logging, os
+from collections import namedtuple
+
+import numpy
+import openpyxl
+from openpyxl.utils.datetime import from_excel
+from xlrd import open_workbook, XLRDError
+
+from exceptions import FileFormatException
+from metrics import ImportTimer
+from schema import compile_row, RowProblems
+
+#The name of the sheet holding the data in the Excel exports
+SHEET_NAME = 'Page1_2'
+
+#A single spreadsheet row. The fields are in the order the INSERT_SQL parameters expect them
+Row = namedtuple('Row', ['dc_id', 'dc_name', 'store_id', 'store_name', 'address', 'city', 'state', 'zip',
+    'transaction_date', 'container_type', 'container_qty'])
+
+#The spreadsheet column name for each Row field
+ROW_HEADERS = ['DC Id', 'DC Name', 'Store Id', 'Store Name', 'Address', 'City', 'State', 'Zip',
+    'Transaction Date', 'Container Type', 'Container Qty']
+
+#The position of the Transaction Date within a Row
+DATE_FIELD = ROW_HEADERS.index('Transaction Date')
+
+#The extensions of the files that are imported
+IMPORT_FILE_TYPES = [".xls", ".xlsx", ".csv"]
+
+#The date formats accepted in a CSV file
+CSV_DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%Y-%m-%d %H:%M:%S', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %I:%M:%S %p']
+
+#The first day of each Excel date system, keyed by the workbook datemode
+EXCEL_EPOCHS = {
+    0: numpy.datetime64('1899-12-30', 'ms'),
+    1: numpy.datetime64('1904-01-01', 'ms')
+}
+
+#The end of the last day a datetime can hold. Serials past it are not dates
+LAST_DATE = numpy.datetime64('9999-12-31T23:59:59.999', 'ms')
+
+#The first bytes of each file type
+XLS_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+XLSX_SIGNATURE = b'PK\x03\x04'
+
+logger = logging.getLogger('readers')
+
+
+class SheetReader(abc.ABC):
+    """Reads the shipment rows from an export file.
+    Every reader yields the same Row records with the same types, no matter what format the file is in.
+    The exports start with a title row followed by the header row, and end with a footer row. Neither the
+    title nor the footer are returned.
+    Every row is checked against the schema as it is read. Rows with problems are not returned, and once
+    the whole file has been read a FileFormatException listing all of them is raised.
+    """
+
+    def __init__(self, contents: bytes, timer=None):
+        """
+        Args:
+            contents (bytes): The contents of the file
+            timer (ImportTimer): Records how long it takes to open the workbook and convert the dates
+        """
+        self.contents = contents
+        self.timer = timer if timer is not None else ImportTimer(None)
+
+        #The first and last transaction dates (as ISO date strings) in the file. Readers that load the whole
+        #sheet know this before the first row is read, streaming readers only know it once every row has been read
+        self.date_range = None
+
+        #The dates seen so far by a streaming reader
+        self.seen_range = None
+
+        #The rows that failed the schema checks
+        self.problems = RowProblems()
+
+    @abc.abstractmethod
+    def read(self):
+        """Read the rows from the file
+
+        Yields:
+            Row: The next data row
+        """
+
+    @staticmethod
+    def header_indexes(keys):
+        """Find the column holding each Row field
+
+        Args:
+            keys (list): The values of the header row
+
+        Returns:
+            list: The column index of each of the ROW_HEADERS
+        """
+        keys = [str(k).strip() if k is not None else '' for k in keys]
+        missing = [h for h in ROW_HEADERS if h not in keys]
+        if missing:
+            raise FileFormatException("Sheet is missing the columns {}".format(missing))
+        return [keys.index(h) for h in ROW_HEADERS]
+
+    @staticmethod
+    def to_date(value):
+        """Check that a Transaction Date cell has already been converted to a datetime"""
+        if not isinstance(value, datetime.datetime):
+            raise ValueError(value)
+        return value
+
+    def track_date(self, dt):
+        """Widen seen_range to include a transaction date"""
+        day = dt.date().isoformat()
+        if self.seen_range is None:
+            self.seen_range = (day, day)
+        elif day < self.seen_range[0]:
+            self.seen_range = (day, self.seen_range[1])
+        elif day > self.seen_range[1]:
+            self.seen_range = (self.seen_range[0], day)
+
+
+class XlsReader(SheetReader):
+    """Reads the binary Excel 97-2003 .xls format with xlrd. Only the data sheet is loaded, and only
+    the columns of the Row fields are taken from it, a whole column at a time. The Transaction Date
+    column is converted in a single pass before any rows are returned
+    """
+
+    def read(self):
+        # Only the workbook globals are parsed here. The data sheet is parsed when it is asked for and the
+        # other sheets are never parsed at all
+        with self.timer.stage('open_workbook'):
+            book = open_workbook(file_contents=self.contents, on_demand=True)
+        self.contents = None
+        try:
+            columns = self.read_columns(book)
+            datemode = book.datemode
+        finally:
+            book.release_resources()
+
+        # Excel stores the date as a number. Convert the whole column back to datetimes in one pass
+        # rather than once per row
+        cells = columns[DATE_FIELD]
+        with self.timer.stage('dates'):
+            try:
+                dates, date_strings = xldates_as_datetimes(cells, datemode)
+            except FileFormatException:
+                # At least one cell is not a date. Convert them one at a time so every bad row can be reported
+                dates = [xldate_or_value(v, datemode) for v in cells]
+                date_strings = [d.date().isoformat() for d in dates if isinstance(d, datetime.datetime)]
+        if date_strings:
+            self.date_range = (min(date_strings), max(date_strings))
+        columns[DATE_FIELD] = dates
+
+        # The columns are already in Row order, so each row of values lines up with the fields
+        coerce = compile_row(range(len(ROW_HEADERS)), self.to_date, Row._make)
+        for number, values in enumerate(zip(*columns), 1):
+            record, problems = coerce(values)
+            if problems:
+                self.problems.add(number, problems)
+                continue
+            yield record
+        self.problems.check()
+
+    def read_columns(self, book):
+        """Take the data rows of each Row field's column from the data sheet, then unload the sheet
+
+        Returns:
+            list: The cells of each column in Row order, from row 2 through the end of the sheet (skipping
+                the trailing footer row)
+        """
+        try:
+            sheet = book.sheet_by_name(SHEET_NAME)
+        except XLRDError:
+            raise FileFormatException("Workbook has no sheet named '{}'".format(SHEET_NAME))
+
+        try:
+            # Rows and columns are indexed starting at 0.  Skip row 0 since this is a title row
+
+            # Pull the column names from row 1 and find where each of the Row fields lives
+            indexes = self.header_indexes(sheet.row_values(1))
+            end = max(2, sheet.nrows - 1)
+            return [sheet.col_values(index, 2, end) for index in indexes]
+        finally:
+            book.unload_sheet(SHEET_NAME)
+
+
+class XlsxReader(SheetReader):
+    """Reads the Excel 2007+ .xlsx format with openpyxl in read only mode. Rows are streamed from the
+    sheet XML as they are parsed so the workbook is never held in memory
+    """
+
+    def read(self):
+        with self.timer.stage('open_workbook'):
+            book = openpyxl.load_workbook(io.BytesIO(self.contents), read_only=True, data_only=True)
+        self.contents = None
+        try:
+            if SHEET_NAME not in book.sheetnames:
+                raise FileFormatException("Workbook has no sheet named '{}'".format(SHEET_NAME))
+            rows = (r for r in book[SHEET_NAME].iter_rows(values_only=True) if any(v is not None for v in r))
+
+            # Skip the title row then pull the column names from the header row
+            next(rows, None)
+            header = next(rows, None)
+            if header is None:
+                raise FileFormatException("Sheet has no header row")
+            indexes = self.header_indexes(header)
+
+            # The schema matches the types xlrd gives us. Blank cells are empty strings and every number is a float
+            epoch = book.epoch
+            coerce = compile_row(indexes, lambda v: self.to_datetime(v, epoch), Row._make)
+
+            # We don't know which row is the footer until the sheet runs out, so stay one row behind
+            previous = None
+            number = 0
+            for values in rows:
+                if previous is not None:
+                    number += 1
+                    record, problems = coerce(previous)
+                    if problems:
+                        self.problems.add(number, problems)
+                    else:
+                        self.track_date(record.transaction_date)
+                        yield record
+                previous = values
+            self.problems.check()
+            self.date_range = self.seen_range
+        finally:
+            book.close()
+
+    @staticmethod
+    def to_datetime(value, epoch):
+        """Cells formatted as dates come back as datetimes. Anything else is still an Excel serial"""
+        if isinstance(value, datetime.datetime):
+            return value
+        dt = from_excel(value, epoch)
+        if not isinstance(dt, datetime.datetime):
+            raise ValueError(value)
+        return dt
+
+
+class CsvReader(SheetReader):
+    """Reads a comma separated export. The title and footer rows are optional, the data starts after the
+    first row containing the column names and blank lines are skipped. The last row is taken as the footer
+    when it has no Transaction Date, every other row is checked against the schema
+    """
+
+    def read(self):
+        text = io.TextIOWrapper(io.BytesIO(self.contents), encoding='utf-8-sig', newline='')
+        self.contents = None
+        rows = csv.reader(text)
+
+        indexes = None
+        for values in rows:
+            if 'DC Id' in values:
+                indexes = self.header_indexes(values)
+                break
+        if indexes is None:
+            raise FileFormatException("File has no header row")
+
+        width = max(indexes) + 1
+        date_column = indexes[DATE_FIELD]
+        coerce = compile_row(indexes, parse_date, Row._make)
+
+        # We don't know whether the last row is the footer until the file runs out, so stay one row behind
+        previous = None
+        number = 0
+        for values in rows:
+            if not any(v.strip() for v in values):
+                continue
+            if previous is not None:
+                number += 1
+                yield from self.check_row(number, previous, width, coerce)
+            previous = values
+
+        if previous is not None:
+            if len(previous) < width or previous[date_column].strip() == '':
+                logger.debug("Skipping the footer row %s", previous)
+            else:
+                yield from self.check_row(number + 1, previous, width, coerce)
+        self.problems.check()
+        self.date_range = self.seen_range
+
+    def check_row(self, number, values, width, coerce):
+        """Convert a data row, recording its problems if it is not valid
+
+        Yields:
+            Row: The converted row if it is valid
+        """
+        if len(values) < width:
+            self.problems.add(number, ["Record has {0} columns, expected {1}".format(len(values), width)])
+            return
+        record, problems = coerce([v.strip() for v in values])
+        if problems:
+            self.problems.add(number, problems)
+            return
+        self.track_date(record.transaction_date)
+        yield record
+
+
+def open_reader(filename: str, contents: bytes, timer=None):
+    """Choose the reader for a file. The file signature is checked first, since exports are not always
+    saved with the right extension, then the extension
+
+    Args:
+        filename (str): The name of the file
+        contents (bytes): The contents of the file
+        timer (ImportTimer): Passed on to the reader
+
+    Returns:
+        SheetReader: The reader for the file
+    """
+    if contents.startswith(XLS_SIGNATURE):
+        reader = XlsReader
+    elif contents.startswith(XLSX_SIGNATURE):
+        reader = XlsxReader
+    else:
+        extension = os.path.splitext(filename)[1].lower()
+        if extension == '.csv':
+            reader = CsvReader
+        else:
+            raise FileFormatException("Unable to determine the format of file '{}'".format(filename))
+
+    logger.debug("Reading '%s' with %s", filename, reader.__name__)
+    return reader(contents, timer)
+
+
+def parse_date(value: str):
+    """Convert a CSV Transaction Date to a datetime. Dates may be written out or left as Excel serials
+
+    Raises:
+        FileFormatException: If the value is not a date
+    """
+    for fmt in CSV_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    try:
+        date = xldates_as_datetimes([float(value)], 0)[0][0]
+    except ValueError:
+        raise FileFormatException("Transaction Date column contains a value that is not a date: {}".format(value))
+    if not isinstance(date, datetime.datetime):
+        raise ValueError(value)
+    return date
+
+
+def xldate_or_value(value, datemode):
+    """Convert a single Excel date serial to a datetime. A value that is not a date is returned as is"""
+    try:
+        return xldates_as_datetimes([value], datemode)[0][0]
+    except FileFormatException:
+        return value
+
+
+def xldates_as_datetimes(values, datemode):
+    """Convert a column of Excel date serials to datetimes.
+    Gives the same results as calling xlrd.xldate_as_datetime() on each value, but the arithmetic
+    is done on the whole column at once
+
+    Args:
+        values (list): The Excel date serials, as returned by sheet.col_values()
+        datemode (int): The workbook datemode. 0 for the 1900 date system, 1 for the 1904 date system
+
+    Returns:
+        tuple: A list of datetime.datetime objects and a list of the matching ISO date strings (YYYY-MM-DD)
+    """
+    try:
+        serials = numpy.asarray(values, dtype=numpy.float64)
+    except ValueError as e:
+        raise FileFormatException("Transaction Date column contains a value that is not a date: {}".format(e))
+    if not numpy.isfinite(serials).all():
+        raise FileFormatException("Transaction Date column contains a value that is not a number")
+    if (serials < 0).any():
+        raise FileFormatException("Transaction Date column contains a negative date")
+    if (serials >= (LAST_DATE - EXCEL_EPOCHS[datemode]) / numpy.timedelta64(1, 'D')).any():
+        raise FileFormatException("Transaction Date column contains a date after the year 9999")
+
+    days = numpy.floor(serials)
+    millis = numpy.rint((serials - days) * 86400000.0).astype(numpy.int64)
+    days = days.astype(numpy.int64)
+    if datemode == 0:
+        # Serials before 60 are counted from 1899-12-31, ignoring the 1900-02-29 that Excel pretends exists
+        days += serials < 60
+
+    stamps = EXCEL_EPOCHS[datemode] + days.astype('timedelta64[D]') + millis.astype('timedelta64[ms]')
+    datetimes = stamps.astype('datetime64[us]').tolist()
+    strings = numpy.datetime_as_string(stamps, unit='D').tolist()
+    return datetimes, strings
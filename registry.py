@@ -3,7 +3,15 @@ import logging, winreg
 REGISTRY_KEY_NAME = 'SOFTWARE\\ContainerTracking'
 
 logger = logging.getLogger('registry')
-key = winreg.CreateKey(winreg.HKEY_LOCAL_MACHINE, REGISTRY_KEY_NAME)
+
+#Opened the first time it is needed, and again after close_key()
+key = None
+
+def open_key():
+    global key
+    if key is None:
+        key = winreg.CreateKey(winreg.HKEY_LOCAL_MACHINE, REGISTRY_KEY_NAME)
+    return key
 
 class Registry:
     @staticmethod
@@ -14,11 +22,11 @@ class Registry:
             name (str): The name of the value to write.
             val (str): The value to write.
         """
-        logger.debug("Checking for default value for '{0}'".format(name))
+        logger.debug("Checking for default value for '%s'", name)
         val = Registry.read_key(name, None)
-        logger.info("Found val '{}'".format(val))
+        logger.info("Found val '%s'", val)
         if val == None:
-            logger.info("Writing default value for '{0}': '{1}'".format(name, value))
+            logger.info("Writing default value for '%s': '%s'", name, value)
             Registry.write_key(name, value)
 
     @staticmethod
@@ -30,11 +38,11 @@ class Registry:
             val (str): The value to write.
 
         """
-        logger.info("Inserting value '{0}' into registry as 'HKLM\\{1}\{2}'".format(val, REGISTRY_KEY_NAME, name))
+        logger.info("Inserting value '%s' into registry as 'HKLM\\%s\%s'", val, REGISTRY_KEY_NAME, name)
         try:
-            winreg.SetValueEx(key, name, 0, winreg.REG_SZ, val)
+            winreg.SetValueEx(open_key(), name, 0, winreg.REG_SZ, val)
         except Exception as e:
-            logger.error("Unable to write value '{0}' to value name '{1}' in key 'HKLM\\{2}'".format(val, name, REGISTRY_KEY_NAME))
+            logger.error("Unable to write value '%s' to value name '%s' in key 'HKLM\\%s'", val, name, REGISTRY_KEY_NAME)
             logger.exception(e)
             raise e
 
@@ -52,17 +60,37 @@ class Registry:
         Returns:
             str: The value read from the registry or def_val
         """
-        logger.info("reading value for key '{}'".format(name))
+        logger.info("reading value for key '%s'", name)
         val = def_val
         try:
-            val = winreg.QueryValueEx(key, name)[0]
+            val = winreg.QueryValueEx(open_key(), name)[0]
         except FileNotFoundError as e:
-            logger.warning("Unable to read config option '{0}' from registry, using default value of '{1}'"
-                .format(name, def_val))
+            logger.warning("Unable to read config option '%s' from registry, using default value of '%s'",
+                name, def_val)
             Registry.write_key(name, val)
             
         return val
 
+    @staticmethod
+    def read_all():
+        """Read every value under the key in one pass
+
+        Returns:
+            dict: The value of each value name
+        """
+        values = {}
+        k = open_key()
+        for i in range(winreg.QueryInfoKey(k)[1]):
+            name, val, _ = winreg.EnumValue(k, i)
+            values[name] = val
+        logger.debug("Read %s values from 'HKLM\\%s'", len(values), REGISTRY_KEY_NAME)
+        return values
+
+    @staticmethod
+    def modified():
+        """The time any value under the key was last written, in 100 nanosecond intervals since 1601"""
+        return winreg.QueryInfoKey(open_key())[2]
+
     @staticmethod
     def write_default_opts():
         """Write default values to the Windows registry if they do not already exist    
@@ -71,8 +99,20 @@ class Registry:
         Registry.write_default('archive', "C:\import\\archive")
         Registry.write_default('errors', "C:\\import\\archive\\errors")
         Registry.write_default('database', "C:\\db\\database.accdb")
+        Registry.write_default('sink', "access")
         Registry.write_default('log_file', "C:\\db\\logs\\watcher.log")
+        Registry.write_default('workers', "0")
+        Registry.write_default('import_mode', "insert")
+        Registry.write_default('bulk_threshold', "0")
+        Registry.write_default('max_attempts', "8")
+        Registry.write_default('cache_size', "256")
+        Registry.write_default('routes', "")
+        Registry.write_default('archive_compression', "")
+        Registry.write_default('journal', "0")
 
     @staticmethod
     def close_key():
-        winreg.CloseKey(key)
\ No newline at end of file
+        global key
+        if key is not None:
+            winreg.CloseKey(key)
+            key = None
\ No newline at end of file
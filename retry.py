@@ -0,0 +1,149 @@
+import logging, os, random, threading, time
+
+from fingerprint import stat_key
+
+#The delay (in seconds) before the first retry of a file that failed with a recoverable error.
+#The delay doubles after every failed attempt up to RETRY_CAP
+RETRY_BASE = 60
+RETRY_CAP = 60 * 60
+
+#Each delay is shortened by a random fraction up to this much, so files that failed together are not
+#all retried at the same moment
+RETRY_JITTER = 0.5
+
+#The number of attempts made before a file is given up on and moved to the errors directory
+MAX_ATTEMPTS = 8
+
+logger = logging.getLogger('retry')
+
+
+class RetryState:
+    """What is known about a file that failed with a recoverable error"""
+
+    def __init__(self, path, key):
+        self.path = path
+
+        #The stat_key() of the file when it failed
+        self.key = key
+        self.attempts = 0
+        self.last_error = None
+        self.next_eligible = 0
+
+        #Set once the file has been handed back for its next attempt
+        self.queued = False
+
+    def __repr__(self):
+        return "RetryState({0!r}, attempts={1}, next_eligible={2:.0f}, last_error={3!r})".format(
+            self.path, self.attempts, self.next_eligible, self.last_error)
+
+
+class RetryScheduler:
+    """Decides when a file that failed with a recoverable error is attempted again.
+    Each failure pushes the next attempt further away with exponential backoff and jitter. A file
+    that has not changed since it failed is not read again until its next attempt is due, and a file
+    that keeps failing is given up on after max_attempts.
+    """
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base=RETRY_BASE, cap=RETRY_CAP, jitter=RETRY_JITTER):
+        """
+        Args:
+            max_attempts (int): The number of failed attempts before a file is given up on
+            base (float): The delay in seconds after the first failure
+            cap (float): The longest delay in seconds between attempts
+            jitter (float): The largest fraction each delay is randomly shortened by
+        """
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+        self.lock = threading.Lock()
+
+        # path -> RetryState
+        self.states = {}
+
+    def eligible(self, path: str):
+        """Check if a file should be attempted now. A file that has changed since it last failed is
+        always eligible, and its attempts are counted from zero again
+
+        Args:
+            path (str): The file to check
+
+        Returns:
+            bool: True if the file should be imported now
+        """
+        with self.lock:
+            state = self.states.get(path)
+            if state is None:
+                return True
+
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.states[path]
+                return True
+
+            if stat_key(st) != state.key:
+                logger.debug("'%s' has changed since it last failed", path)
+                del self.states[path]
+                return True
+            return time.time() >= state.next_eligible
+
+    def failed(self, path: str, error: str):
+        """Record a failed attempt and schedule the next one
+
+        Args:
+            path (str): The file that failed
+            error (str): A description of the error
+
+        Returns:
+            bool: True if the file has used up its attempts and should be given up on
+        """
+        try:
+            key = stat_key(os.stat(path))
+        except OSError:
+            key = None
+
+        with self.lock:
+            state = self.states.get(path)
+            if state is None or state.key != key:
+                state = self.states[path] = RetryState(path, key)
+            state.attempts += 1
+            state.last_error = error
+            state.queued = False
+
+            if state.attempts >= self.max_attempts:
+                del self.states[path]
+                logger.error("'%s' failed %s times. Giving up", path, state.attempts)
+                return True
+
+            delay = min(self.cap, self.base * 2 ** (state.attempts - 1))
+            delay *= 1 - random.uniform(0, self.jitter)
+            state.next_eligible = time.time() + delay
+        logger.info("Attempt %s of %s for '%s' failed. Trying again in %.0f seconds",
+            state.attempts, self.max_attempts, path, delay)
+        return False
+
+    def forget(self, path: str):
+        """Stop tracking a file once it has been imported or moved away"""
+        with self.lock:
+            self.states.pop(path, None)
+
+    def due(self):
+        """The files whose next attempt has become due. Each file is only returned once per attempt
+
+        Returns:
+            list: The paths to attempt again
+        """
+        now = time.time()
+        due = []
+        with self.lock:
+            for state in self.states.values():
+                if not state.queued and state.next_eligible <= now:
+                    state.queued = True
+                    due.append(state.path)
+        return due
+
+    def waiting(self):
+        """The number of files waiting to be retried"""
+        with self.lock:
+            return len(self.states)
@@ -0,0 +1,109 @@
+import logging, os
+
+from importer import TABLE_NAME
+from pipeline import Pipeline
+from sinks import SINKS
+
+logger = logging.getLogger('routes')
+
+
+class Route:
+    """A watched directory and where the files found in it are imported to.
+    Every route has its own database connections and its own writer thread, so a slow or locked
+    database only holds up the files of its own route.
+    """
+
+    def __init__(self, name: str, watch: str, database: str, archive: str, errors: str, table=TABLE_NAME,
+            sink='access'):
+        """
+        Args:
+            name (str): The name of the route, used in the log
+            watch (str): The directory to watch for new files
+            database (str): The database the files are imported into. A file path for Access and SQLite,
+                a connection string for PostgreSQL
+            archive (str): The directory imported files are moved to
+            errors (str): The directory files that could not be imported are moved to
+            table (str): The table the rows are written to
+            sink (str): The name of the kind of database, one of SINKS
+        """
+        self.name = name
+        self.watch = watch
+        self.database = database
+        self.archive = archive
+        self.errors = errors
+        self.table = table
+
+        #None if the sink name is not known. The integrity tests stop the service before the route is started
+        self.sink_name = sink
+        self.sink = SINKS[sink](database) if sink in SINKS else None
+
+        #The database connections and the writer are created when the route starts
+        self.pool = None
+        self.pipeline = None
+
+    def __repr__(self):
+        return "Route({0!r}, watch={1!r}, sink={2!r}, database={3!r}, table={4!r}, archive={5!r}, errors={6!r})".format(
+            self.name, self.watch, self.sink_name, self.database, self.table, self.archive, self.errors)
+
+    def start(self, write, parsers=None, history=None, cache=None, priority=None):
+        """Open the database connections and start the writer
+
+        Args:
+            write: Called from the writer thread as write(path, route, future) for each file
+            parsers (ParserPool): The processes that parse the files of every route. If None the files
+                are parsed by the writer thread
+            history (ImportHistory): Passed to the parser processes to reject files that were already imported
+            cache (RowCache): Passed to the parser processes so files that failed earlier are not parsed again
+            priority: Orders the files waiting on the route, see Pipeline. If None they are written in the order found
+        """
+        self.pool = self.sink.pool()
+        self.pool.warm()
+        self.pipeline = Pipeline(lambda path, parsed: write(path, self, parsed), parsers, history, cache,
+            name='route-{}'.format(self.name), priority=priority)
+
+    def stop(self):
+        """Let the writer finish the current file then close the database connections"""
+        if self.pipeline is not None:
+            self.pipeline.close()
+        if self.pool is not None:
+            self.pool.close()
+
+    def owns(self, path: str):
+        """Check if a file is in this route's watched directory"""
+        return same_directory(os.path.dirname(path), self.watch)
+
+
+def same_directory(a: str, b: str):
+    return os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+
+def read_routes(read_key, defaults):
+    """Build the routes from the configuration.
+    The 'routes' option lists the route names separated by commas. Each route reads its settings from
+    the options '<name>.watch', '<name>.sink', '<name>.database', '<name>.table', '<name>.archive' and
+    '<name>.errors'.
+    Any setting that is not given falls back to the matching top level option. When no routes are
+    listed there is a single route built from the top level options
+
+    Args:
+        read_key: Called as read_key(name, default) to read an option
+        defaults: The top level watch, sink, database, archive and errors options
+
+    Returns:
+        list: The configured Routes
+    """
+    names = [n.strip() for n in read_key('routes', "").split(',') if n.strip()]
+    if not names:
+        return [Route('default', defaults.watch, defaults.database, defaults.archive, defaults.errors,
+            sink=defaults.sink)]
+
+    routes = []
+    for name in names:
+        routes.append(Route(name,
+            read_key('{}.watch'.format(name), defaults.watch),
+            read_key('{}.database'.format(name), defaults.database),
+            read_key('{}.archive'.format(name), defaults.archive),
+            read_key('{}.errors'.format(name), defaults.errors),
+            read_key('{}.table'.format(name), TABLE_NAME),
+            read_key('{}.sink'.format(name), defaults.sink)))
+    return routes
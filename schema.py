@@ -0,0 +1,135 @@
+import logging
+from collections import namedtuple
+
+from exceptions import FileFormatException
+
+#How a Row field is checked and converted.
+#  kind:     'number', 'text' or 'date'
+#  required: A blank value is an error
+Field = namedtuple('Field', ['name', 'header', 'kind', 'required'])
+
+#One Field for each Row field, in Row order
+SCHEMA = [
+    Field('dc_id', 'DC Id', 'number', True),
+    Field('dc_name', 'DC Name', 'text', False),
+    Field('store_id', 'Store Id', 'text', True),
+    Field('store_name', 'Store Name', 'text', False),
+    Field('address', 'Address', 'text', False),
+    Field('city', 'City', 'text', False),
+    Field('state', 'State', 'text', False),
+    Field('zip', 'Zip', 'text', True),
+    Field('transaction_date', 'Transaction Date', 'date', True),
+    Field('container_type', 'Container Type', 'text', True),
+    Field('container_qty', 'Container Qty', 'number', True),
+]
+
+#The number of bad records listed in the exception message. Every bad record is logged
+MAX_REPORTED = 20
+
+logger = logging.getLogger('schema')
+
+
+def to_float(value):
+    """Numbers are floats, the same as Excel gives us. Blank cells are empty strings
+
+    Raises:
+        ValueError: If the value is not a number
+    """
+    if type(value) is float:
+        return value
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        value = value.strip()
+        return float(value) if value != '' else ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    raise ValueError(value)
+
+
+def to_text(value):
+    """Text cells are passed through. Blank cells are empty strings and whole numbers become floats,
+    the same as xlrd gives us"""
+    if value is None:
+        return ''
+    if type(value) is int:
+        return float(value)
+    return value
+
+
+CONVERTERS = {
+    'number': to_float,
+    'text': to_text,
+}
+
+
+def compile_row(indexes, to_date, make, schema=SCHEMA):
+    """Build the function that turns the cells of a sheet row into a Row. The column of each field is
+    looked up once here instead of once per row
+
+    Args:
+        indexes (list): The column index of each field, as found from the header row
+        to_date: Converts a Transaction Date cell to a datetime. Raises ValueError or FileFormatException
+            if the cell is not a date
+        make: Builds a Row from the list of converted values
+        schema (list): The Field for each Row field
+
+    Returns:
+        function: Called as coerce(values) with the cells of a row. Returns the Row and a list of the
+            problems found with it
+    """
+    steps = tuple(
+        (index, to_date if field.kind == 'date' else CONVERTERS[field.kind], field)
+        for field, index in zip(schema, indexes)
+    )
+
+    def coerce(values):
+        width = len(values)
+        record = []
+        problems = None
+        for index, convert, field in steps:
+            value = values[index] if index < width else None
+            try:
+                value = convert(value)
+            except (ValueError, TypeError, OverflowError, FileFormatException):
+                problems = problems or []
+                problems.append("{0} '{1}' is not a {2}".format(field.header, value, field.kind))
+            else:
+                if field.required and value == '':
+                    problems = problems or []
+                    problems.append("{0} is blank".format(field.header))
+            record.append(value)
+        return make(record), problems
+    return coerce
+
+
+class RowProblems:
+    """Collects the problems found with the rows of a file so they can all be reported together"""
+
+    def __init__(self):
+        self.records = []
+
+    def add(self, number, problems):
+        """Record the problems with a row
+
+        Args:
+            number (int): The position of the row in the file, starting at 1 for the first data row
+            problems (list): The problems returned by the coerce() function
+        """
+        self.records.append((number, problems))
+
+    def check(self):
+        """Raise an error listing every row with a problem
+
+        Raises:
+            FileFormatException: If any row had a problem
+        """
+        if not self.records:
+            return
+        for number, problems in self.records:
+            logger.info("Record %s: %s", number, "; ".join(problems))
+
+        listed = ["record {0}: {1}".format(n, "; ".join(p)) for n, p in self.records[:MAX_REPORTED]]
+        more = len(self.records) - len(listed)
+        raise FileFormatException("{0} records are not valid. {1}{2}".format(
+            len(self.records), ", ".join(listed), " and {} more".format(more) if more > 0 else ""))
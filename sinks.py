@@ -0,0 +1,274 @@
+import abc, csv, logging, os, re, sqlite3
+
+from connections import ConnectionPool, POOL_SIZE
+from readers import ROW_HEADERS
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+#The column names of the table, in ROW_HEADERS order
+TABLE_COLUMNS = ['DC ID', 'DC Name', 'Store ID', 'Store Name', 'Address', 'City', 'State', 'Zip',
+    'Transaction Date', 'Container Type', 'Container Qty']
+
+#The ODBC driver used to open Access databases. It can read both .mdb and .accdb files
+ACCESS_DRIVER = 'Microsoft Access Driver (*.mdb, *.accdb)'
+
+#Matches the SQLSTATE codes pyodbc reports when the connection to the database has failed
+CONNECTION_ERROR_PATTERN = re.compile("^0800[12347]$")
+
+ACCESS_LOAD_SQL = ("INSERT INTO [{table}] ({columns}) SELECT {staged} "
+    "FROM [Text;FMT=Delimited;HDR=Yes;CharacterSet=65001;DATABASE={directory}].[{name}]")
+
+SQLITE_STAGE_SQL = "CREATE TEMP TABLE [staged_rows] ({columns})"
+SQLITE_LOAD_SQL = "INSERT INTO [{table}] ({columns}) SELECT {staged} FROM [staged_rows]"
+
+POSTGRESQL_COPY_SQL = "COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)"
+
+logger = logging.getLogger('sinks')
+
+
+class Sink(abc.ABC):
+    """A database the imported rows are written to.
+    The Importer writes its SQL with bracket quoted names and qmark parameters, which Access and
+    SQLite understand as is. Each sink translates the statements to its own dialect, says which of
+    its driver's errors are worth retrying and loads staged files through its own bulk path.
+    """
+
+    #The name the sink is selected by in the configuration
+    name = None
+
+    #Whether the driver handles pyodbc parameter arrays (fast_executemany) correctly. Rows are sent one
+    #parameter set at a time unless the sink says so
+    supports_fast_executemany = False
+
+    def __init__(self, database: str):
+        """
+        Args:
+            database (str): Where to connect to. A file path for Access and SQLite, a connection string for PostgreSQL
+        """
+        self.database = database
+
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, self.database)
+
+    @property
+    @abc.abstractmethod
+    def errors(self):
+        """The exception class raised by the driver"""
+
+    @staticmethod
+    def check_driver():
+        """Check that the driver this sink needs is installed
+
+        Returns:
+            str: A description of the problem, or None if the driver is available
+        """
+        return None
+
+    def check_database(self):
+        """Check that the database can be found
+
+        Returns:
+            str: A description of the problem, or None if the database exists
+        """
+        if not os.path.exists(self.database) or not os.path.isfile(self.database):
+            return "The database file '{0}' does not exist".format(self.database)
+        return None
+
+    @abc.abstractmethod
+    def connect(self):
+        """Open a new DB-API connection to the database"""
+
+    def pool(self, size=POOL_SIZE):
+        """Create a pool of connections to the database"""
+        return ConnectionPool(self.connect, size, is_connection_error=self.is_connection_error)
+
+    def sql(self, statement: str):
+        """Translate a statement written with bracket quoted names and qmark parameters"""
+        return statement
+
+    def error_code(self, e: Exception):
+        """The SQLSTATE of an error raised by the driver. '23000' for a constraint violation and
+        'HY000' for a general error that may go away if the import is attempted again"""
+        return None
+
+    def is_connection_error(self, e: Exception):
+        """Returns true if the exception was caused by a lost or failed database connection"""
+        return False
+
+    @abc.abstractmethod
+    def bulk_load(self, cursor, staged, table: str):
+        """Insert the rows of a staged file into the table with the sink's bulk path
+
+        Args:
+            cursor: A cursor on the connection to load with
+            staged (StagedRows): The staged rows. The file has been closed
+            table (str): The table to insert into
+
+        Returns:
+            int: The number of rows the database reports were inserted, or -1 if it does not say
+        """
+
+
+class AccessSink(Sink):
+    """An Access database file opened through the ACE ODBC driver with pyodbc"""
+
+    name = 'access'
+
+    #The ACE driver truncates and mangles values sent as parameter arrays
+    supports_fast_executemany = False
+
+    @property
+    def errors(self):
+        return pyodbc.Error if pyodbc is not None else ()
+
+    @staticmethod
+    def check_driver():
+        # Microsoft has two main versions. A old driver that can only access .mdb
+        # databases, and a newer driver that can read .mdb and .accdb databases.
+        if pyodbc is None:
+            return 'The pyodbc package is not installed'
+        drivers = [x for x in pyodbc.drivers() if x.startswith('Microsoft Access Driver')]
+        if len(drivers) == 0:
+            return 'Unable to find any Access database drivers installed'
+        elif ACCESS_DRIVER not in drivers:
+            #We have at least one Access driver installed, but it is the older version
+            return 'Unable to find the updated MS Access database driver'
+        return None
+
+    def connect(self):
+        conn_str = access_connection_string(self.database)
+        logger.debug("Connection string: '%s'", conn_str)
+        return pyodbc.connect(conn_str)
+
+    def error_code(self, e):
+        return str(e.args[0]) if len(e.args) > 0 else None
+
+    def is_connection_error(self, e):
+        return (pyodbc is not None and isinstance(e, pyodbc.Error) and len(e.args) > 0
+            and CONNECTION_ERROR_PATTERN.match(str(e.args[0])) is not None)
+
+    def bulk_load(self, cursor, staged, table):
+        # The Access text driver reads the staged file directly, typed by the schema.ini next to it
+        cursor.execute(ACCESS_LOAD_SQL.format(table=table, columns=column_list(TABLE_COLUMNS),
+            staged=column_list(ROW_HEADERS), directory=staged.directory, name=staged.name.replace('.', '#')))
+        return cursor.rowcount
+
+
+class SQLiteSink(Sink):
+    """A local SQLite database file. Needs nothing beyond the standard library, so the whole service can
+    run against it on any platform"""
+
+    name = 'sqlite'
+
+    @property
+    def errors(self):
+        return sqlite3.Error
+
+    def connect(self):
+        # Connections are shared between the writer threads through the pool
+        return sqlite3.connect(self.database, timeout=30, check_same_thread=False)
+
+    def error_code(self, e):
+        if isinstance(e, sqlite3.IntegrityError):
+            return '23000'
+        if isinstance(e, sqlite3.OperationalError):
+            # The database is locked or busy
+            return 'HY000'
+        return None
+
+    def bulk_load(self, cursor, staged, table):
+        # SQLite cannot read a delimited file from SQL. Load the file into a temporary table
+        # then insert from that in one statement
+        staged_columns = column_list(ROW_HEADERS)
+        cursor.execute("DROP TABLE IF EXISTS temp.[staged_rows]")
+        cursor.execute(SQLITE_STAGE_SQL.format(columns=staged_columns))
+        with open(staged.path, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader)
+            cursor.executemany("INSERT INTO [staged_rows] VALUES ({})".format(", ".join("?" * len(ROW_HEADERS))),
+                reader)
+        cursor.execute(SQLITE_LOAD_SQL.format(table=table, columns=column_list(TABLE_COLUMNS), staged=staged_columns))
+        count = cursor.rowcount
+        cursor.execute("DROP TABLE temp.[staged_rows]")
+        return count
+
+
+class PostgreSQLSink(Sink):
+    """A PostgreSQL database reached with psycopg2. The database is a libpq connection string,
+    i.e. 'host=db1 dbname=shipments user=importer'. Staged files are loaded with COPY"""
+
+    name = 'postgresql'
+
+    @property
+    def errors(self):
+        return psycopg2.Error if psycopg2 is not None else ()
+
+    @staticmethod
+    def check_driver():
+        if psycopg2 is None:
+            return 'The psycopg2 package is not installed'
+        return None
+
+    def check_database(self):
+        # There is no file to look for. The connection is tested when the service starts
+        return None
+
+    def connect(self):
+        return psycopg2.connect(self.database)
+
+    def sql(self, statement):
+        return re.sub(r'\[([^\]]+)\]', r'"\1"', statement).replace('?', '%s')
+
+    def error_code(self, e):
+        code = getattr(e, 'pgcode', None)
+        if code is None:
+            return None
+        if code.startswith('23'):
+            return '23000'
+        if code.startswith('40') or code.startswith('55'):
+            # Serialization failures, deadlocks and lock timeouts
+            return 'HY000'
+        return code
+
+    def is_connection_error(self, e):
+        return (psycopg2 is not None and isinstance(e, psycopg2.OperationalError)
+            and (getattr(e, 'pgcode', None) is None or e.pgcode.startswith('08')))
+
+    def bulk_load(self, cursor, staged, table):
+        sql = POSTGRESQL_COPY_SQL.format(table=self.sql("[{}]".format(table)),
+            columns=self.sql(column_list(TABLE_COLUMNS)))
+        with open(staged.path, encoding='utf-8') as f:
+            cursor.copy_expert(sql, f)
+        return cursor.rowcount
+
+
+#The sinks that can be chosen in the configuration, by name
+SINKS = {cls.name: cls for cls in (AccessSink, SQLiteSink, PostgreSQLSink)}
+
+
+def make_sink(name: str, database: str):
+    """Create the sink chosen in the configuration
+
+    Raises:
+        ValueError: If there is no sink with that name
+    """
+    if name not in SINKS:
+        raise ValueError("Unknown sink '{0}'. Choose one of {1}".format(name, list(SINKS)))
+    return SINKS[name](database)
+
+
+def access_connection_string(database: str):
+    """Build the ODBC connection string for an Access database file"""
+    return rf'Driver={{{ACCESS_DRIVER}}};DBQ={database};'
+
+
+def column_list(names):
+    return ", ".join("[{}]".format(n) for n in names)
@@ -0,0 +1,67 @@
+import csv, os, sqlite3, sys
+from contextlib import closing
+
+import pytest
+
+# The service modules live at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from readers import ROW_HEADERS
+
+TABLE_SQL = ("CREATE TABLE [WeeklyShipments] ([DC ID] REAL, [DC Name] TEXT, [Store ID] TEXT, [Store Name] TEXT, "
+    "[Address] TEXT, [City] TEXT, [State] TEXT, [Zip] TEXT, [Transaction Date] TIMESTAMP, [Container Type] TEXT, "
+    "[Container Qty] REAL, PRIMARY KEY ([DC ID], [Store ID], [Transaction Date], [Container Type]))")
+
+
+def make_rows(count, first_store=1000, date='06/14/2020', qty=None):
+    """The cells of export rows for DC 7, each for its own store
+
+    Args:
+        count (int): The number of rows
+        first_store (int): The store of the first row, the rest follow on from it
+        date (str): The Transaction Date of every row
+        qty: The Container Qty of every row. If None each row has its own
+
+    Returns:
+        list: The cells of each row, in ROW_HEADERS order
+    """
+    return [[7, 'MDV - Mobile', first_store + i, 'STORE {}'.format(first_store + i), '100 MAIN ST', 'MOBILE', 'AL',
+        '36602', date, 'CP', qty if qty is not None else i + 1] for i in range(count)]
+
+
+def write_export(path, rows, footer=True):
+    """Write a CSV export with the title and header rows, the given data rows and a footer row"""
+    with open(str(path), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Weekly Tracked Pallets Shipped'])
+        writer.writerow(ROW_HEADERS)
+        writer.writerows(rows)
+        if footer:
+            writer.writerow(['Total'] + [''] * (len(ROW_HEADERS) - 1))
+    return str(path)
+
+
+def count_rows(database):
+    with closing(sqlite3.connect(database)) as conn:
+        return conn.execute("SELECT COUNT(*) FROM [WeeklyShipments]").fetchone()[0]
+
+
+def block_store(database, store):
+    """Insert a row with the same key as the make_rows() row for a store, so a batch holding it fails"""
+    with closing(sqlite3.connect(database)) as conn, conn:
+        conn.execute("INSERT INTO [WeeklyShipments] VALUES (7, 'MDV - Mobile', ?, '', '', '', '', '', ?, 'CP', 0)",
+            (str(store), '2020-06-14 00:00:00'))
+
+
+def unblock_store(database, store):
+    with closing(sqlite3.connect(database)) as conn, conn:
+        conn.execute("DELETE FROM [WeeklyShipments] WHERE [Store ID] = ? AND [Container Qty] = 0", (str(store),))
+
+
+@pytest.fixture
+def database(tmp_path):
+    """An empty SQLite database with the WeeklyShipments table"""
+    path = str(tmp_path / 'shipments.sqlite')
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute(TABLE_SQL)
+    return path
@@ -0,0 +1,67 @@
+import os, time
+
+import pytest
+
+import archive
+from archive import Archiver
+
+
+@pytest.fixture
+def archiver(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, 'COPY_RETRY_SECONDS', 0)
+    archiver = Archiver(str(tmp_path / 'imports.sqlite'), compression='gzip')
+    yield archiver
+    archiver.close()
+
+
+def wait_for(condition, timeout=10):
+    """Wait for the background copies to reach a state"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def make_file(directory, name):
+    os.makedirs(str(directory), exist_ok=True)
+    path = directory / name
+    path.write_text('contents')
+    return str(path)
+
+
+def test_recover_counts_only_restarted_moves(tmp_path):
+    interrupted = Archiver(str(tmp_path / 'imports.sqlite'))
+    archived = tmp_path / 'archive'
+    archived.mkdir()
+    source = make_file(tmp_path / 'watch', 'first.csv')
+    interrupted.begin(source, str(archived / 'first.csv.1'), '')
+    # This move finished but was not marked as finished
+    interrupted.begin(str(tmp_path / 'watch' / 'second.csv'), str(archived / 'second.csv.1'), '')
+    interrupted.close()
+
+    archiver = Archiver(str(tmp_path / 'imports.sqlite'))
+    assert archiver.recover() == 1
+    archiver.close()
+
+    assert os.listdir(str(archived)) == ['first.csv.1']
+    assert archiver.depth() == 0
+
+
+def test_failed_copy_is_kept_and_retried(tmp_path, archiver):
+    source = make_file(tmp_path / 'watch', 'export.csv')
+    directory = tmp_path / 'archive'
+
+    # The archive directory does not exist yet, so every attempt fails
+    archiver.archive(source, str(directory))
+    wait_for(lambda: archiver.failures() == 1)
+
+    assert archiver.is_pending(source)
+    assert os.path.exists(source)
+
+    directory.mkdir()
+    assert archiver.retry_failed() == 1
+    wait_for(lambda: not archiver.is_pending(source))
+
+    assert archiver.failures() == 0
+    assert not os.path.exists(source)
+    assert [name.endswith('.gz') for name in os.listdir(str(directory))] == [True]
@@ -0,0 +1,103 @@
+import logging, sqlite3
+
+import pytest
+
+from conftest import make_rows, write_export, count_rows, block_store
+from importer import Importer
+from sinks import Sink, SQLiteSink, AccessSink
+
+ROWS = 25
+BATCH_SIZE = 10
+
+
+class CountingConnection:
+    """Passes everything through to a SQLite connection, counting the commits"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+        self.conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+@pytest.fixture
+def export(tmp_path):
+    return write_export(tmp_path / 'export.csv', make_rows(ROWS))
+
+
+def import_export(database, export, **kwargs):
+    conn = CountingConnection(sqlite3.connect(database))
+    importer = Importer(database, export, connection=conn, batch_size=BATCH_SIZE, sink=SQLiteSink(database), **kwargs)
+    try:
+        importer.begin_import()
+    finally:
+        conn.close()
+    return importer, conn
+
+
+def test_file_is_committed_once(export, database):
+    importer, conn = import_export(database, export)
+
+    assert importer.rows_written == ROWS
+    assert conn.commits == 1
+    assert count_rows(database) == ROWS
+
+
+def test_each_batch_is_committed(export, database):
+    importer, conn = import_export(database, export, commit_each_batch=True)
+
+    # Three batches, then the commit at the end of the file
+    assert conn.commits == 4
+    assert count_rows(database) == ROWS
+
+
+def test_failing_row_is_reported_and_file_rolled_back(export, database, caplog):
+    block_store(database, 1014)
+
+    with caplog.at_level(logging.ERROR, logger='importer'):
+        with pytest.raises(sqlite3.IntegrityError):
+            import_export(database, export)
+
+    messages = [r.getMessage() for r in caplog.records if r.name == 'importer']
+    assert any(m.startswith("Error importing record 15: UNIQUE constraint failed") for m in messages)
+    assert any("store_id='1014'" in m for m in messages)
+    # Only the blocking row is left, the first batch was rolled back with the rest of the file
+    assert count_rows(database) == 1
+
+
+class ArrayCursor:
+    """A SQLite cursor with the fast_executemany attribute of a pyodbc cursor"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.fast_executemany = False
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class ArrayConnection(CountingConnection):
+    def cursor(self):
+        self.last_cursor = ArrayCursor(self.conn.cursor())
+        return self.last_cursor
+
+
+class ArraySink(SQLiteSink):
+    supports_fast_executemany = True
+
+
+@pytest.mark.parametrize('sink, enabled', [(SQLiteSink, False), (ArraySink, True)])
+def test_fast_executemany_only_for_sinks_that_support_it(export, database, sink, enabled):
+    conn = ArrayConnection(sqlite3.connect(database))
+    try:
+        Importer(database, export, connection=conn, sink=sink(database)).begin_import()
+    finally:
+        conn.close()
+
+    assert conn.last_cursor.fast_executemany is enabled
+    assert not AccessSink.supports_fast_executemany
@@ -0,0 +1,85 @@
+import pytest
+
+from conftest import make_rows, write_export, count_rows
+from importer import Importer
+from sinks import SQLiteSink
+
+ROWS = 25
+BATCH_SIZE = 10
+BULK_THRESHOLD = 20
+
+
+class CountingSink(SQLiteSink):
+    """Counts the bulk loads"""
+
+    def __init__(self, database):
+        super().__init__(database)
+        self.loads = 0
+
+    def bulk_load(self, cursor, staged, table):
+        self.loads += 1
+        return super().bulk_load(cursor, staged, table)
+
+
+class MiscountingSink(CountingSink):
+    """Inserts the staged rows but reports one fewer than it inserted"""
+
+    def bulk_load(self, cursor, staged, table):
+        return super().bulk_load(cursor, staged, table) - 1
+
+
+@pytest.fixture
+def export(tmp_path):
+    return write_export(tmp_path / 'export.csv', make_rows(ROWS))
+
+
+def make_importer(database, export, sink, **kwargs):
+    return Importer(database, export, batch_size=BATCH_SIZE, bulk_threshold=BULK_THRESHOLD, sink=sink, **kwargs)
+
+
+def test_bulk_load_writes_every_row(export, database):
+    sink = CountingSink(database)
+    importer = make_importer(database, export, sink)
+
+    importer.begin_import()
+
+    assert sink.loads == 1
+    assert importer.rows_written == ROWS
+    assert count_rows(database) == ROWS
+
+
+def test_miscounted_bulk_load_is_retried_in_batches(export, database):
+    sink = MiscountingSink(database)
+    importer = make_importer(database, export, sink)
+
+    importer.begin_import()
+
+    assert sink.loads == 1
+    assert importer.rows_written == ROWS
+    assert importer.rows_skipped == 0
+    assert count_rows(database) == ROWS
+
+
+def test_miscounted_bulk_load_reads_streamed_file_again(export, database):
+    sink = MiscountingSink(database)
+    importer = make_importer(database, export, sink)
+
+    # The rows are streamed from the file, so the batched retry has to read it again
+    importer.insert_rows(importer.import_data())
+
+    assert sink.loads == 1
+    assert importer.rows_written == ROWS
+    assert count_rows(database) == ROWS
+
+
+def test_miscounted_delta_bulk_load_counts_rows_once(tmp_path, export, database):
+    make_importer(database, write_export(tmp_path / 'first.csv', make_rows(BATCH_SIZE)), SQLiteSink(database)).begin_import()
+    sink = MiscountingSink(database)
+    importer = make_importer(database, export, sink, mode='delta')
+
+    importer.begin_import()
+
+    assert sink.loads == 1
+    assert importer.rows_written == ROWS - BATCH_SIZE
+    assert importer.rows_skipped == BATCH_SIZE
+    assert count_rows(database) == ROWS
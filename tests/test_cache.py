@@ -0,0 +1,113 @@
+import datetime, os, sqlite3
+
+import pytest
+
+from cache import RowCache
+from conftest import make_rows, write_export, count_rows, block_store
+from importer import Importer
+from readers import Row
+from sinks import SQLiteSink
+
+SHA1 = 'da39a3ee5e6b4b0d3255bfef95601890afd80709'
+DATE_RANGE = ('2020-06-14', '2020-06-15')
+
+
+def make_records(count):
+    return [Row(7.0, 'MDV - Mobile', str(1000 + i), 'STORE', '100 MAIN ST', 'MOBILE', 'AL', '36602',
+        datetime.datetime(2020, 6, 14 + i % 2), 'CP', float(i + 1)) for i in range(count)]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RowCache(str(tmp_path / 'cache'))
+
+
+def test_rows_are_read_back(cache):
+    rows = make_records(2500)
+
+    assert cache.put(SHA1, rows, DATE_RANGE)
+    count, date_range, cached = cache.get(SHA1)
+
+    assert (count, date_range) == (2500, DATE_RANGE)
+    assert list(cached) == rows
+    assert cache.dates(SHA1) == DATE_RANGE
+
+
+def test_column_mixing_types_is_read_back(cache):
+    rows = make_records(3)
+    rows[1] = rows[1]._replace(zip=36602.0)
+    rows[2] = rows[2]._replace(zip=None)
+
+    cache.put(SHA1, rows, DATE_RANGE)
+
+    assert list(cache.get(SHA1)[2]) == rows
+
+
+def test_column_holding_other_types_is_not_cached(cache):
+    rows = make_records(2)
+    rows[0] = rows[0]._replace(container_qty=3)
+
+    assert not cache.put(SHA1, rows, DATE_RANGE)
+    assert cache.get(SHA1) is None
+
+
+def test_discarded_file_is_gone(cache):
+    cache.put(SHA1, make_records(2), DATE_RANGE)
+
+    cache.discard(SHA1)
+
+    assert cache.get(SHA1) is None
+    assert cache.dates(SHA1) is None
+
+
+def test_unreadable_entry_is_discarded(cache):
+    cache.put(SHA1, make_records(2), DATE_RANGE)
+    os.remove(os.path.join(cache.entry(SHA1), 'meta.json'))
+
+    assert cache.get(SHA1) is None
+    assert not os.path.exists(cache.entry(SHA1))
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    first, second = 'a' * 40, 'b' * 40
+    cache.put(first, make_records(100), DATE_RANGE)
+    os.utime(cache.entry(first), (0, 0))
+    cache.put(second, make_records(100), DATE_RANGE)
+
+    size = sum(f.stat().st_size for f in os.scandir(cache.entry(second)))
+    cache.max_bytes = size
+    cache.evict()
+
+    assert cache.get(first) is None
+    assert cache.get(second) is not None
+
+
+@pytest.fixture
+def export(tmp_path):
+    return write_export(tmp_path / 'export.csv', make_rows(5))
+
+
+def test_rows_are_cached_when_database_can_not_be_written(cache, export, database):
+    # A table that does not exist fails the import with an OperationalError, which is retried
+    importer = Importer(database, export, sink=SQLiteSink(database), cache=cache, table='Missing')
+    with pytest.raises(sqlite3.OperationalError):
+        importer.begin_import()
+    assert cache.get(importer.digest)[0] == 5
+
+    importer = Importer(database, export, sink=SQLiteSink(database), cache=cache)
+    # The second attempt takes the rows from the cache instead of reading the file
+    importer.import_data = None
+    importer.begin_import()
+
+    assert count_rows(database) == 5
+    assert cache.get(importer.digest) is None
+
+
+def test_rows_are_not_cached_when_a_row_is_rejected(cache, export, database):
+    block_store(database, 1002)
+
+    importer = Importer(database, export, sink=SQLiteSink(database), cache=cache)
+    with pytest.raises(sqlite3.IntegrityError):
+        importer.begin_import()
+
+    assert cache.get(importer.digest) is None
@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+from connections import ConnectionPool
+from sinks import SQLiteSink
+
+
+@pytest.fixture
+def pool(database):
+    pool = SQLiteSink(database).pool()
+    yield pool
+    pool.close()
+
+
+def test_idle_connection_is_reused(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+
+    assert pool.acquire() is conn
+
+
+def test_dropped_connection_is_replaced(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+
+    # The connection goes bad while it is idle in the pool
+    conn.close()
+    replacement = pool.acquire()
+
+    assert replacement is not conn
+    assert replacement.execute("SELECT COUNT(*) FROM [WeeklyShipments]").fetchone() == (0,)
+
+
+def test_connection_lost_during_import_is_not_reused(database):
+    pool = ConnectionPool(lambda: sqlite3.connect(database), is_connection_error=lambda e: isinstance(e, sqlite3.OperationalError))
+    first = pool.acquire()
+    pool.release(first)
+
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.connection() as conn:
+            assert conn is first
+            raise sqlite3.OperationalError("disk I/O error")
+
+    assert pool.acquire() is not first
+    pool.close()
+
+
+def test_uncommitted_work_is_rolled_back_on_release(pool, database):
+    conn = pool.acquire()
+    conn.execute("INSERT INTO [WeeklyShipments] ([DC ID], [Store ID]) VALUES (7, '1000')")
+    pool.release(conn)
+
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM [WeeklyShipments]").fetchone() == (0,)
+
+
+def test_closed_pool_hands_out_nothing(pool):
+    pool.close()
+
+    with pytest.raises(RuntimeError):
+        pool.acquire()
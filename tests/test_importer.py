@@ -0,0 +1,105 @@
+import hashlib, logging
+
+import pytest
+
+import importer as importer_module
+from conftest import make_rows, write_export, count_rows
+from exceptions import FileFormatException
+from fingerprint import Fingerprinter
+from importer import Importer
+from sinks import SQLiteSink
+
+
+@pytest.fixture
+def export(tmp_path):
+    return write_export(tmp_path / 'export.csv', make_rows(5))
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Counts the times the importer opens a file, and fails if it hashes one without keeping it"""
+    reads = []
+    real_open = open
+
+    def counting_open(path, *args, **kwargs):
+        reads.append(path)
+        return real_open(path, *args, **kwargs)
+
+    def hash_file(path):
+        raise AssertionError("'{}' was hashed separately from being read".format(path))
+
+    monkeypatch.setattr(importer_module, 'open', counting_open, raising=False)
+    monkeypatch.setattr(importer_module, 'hash_file', hash_file)
+    return reads
+
+
+def test_file_is_read_once(export, database, reads):
+    importer = Importer(database, export, sink=SQLiteSink(database))
+
+    importer.begin_import()
+
+    assert len(reads) == 1
+    with open(export, 'rb') as f:
+        assert importer.digest == hashlib.sha1(f.read()).hexdigest()
+    assert count_rows(database) == 5
+
+
+def test_remembered_file_is_not_read_to_hash_it(export, reads):
+    fingerprints = Fingerprinter()
+    Importer(None, export, fingerprints=fingerprints).sha1()
+    reads.clear()
+
+    importer = Importer(None, export, fingerprints=fingerprints)
+
+    assert importer.sha1() is not None
+    assert reads == []
+
+
+def test_digest_only_hash_does_not_keep_contents(export):
+    importer = Importer(None, export)
+
+    assert importer.sha1(keep=False) == Importer(None, export).sha1()
+    assert importer.contents is None
+
+
+def test_rows_are_streamed_to_the_database(export, database, monkeypatch):
+    importer = Importer(database, export, sink=SQLiteSink(database))
+    written = []
+    insert_rows = importer.insert_rows
+
+    def check_streamed(rows):
+        written.append(type(rows))
+        insert_rows(rows)
+    monkeypatch.setattr(importer, 'insert_rows', check_streamed)
+
+    importer.begin_import()
+
+    assert written and written[0] is not list
+    assert importer.rows_read == importer.rows_written == 5
+    assert importer.contents is None
+
+
+def test_file_with_a_bad_row_writes_nothing(tmp_path, database):
+    rows = make_rows(30)
+    rows[-1][10] = 'many'
+    export = write_export(tmp_path / 'export.csv', rows)
+
+    importer = Importer(database, export, sink=SQLiteSink(database), batch_size=10, commit_each_batch=True)
+    with pytest.raises(FileFormatException):
+        importer.begin_import()
+
+    assert count_rows(database) == 0
+
+
+def test_dates_of_whole_file_are_known_before_writing(tmp_path, database, caplog):
+    rows = make_rows(10) + make_rows(10, date='06/20/2020')
+    export = write_export(tmp_path / 'export.csv', rows)
+
+    importer = Importer(database, export, sink=SQLiteSink(database), batch_size=10, mode='delta')
+    with caplog.at_level(logging.INFO, logger='importer'):
+        importer.begin_import()
+
+    # The existing rows of the whole file are found with one query
+    found = [r.getMessage() for r in caplog.records if r.getMessage().startswith('Found')]
+    assert found == ['Found 0 records already in the database for DC 7.0 between 2020-06-14 and 2020-06-20']
+    assert count_rows(database) == 20
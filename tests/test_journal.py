@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+from conftest import make_rows, write_export, count_rows, block_store, unblock_store
+from importer import Importer, TABLE_NAME
+from journal import ImportJournal
+from sinks import SQLiteSink
+
+#The rows in the export and the rows committed with each batch
+ROWS = 50
+BATCH_SIZE = 10
+
+
+@pytest.fixture
+def export(tmp_path):
+    return write_export(tmp_path / 'export.csv', make_rows(ROWS))
+
+
+def import_export(database, export, journal):
+    importer = Importer(database, export, batch_size=BATCH_SIZE, sink=SQLiteSink(database), journal=journal)
+    importer.begin_import()
+    return importer
+
+
+def test_interrupted_import_resumes_from_last_batch(tmp_path, export, database):
+    journal = ImportJournal(str(tmp_path / 'imports.sqlite'))
+
+    # The third batch fails after the first two were committed
+    block_store(database, 1025)
+    with pytest.raises(sqlite3.IntegrityError):
+        import_export(database, export, journal)
+
+    importer = Importer(database, export)
+    checkpoint = journal.resume(importer.sha1(keep=False), database, TABLE_NAME)
+    assert (checkpoint.batch, checkpoint.offset, checkpoint.rows) == (2, 2 * BATCH_SIZE, 2 * BATCH_SIZE)
+    assert checkpoint.filename == export
+    assert count_rows(database) == 2 * BATCH_SIZE + 1
+
+    unblock_store(database, 1025)
+    importer = import_export(database, export, journal)
+
+    assert importer.rows_written == ROWS
+    assert count_rows(database) == ROWS
+    assert journal.resume(importer.digest, database, TABLE_NAME) is None
+    assert journal.unfinished() == []
+
+
+def test_resume_skips_batch_committed_without_checkpoint(tmp_path, export, database):
+    journal = ImportJournal(str(tmp_path / 'imports.sqlite'))
+
+    block_store(database, 1025)
+    with pytest.raises(sqlite3.IntegrityError):
+        import_export(database, export, journal)
+
+    # As if the service stopped after the second batch was committed but before its checkpoint was written
+    digest = Importer(database, export).sha1(keep=False)
+    journal.checkpoint(digest, database, TABLE_NAME, export, 1, BATCH_SIZE, BATCH_SIZE)
+
+    unblock_store(database, 1025)
+    importer = import_export(database, export, journal)
+
+    assert importer.rows_skipped == BATCH_SIZE
+    assert count_rows(database) == ROWS
+    assert journal.unfinished() == []
+
+
+def test_completed_import_leaves_no_checkpoint(tmp_path, export, database):
+    journal = ImportJournal(str(tmp_path / 'imports.sqlite'))
+
+    importer = import_export(database, export, journal)
+
+    assert importer.rows_written == ROWS
+    assert count_rows(database) == ROWS
+    assert journal.unfinished() == []
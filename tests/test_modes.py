@@ -0,0 +1,86 @@
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from conftest import make_rows, write_export, count_rows
+from importer import Importer
+from sinks import SQLiteSink
+
+#Each batch holds rows of every kind so the duplicates are split across batches too
+BATCH_SIZE = 4
+
+
+def import_export(database, export, mode):
+    importer = Importer(database, export, batch_size=BATCH_SIZE, sink=SQLiteSink(database), mode=mode)
+    importer.begin_import()
+    return importer
+
+
+def quantities(database):
+    with closing(sqlite3.connect(database)) as conn:
+        return dict(conn.execute("SELECT [Store ID], [Container Qty] FROM [WeeklyShipments]").fetchall())
+
+
+@pytest.fixture
+def reimport(tmp_path, database):
+    """Import ten rows, then write a second export of the same week with five of them unchanged, two with
+    a changed count, two new stores and one row that repeats a new store"""
+    import_export(database, write_export(tmp_path / 'first.csv', make_rows(10)), 'insert')
+
+    rows = make_rows(12)
+    for row in rows[5:7]:
+        row[-1] += 100
+    rows.append(list(rows[10]))
+    rows[-1][-1] = 50
+    return write_export(tmp_path / 'second.csv', rows[:5] + rows[5:7] + rows[10:])
+
+
+def test_delta_inserts_only_new_rows(reimport, database):
+    importer = import_export(database, reimport, 'delta')
+
+    assert importer.rows_written == 2
+    assert importer.rows_updated == 0
+    assert importer.rows_skipped == 8
+    assert importer.rows_repeated == 1
+    assert count_rows(database) == 12
+
+    qty = quantities(database)
+    # Changed rows are left alone, and the first of the repeated rows is the one written
+    assert (qty['1005'], qty['1006']) == (6, 7)
+    assert (qty['1010'], qty['1011']) == (11, 12)
+
+
+def test_upsert_updates_changed_rows(reimport, database):
+    importer = import_export(database, reimport, 'upsert')
+
+    assert importer.rows_written == 2
+    assert importer.rows_updated == 2
+    assert importer.rows_skipped == 6
+    assert importer.rows_repeated == 1
+    assert count_rows(database) == 12
+
+    qty = quantities(database)
+    assert (qty['1004'], qty['1005'], qty['1006']) == (5, 106, 107)
+    assert qty['1010'] == 11
+
+
+def test_insert_fails_on_repeated_row(tmp_path, database):
+    rows = make_rows(3)
+    export = write_export(tmp_path / 'export.csv', rows + [rows[0]])
+
+    with pytest.raises(sqlite3.IntegrityError):
+        import_export(database, export, 'insert')
+    assert count_rows(database) == 0
+
+
+@pytest.mark.parametrize('mode', ['delta', 'upsert'])
+def test_repeated_row_in_same_batch_is_skipped(tmp_path, database, mode):
+    rows = make_rows(2)
+    export = write_export(tmp_path / 'export.csv', [rows[0], rows[0], rows[1]])
+
+    importer = import_export(database, export, mode)
+
+    assert importer.rows_written == 2
+    assert importer.rows_repeated == 1
+    assert count_rows(database) == 2
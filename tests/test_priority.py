@@ -0,0 +1,35 @@
+import os, time
+
+from priority import Staleness, queue_gauges, CURRENT_LANE, STALE_LANE
+
+DAY_MS = 86400000
+
+
+def test_gauges_of_staleness_priorities():
+    waiting = [((CURRENT_LANE, 1000.0), 2.0), ((STALE_LANE, 5 * DAY_MS), 1.0), ((STALE_LANE, 6 * DAY_MS), 0.5)]
+
+    assert queue_gauges(waiting) == {'oldest_ms': 6 * DAY_MS + 500, 'stale': 2}
+
+
+def test_gauges_without_priority_function():
+    # Pipeline gives every file the priority (0,) when it has no priority function
+    assert queue_gauges([((0,), 2.0), ((0,), 3.5)]) == {'oldest_ms': 3500, 'stale': 0}
+
+
+def test_gauges_of_empty_queue():
+    assert queue_gauges([]) == {'oldest_ms': 0, 'stale': 0}
+
+
+def test_old_file_goes_in_stale_lane(tmp_path):
+    current = tmp_path / 'current.csv'
+    current.write_text('contents')
+    stale = tmp_path / 'stale.csv'
+    stale.write_text('contents')
+    old = time.time() - 5 * DAY_MS / 1000
+    os.utime(str(stale), (old, old))
+
+    staleness = Staleness(max_age_ms=4 * DAY_MS)
+
+    assert staleness.priority(str(current))[0] == CURRENT_LANE
+    assert staleness.priority(str(stale))[0] == STALE_LANE
+    assert staleness.priority(str(tmp_path / 'missing.csv')) == (CURRENT_LANE, 0.0)
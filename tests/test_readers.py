@@ -0,0 +1,33 @@
+import pytest
+
+from conftest import make_rows, write_export
+from exceptions import FileFormatException
+from readers import CsvReader
+
+
+def read_export(path):
+    with open(path, 'rb') as f:
+        reader = CsvReader(f.read())
+    return list(reader.read()), reader
+
+
+def test_csv_dates_and_serials_are_read(tmp_path):
+    rows = make_rows(3)
+    rows[1][8] = '2020-06-15'
+    rows[2][8] = '43998'
+
+    records, reader = read_export(write_export(tmp_path / 'export.csv', rows))
+
+    assert [r.transaction_date.day for r in records] == [14, 15, 16]
+    assert reader.date_range == ('2020-06-14', '2020-06-16')
+
+
+@pytest.mark.parametrize('serial', ['nan', 'inf', '-inf', '1e7', '1e300'])
+def test_serial_that_is_not_a_date_is_reported(tmp_path, serial):
+    rows = make_rows(3)
+    rows[1][8] = serial
+
+    with pytest.raises(FileFormatException) as e:
+        read_export(write_export(tmp_path / 'export.csv', rows))
+
+    assert e.value.message.startswith("1 records are not valid. record 2: Transaction Date '{}' is not a date".format(serial))
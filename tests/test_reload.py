@@ -0,0 +1,109 @@
+import os, sqlite3
+
+import pytest
+
+from config import CONFIG_ENV
+from windows import stand_in_windows_modules
+
+
+stand_in_windows_modules()
+import watcher
+
+
+def write_settings(path, settings):
+    with open(path, 'w', encoding='utf-8') as f:
+        for name, value in settings.items():
+            f.write("{0} = {1}\n".format(name, value))
+
+
+def route_settings(tmp_path, name):
+    """The settings of a route importing into its own SQLite database, creating its directories"""
+    for d in ('watch', 'archive', 'errors'):
+        os.makedirs(str(tmp_path / name / d), exist_ok=True)
+    database = str(tmp_path / name / 'shipments.sqlite')
+    sqlite3.connect(database).close()
+    return {
+        '{}.watch'.format(name): str(tmp_path / name / 'watch'),
+        '{}.archive'.format(name): str(tmp_path / name / 'archive'),
+        '{}.errors'.format(name): str(tmp_path / name / 'errors'),
+        '{}.database'.format(name): database,
+        '{}.sink'.format(name): 'sqlite',
+    }
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """A started service reading its settings from a file, with a single route"""
+    path = str(tmp_path / 'settings.ini')
+    os.makedirs(str(tmp_path / 'logs'))
+    settings = {'log_file': str(tmp_path / 'logs' / 'watcher.log'), 'workers': '0', 'routes': 'north'}
+    settings.update(route_settings(tmp_path, 'north'))
+    write_settings(path, settings)
+    monkeypatch.setenv(CONFIG_ENV, path)
+
+    service = watcher.Watcher([])
+    service.start()
+    yield service, path, settings
+    service.stop()
+
+
+def test_reload_without_changes_does_nothing(service):
+    service, path, settings = service
+
+    assert not service.reload()
+
+
+def test_reload_adds_route_and_keeps_unchanged_one_running(tmp_path, service):
+    service, path, settings = service
+    north = service.routes[0]
+
+    settings['routes'] = 'north, south'
+    settings.update(route_settings(tmp_path, 'south'))
+    write_settings(path, settings)
+
+    assert service.reload()
+    assert [r.name for r in service.routes] == ['north', 'south']
+    assert service.routes[0] is north
+    assert north.pipeline is not None
+    assert service.routes[1].pipeline is not None
+    assert os.path.normcase(os.path.abspath(settings['south.watch'])) in service.watched_directories
+
+
+def test_reload_replaces_changed_route(tmp_path, service):
+    service, path, settings = service
+    north = service.routes[0]
+
+    settings['north.table'] = 'Shipments'
+    write_settings(path, settings)
+
+    assert service.reload()
+    assert service.routes[0] is not north
+    assert service.routes[0].table == 'Shipments'
+    assert watcher.opts.routes[0].table == 'Shipments'
+
+
+def test_reload_defers_restart_settings(service):
+    service, path, settings = service
+
+    settings['workers'] = '4'
+    settings['import_mode'] = 'delta'
+    write_settings(path, settings)
+
+    assert service.reload()
+    assert watcher.opts.import_mode == 'delta'
+    assert watcher.opts.workers == 0
+    assert service.restart_pending == {'workers': 4}
+
+
+def test_reload_ignores_settings_that_can_not_be_used(tmp_path, service):
+    service, path, settings = service
+    routes = list(service.routes)
+    watched = set(service.watched_directories)
+
+    settings['north.watch'] = str(tmp_path / 'missing')
+    write_settings(path, settings)
+
+    assert not service.reload()
+    assert service.routes == routes
+    assert service.watched_directories == watched
+    assert watcher.opts.routes == routes
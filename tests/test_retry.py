@@ -0,0 +1,116 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import retry
+from retry import RetryScheduler
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the clock the scheduler reads. Set clock.now to move time"""
+    clock = SimpleNamespace(now=1000000.0)
+    monkeypatch.setattr(retry, 'time', SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def export(tmp_path):
+    path = tmp_path / 'export.csv'
+    path.write_text('contents')
+    return str(path)
+
+
+def test_delay_doubles_up_to_cap(clock, export):
+    scheduler = RetryScheduler(max_attempts=10, base=60, cap=200, jitter=0)
+
+    delays = []
+    for _ in range(4):
+        scheduler.failed(export, 'database is locked')
+        delays.append(scheduler.states[export].next_eligible - clock.now)
+
+    assert delays == [60, 120, 200, 200]
+
+
+def test_jitter_only_shortens_delay(clock, export):
+    scheduler = RetryScheduler(base=60, jitter=0.5)
+
+    scheduler.failed(export, 'database is locked')
+
+    assert 30 <= scheduler.states[export].next_eligible - clock.now <= 60
+
+
+def test_file_is_eligible_once_delay_has_passed(clock, export):
+    scheduler = RetryScheduler(base=60, jitter=0)
+    assert scheduler.eligible(export)
+
+    scheduler.failed(export, 'database is locked')
+    assert not scheduler.eligible(export)
+
+    clock.now += 60
+    assert scheduler.eligible(export)
+
+
+def test_changed_file_is_eligible_at_once(clock, export):
+    scheduler = RetryScheduler(base=60, jitter=0)
+    scheduler.failed(export, 'database is locked')
+    scheduler.failed(export, 'database is locked')
+
+    with open(export, 'a') as f:
+        f.write(' and more')
+    os.utime(export, (clock.now + 5, clock.now + 5))
+
+    assert scheduler.eligible(export)
+    # Its attempts start again from zero
+    assert scheduler.waiting() == 0
+
+
+def test_deleted_file_is_forgotten(clock, export):
+    scheduler = RetryScheduler(jitter=0)
+    scheduler.failed(export, 'database is locked')
+
+    os.remove(export)
+
+    assert scheduler.eligible(export)
+    assert scheduler.waiting() == 0
+
+
+def test_gives_up_after_max_attempts(clock, export):
+    scheduler = RetryScheduler(max_attempts=3, jitter=0)
+
+    assert [scheduler.failed(export, 'database is locked') for _ in range(3)] == [False, False, True]
+    assert scheduler.waiting() == 0
+
+
+def test_due_returns_each_file_once_per_attempt(clock, export, tmp_path):
+    other = tmp_path / 'other.csv'
+    other.write_text('contents')
+    scheduler = RetryScheduler(base=60, jitter=0)
+    scheduler.failed(export, 'database is locked')
+    scheduler.failed(str(other), 'database is locked')
+    scheduler.failed(str(other), 'database is locked')
+
+    assert scheduler.due() == []
+
+    clock.now += 60
+    assert scheduler.due() == [export]
+    assert scheduler.due() == []
+
+    clock.now += 60
+    assert scheduler.due() == [str(other)]
+
+    # The next failure schedules another attempt
+    scheduler.failed(export, 'database is locked')
+    clock.now += 120
+    assert scheduler.due() == [export]
+
+
+def test_forget(clock, export):
+    scheduler = RetryScheduler(jitter=0)
+    scheduler.failed(export, 'database is locked')
+
+    scheduler.forget(export)
+
+    assert scheduler.waiting() == 0
+    assert scheduler.eligible(export)
@@ -0,0 +1,90 @@
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from conftest import make_rows, write_export, count_rows
+from importer import Importer, INSERT_SQL, UPDATE_SQL
+from sinks import Sink, AccessSink, SQLiteSink, PostgreSQLSink, make_sink
+
+
+def test_sink_must_implement_every_abstract_method():
+    class Incomplete(Sink):
+        name = 'incomplete'
+
+        def connect(self):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete('shipments.db')
+
+
+@pytest.mark.parametrize('name, cls', [('access', AccessSink), ('sqlite', SQLiteSink), ('postgresql', PostgreSQLSink)])
+def test_sink_is_chosen_by_name(name, cls):
+    sink = make_sink(name, 'shipments.db')
+
+    assert type(sink) is cls
+    assert sink.database == 'shipments.db'
+
+
+def test_unknown_sink_name_is_rejected():
+    with pytest.raises(ValueError):
+        make_sink('oracle', 'shipments.db')
+
+
+def test_sqlite_error_codes():
+    sink = SQLiteSink('shipments.db')
+
+    assert sink.error_code(sqlite3.IntegrityError("UNIQUE constraint failed")) == '23000'
+    assert sink.error_code(sqlite3.OperationalError("database is locked")) == 'HY000'
+    assert sink.error_code(sqlite3.ProgrammingError("closed")) is None
+    assert not sink.is_connection_error(sqlite3.OperationalError("database is locked"))
+
+
+def test_access_error_code_is_sqlstate():
+    sink = AccessSink('shipments.accdb')
+
+    assert sink.error_code(Exception('23000', '[23000] The changes you requested were not successful')) == '23000'
+    assert sink.error_code(Exception()) is None
+
+
+def test_postgresql_statements_are_translated():
+    sink = PostgreSQLSink('dbname=shipments')
+
+    assert sink.sql(INSERT_SQL.format('WeeklyShipments')) == ('INSERT INTO "WeeklyShipments" ("DC ID", "DC Name", '
+        '"Store ID", "Store Name", "Address", "City", "State","Zip", "Transaction Date", "Container Type", '
+        '"Container Qty") VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)')
+    assert sink.sql(UPDATE_SQL.format('WeeklyShipments')) == ('UPDATE "WeeklyShipments" SET "Container Qty" = %s '
+        'WHERE "DC ID" = %s AND "Store ID" = %s AND "Transaction Date" = %s AND "Container Type" = %s')
+
+
+def test_postgresql_error_codes():
+    class PgError(Exception):
+        def __init__(self, pgcode):
+            self.pgcode = pgcode
+
+    sink = PostgreSQLSink('dbname=shipments')
+
+    assert sink.error_code(PgError('23505')) == '23000'
+    assert sink.error_code(PgError('40P01')) == 'HY000'
+    assert sink.error_code(PgError('55P03')) == 'HY000'
+    assert sink.error_code(PgError('42P01')) == '42P01'
+    assert sink.error_code(Exception()) is None
+
+
+def test_sqlite_database_must_exist(tmp_path, database):
+    assert SQLiteSink(database).check_database() is None
+    assert SQLiteSink(str(tmp_path / 'missing.sqlite')).check_database() is not None
+
+
+def test_import_into_sqlite(tmp_path, database):
+    export = write_export(tmp_path / 'export.csv', make_rows(5))
+
+    importer = Importer(database, export, sink=make_sink('sqlite', database))
+    importer.begin_import()
+
+    assert importer.rows_written == 5
+    assert count_rows(database) == 5
+    with closing(sqlite3.connect(database)) as conn:
+        assert conn.execute("SELECT [DC ID], [Store ID], [Transaction Date], [Container Qty] FROM [WeeklyShipments] "
+            "ORDER BY [Store ID]").fetchone() == (7.0, '1000', '2020-06-14 00:00:00', 1.0)
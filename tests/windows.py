@@ -0,0 +1,36 @@
+"""Stand-ins for the Windows only modules, shared by the tests and the benchmarks"""
+import platform, sys, types
+
+
+def stand_in_windows_modules():
+    """Install empty stand-ins for the pywin32 and winreg modules so the service can be created on other
+    platforms. Only the parts the Watcher touches outside of the Windows service host are needed. The
+    registry reads as empty, so every setting falls back to its default"""
+    if platform.system() == 'Windows':
+        return
+
+    # mimetypes reads the file types from the registry when it finds winreg, so it has to be loaded first
+    import mimetypes
+
+    class ServiceFramework:
+        def __init__(self, args):
+            pass
+
+    winreg = types.ModuleType('winreg')
+    winreg.HKEY_LOCAL_MACHINE = None
+    winreg.REG_SZ = 1
+    winreg.CreateKey = lambda root, name: None
+    winreg.CloseKey = lambda key: None
+    winreg.SetValueEx = lambda key, name, reserved, kind, value: None
+    def query_value(key, name):
+        raise FileNotFoundError(name)
+    winreg.QueryValueEx = query_value
+
+    win32serviceutil = types.ModuleType('win32serviceutil')
+    win32serviceutil.ServiceFramework = ServiceFramework
+    win32event = types.ModuleType('win32event')
+    win32event.CreateEvent = lambda *args: None
+
+    for name, module in [('winreg', winreg), ('win32serviceutil', win32serviceutil), ('win32event', win32event),
+            ('win32service', types.ModuleType('win32service')), ('servicemanager', types.ModuleType('servicemanager'))]:
+        sys.modules.setdefault(name, module)
@@ -1,19 +1,32 @@
 # -*- coding: utf-8 -*-
 
-import sys, os, time, logging, shutil, re
-from watchdog.observers.polling import PollingObserver
+import sys, os, time, logging
+from watchdog.observers import Observer
 from watchdog import events
 from pathlib import Path
-from importer import Importer
-from exceptions import ImportException, FileFormatException
+from importer import Importer, IMPORT_MODES
+from readers import IMPORT_FILE_TYPES
+from pipeline import ParserPool
+from routes import read_routes
+from sinks import SINKS, AccessSink, ACCESS_DRIVER
+from history import ImportHistory
+from journal import ImportJournal
+from cache import RowCache
+from fingerprint import Fingerprinter
+from archive import Archiver, COMPRESSION
+from ingest import IngestQueue
+from priority import Staleness, queue_gauges
+from retry import RetryScheduler
+from metrics import ImportTimer, Metrics
+from logutil import LogQueue
+from exceptions import ImportException, FileFormatException, DuplicateFileException, ConfigurationException
+from config import Config
 from time import sleep
 import struct
-import pyodbc
 import configargparse
 import textwrap
 import traceback
 from pprint import pformat
-from datetime import datetime
 from pathlib import Path
 from logging.handlers import TimedRotatingFileHandler
 from logging.handlers import NTEventLogHandler
@@ -26,10 +39,18 @@ from registry import Registry
 
 VERSION = "1.0.0"
 
-#The interval (in seconds) between sleep cycles. A manual check is performed on each wake
+#The interval (in seconds) between sleep cycles. A full manual check is performed on each wake
 SLEEP_INTERVAL = 60 * 10
 
-IMPORT_FILE_TYPES = [".xls", ".xlsx"]
+#The interval (in seconds) between quick scans of the watched directories. Directories that have not
+#changed since the last scan are skipped
+RESCAN_INTERVAL = 30
+
+#The interval (in seconds) between checks for changed settings
+RELOAD_INTERVAL = 30
+
+#Settings that are only read when the service starts. Changes to the rest are applied between imports
+RESTART_OPTIONS = ['log_file', 'workers', 'max_attempts', 'cache_size', 'archive_compression', 'journal']
 
 #Keep the logger and the configuration as global variables
 logger = None
@@ -41,17 +62,23 @@ logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+# Every logger writes to a queue. The handlers below are run by a listener thread so writing the
+# log never slows down an import
+log_queue = LogQueue()
+logger.addHandler(log_queue.handler)
+
 # Log warnings and above to the windows event log
 eh = NTEventLogHandler('container_tracking_importer')
 eh.setLevel(logging.WARNING)
 eh.setFormatter(formatter)
-logger.addHandler(eh)
+log_queue.add_handler(eh)
 
 
 class Watcher(win32serviceutil.ServiceFramework):
     """The Windows service responsible for monitoring the import directory for Excel files.
-    The watcher will use a combination of a polling observer and timed manual wakes to search
-    for new Excel files. Any files found will be passed off to the Importer for processing.
+    The watcher will use a combination of the native file system observer, quick rescans of the watched
+    directories and timed manual wakes to search for new Excel files. Any files found will be passed off
+    to the Importer for processing.
     """
 
     _svc_name_ = 'container_tracking_importer'
@@ -61,35 +88,63 @@ class Watcher(win32serviceutil.ServiceFramework):
     def __init__(self, args):
         """Set up our run-time options and switch to the rotating log
         """
-        # Write default settings to the registry if they have not already been defined
-        Registry.write_default_opts()
+        global opts
+
+        # The settings are read into memory once, with default settings written to the registry if they
+        # have not already been defined. They are read again only when they change, see reload()
+        self.config = Config.from_environment()
 
         # We need to read the log_file setting before anything else so we can begin logging to a
         # file as soon as possible
-        opts.log_file = Registry.read_key('log_file', "C:\\db\\logs\\watcher.log")
+        log_file = self.config.read_key('log_file', "C:\\db\\logs\\watcher.log")
 
         try:
-            fh = TimedRotatingFileHandler(opts.log_file, when='midnight', backupCount=7, encoding='utf-8')
+            fh = TimedRotatingFileHandler(log_file, when='midnight', backupCount=7, encoding='utf-8')
             fh.setLevel(logging.DEBUG)
             fh.setFormatter(formatter)
-            logger.addHandler(fh)
+            log_queue.add_handler(fh)
         except Exception as e:
-            logger.error("Unable to initialize log file: '{}'. Verify the parent folder exists and that you have write access.".format(e))
+            logger.error("Unable to initialize log file: '%s'. Verify the parent folder exists and that you have write access.", e)
             sys.exit(1)
 
         logger.info("Service initializing")
-        logger.info("Reading settings from HKEY_LOCAL_MACHINE\\SOFTWARE\\ContainerTracking\\")
-
-        opts.watch = Registry.read_key('watch', "C:\\import")
-        opts.archive = Registry.read_key('archive', "C:\import\\archive")
-        opts.errors = Registry.read_key('errors', "C:\\import\\archive\\errors")
-        opts.database = Registry.read_key('database', "C:\\db\\database.accdb")
+        logger.info("Reading settings from %s", self.config.source)
 
-        logger.info("Running with options: {}".format(opts))
+        opts = read_opts(self.config)
+        logger.info("Running with options: %s", opts)
         Registry.close_key()
 
-        #Keep track of the last time the service woke (in epoch seconds)
+        #Keep track of the last time the service woke, the last time the directories were scanned and the
+        #last time the settings were checked for changes (in epoch seconds)
         self.last_wake = -1
+        self.last_scan = -1
+        self.last_reload = time.time()
+
+        #The changed settings that will only be applied when the service restarts
+        self.restart_pending = {}
+
+        #Files found by the observer or by a scan wait here until they have finished being written
+        self.ingest = IngestQueue()
+
+        #The digest of every file hashed recently, so a file that is attempted again is not hashed again
+        self.fingerprints = Fingerprinter()
+
+        #Files that failed with a recoverable error are attempted again on a backoff schedule
+        self.retries = RetryScheduler(opts.max_attempts)
+
+        #Timings of recent imports, written to a JSON file after every import
+        self.metrics = Metrics(opts.metrics)
+
+        #The observer, the import history and the parser processes are created when the service starts. Each
+        #route opens its own database connections and starts its own writer
+        self.observer = None
+        self.history = None
+        self.journal = None
+        self.cache = None
+        self.archiver = None
+        self.staleness = None
+        self.parsers = None
+        self.routes = opts.routes
 
         win32serviceutil.ServiceFramework.__init__(self, args)
         self.hWaitStop = win32event.CreateEvent(None, 0, 0, None)
@@ -119,13 +174,25 @@ class Watcher(win32serviceutil.ServiceFramework):
     def stop(self):
         """Perform any last steps to shut down the service
         There is not much to do here other than to ask the file watcher to
-        stop.
+        stop and to close the database connections.
         """
         self.isRunning = False
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
         self.observer = None
         self.handler = None
-        self.observer.stop()
-        self.observer.join()
+
+        # Let each writer finish its current file then close the database connections we are holding open
+        for route in self.routes:
+            route.stop()
+
+        if self.parsers is not None:
+            self.parsers.close()
+
+        # Let the files being copied into the archive finish
+        if self.archiver is not None:
+            self.archiver.close()
 
     def start(self):
         """Perform required initialization before the main loop can begin
@@ -134,96 +201,251 @@ class Watcher(win32serviceutil.ServiceFramework):
         logger.info("╔═════════════════════════════════════════╗")
         logger.info("║ Container Tracking Importer             ║")
         logger.info("╠═════════════════════════════════════════╣")
-        logger.info("║ Version {:<8}                        ║".format(VERSION))
+        logger.info("║ Version %-8s                        ║", VERSION)
         logger.info("║                                         ║")
         logger.info("╚═════════════════════════════════════════╝")
 
-        # The polling observer is heavier than the other observers, but was more reliable during testing
-        self.observer = PollingObserver()
-        event_handler = Handler()
-        
         # Store the list of watched directories as a set so we can avoid duplicates
         self.watched_directories = set()
 
         # Do some tests to make sure we can work with the settings provided
         self.do_integrety_tests()
+
+        # Remember which files have been imported so a file dropped twice never reaches the database
+        self.history = ImportHistory(opts.history)
+        logger.info("Recording import history in '%s'", opts.history)
+
+        # Imported files are moved out of the watched directories in the background. Moves recorded in the
+        # history database that were interrupted when the service last stopped are finished first
+        self.archiver = Archiver(opts.history, compression=opts.archive_compression)
+        if self.archiver.recover():
+            logger.info("Finishing %s interrupted archive moves", self.archiver.depth())
+
+        # Checkpoint every committed batch so an interrupted import carries on where it stopped. Files whose
+        # import was interrupted when the service last stopped are queued again straight away
+        if opts.journal:
+            self.journal = ImportJournal(opts.history)
+            for checkpoint in self.journal.unfinished():
+                if os.path.exists(checkpoint.filename):
+                    logger.info("Resuming interrupted import of '%s' after record %s",
+                        checkpoint.filename, checkpoint.offset)
+                    self.ingest.offer(checkpoint.filename, force=True)
+                else:
+                    logger.warning("The interrupted import of '%s' can not be resumed, the file is gone. %s records "
+                        "were committed", checkpoint.filename, checkpoint.rows)
+
+        # Keep the rows of files that could not be written so the next attempt does not read them again
+        if opts.cache_size > 0:
+            self.cache = RowCache(opts.cache, opts.cache_size * 1024 * 1024)
+            self.cache.evict()
+            logger.info("Caching the records of failed imports in '%s'", opts.cache)
+
+        # Current files are imported before older ones, so after an outage the latest data arrives first
+        self.staleness = Staleness(fingerprints=self.fingerprints, cache=self.cache)
+
+        # In pipeline mode the workbooks are parsed in separate processes shared by every route
+        if opts.workers > 0:
+            self.parsers = ParserPool(opts.workers, log_queue.handler, self.fingerprints)
+
+        # Each route keeps its connections to its database open between imports, since opening a new
+        # connection for every file is expensive when many files arrive at once. The files of a route
+        # are written one at a time by the route's own writer thread
+        for route in self.routes:
+            self.start_route(route)
+
+        # The native observer does not poll. It can miss events on network shares, so the watched
+        # directories are also rescanned every RESCAN_INTERVAL
+        self.observer = Observer()
+        event_handler = Handler(self)
         
-        # Schedule the polling observer and start observing
+        # Schedule the observer on every watched directory and start observing
         for d in self.watched_directories:
             self.observer.schedule(event_handler, d, recursive=False)
         self.observer.start()
 
-        logger.info("Watchdog running. Monitoring new files in paths {0}".format(pformat(self.watched_directories, indent=1, width=80, depth=None, compact=False)))
-        logger.info("Completed imports will be moved into '{0}'".format(opts.archive))  
-        logger.info("Failed imports will be moved into '{0}'".format(opts.errors))
+        logger.info("Watchdog running. Monitoring new files in paths %s", pformat(self.watched_directories, indent=1, width=80, depth=None, compact=False))
+        for route in self.routes:
+            logger.info("Route '%s': completed imports will be moved into '%s'", route.name, route.archive)
+            logger.info("Route '%s': failed imports will be moved into '%s'", route.name, route.errors)
+
+    def start_route(self, route):
+        """Open the connections of a route and start its writer"""
+        route.start(lambda path, route, parsed: import_file(path, self, route, parsed), self.parsers,
+            self.history, self.cache, self.staleness.priority)
+        logger.info("Route '%s': importing files from '%s' into [%s] in '%s'",
+            route.name, route.watch, route.table, route.database)
+
+    def reload(self):
+        """Apply any settings that changed since they were last read. The new routes are started before
+        the old ones are stopped, and an old route finishes the file it is writing before it stops, so
+        no import is interrupted. Settings that can not be used are logged and ignored
+
+        Returns:
+            bool: True if new settings were applied
+        """
+        global opts
+        try:
+            if not self.config.reload():
+                return False
+            settings = read_opts(self.config)
+        except Exception as e:
+            logger.error("Unable to read the changed settings: %s", e)
+            return False
+
+        for name in RESTART_OPTIONS:
+            value = getattr(settings, name)
+            if value != getattr(opts, name):
+                if self.restart_pending.get(name) != value:
+                    logger.warning("The '%s' setting has changed. Restart the service to apply it", name)
+                    self.restart_pending[name] = value
+                setattr(settings, name, getattr(opts, name))
+
+        # Routes whose settings did not change keep running as they are
+        running = {repr(route): route for route in self.routes}
+        settings.routes = [running.pop(repr(route), route) for route in settings.routes]
+        started = [route for route in settings.routes if route.pipeline is None]
+        if not started and not running and vars(settings) == vars(opts):
+            return False
+
+        try:
+            watched = self.check_settings(settings)
+        except ConfigurationException as e:
+            logger.error("Ignoring the changed settings: %s", e.message)
+            return False
+
+        for route in started:
+            self.start_route(route)
+
+        # The new settings take effect from the next import
+        opts = settings
+        self.routes = settings.routes
+        if watched != self.watched_directories:
+            self.watched_directories = watched
+            event_handler = Handler(self)
+            self.observer.unschedule_all()
+            for d in self.watched_directories:
+                self.observer.schedule(event_handler, d, recursive=False)
+            logger.info("Monitoring new files in paths %s", pformat(self.watched_directories, indent=1, width=80))
+
+        for route in running.values():
+            logger.info("Stopping route '%s'", route.name)
+            route.stop()
+
+        # Files that were waiting on a stopped route are picked up again by a full check
+        self.last_wake = -1
+        logger.info("Applied the changed settings: %s", opts)
+        return True
 
     def do_integrety_tests(self):
         """Check that we can work with the settings given. Terminate the process otherwise
         """
-
-        # Do we have an Access database driver installed?
-        # Microsoft has two main versions. A old driver that can only access .mdb
-        # databases, and a newer driver that can read .mdb and .accdb databases.
-        drivers = [x for x in pyodbc.drivers() if x.startswith('Microsoft Access Driver')]
-        if len(drivers) == 0:
-            logger.error('Unable to find any Access database drivers installed')
-            log_access_driver_error()
-            sys.exit(1)
-        elif 'Microsoft Access Driver (*.mdb, *.accdb)' not in drivers:
-            #We have at least one Access driver installed, but it is the older version
-            logger.error('Unable to find the updated MS Access database driver')
-            log_access_driver_error()
+        try:
+            self.watched_directories = self.check_settings(opts)
+        except ConfigurationException as e:
+            logger.error(e.message)
             sys.exit(1)
+
+    def check_settings(self, settings):
+        """Check that we can work with a set of settings
+
+        Args:
+            settings: The options read by read_opts()
+
+        Returns:
+            set: The normalized paths of the directories to watch
+
+        Raises:
+            ConfigurationException: Describing the first problem found
+        """
+        # Check that every route writes to a kind of database we know about
+        for route in settings.routes:
+            if route.sink is None:
+                raise ConfigurationException("Unknown sink '{0}' for route '{1}'. Choose one of {2}".format(route.sink_name, route.name, list(SINKS)))
+
+        # Do we have the drivers for the databases we are writing to? Only the sinks that are in use
+        # are checked, so the Access driver is not needed when every route writes to SQLite
+        for sink in sorted({type(route.sink) for route in settings.routes}, key=lambda s: s.name):
+            problem = sink.check_driver()
+            if problem is not None:
+                if sink is AccessSink:
+                    log_access_driver_error()
+                raise ConfigurationException(problem)
+            elif sink is AccessSink:
+                logger.info("Using driver: %s", ACCESS_DRIVER)
+            else:
+                logger.info("Using sink: %s", sink.name)
+
+        # Check that we know how to compress archived files
+        if settings.archive_compression not in COMPRESSION:
+            raise ConfigurationException("Unknown archive compression '{0}'. Choose one of {1}".format(settings.archive_compression, list(COMPRESSION)))
+
+        # Check that we know how to handle rows that were already imported
+        if settings.import_mode not in IMPORT_MODES:
+            raise ConfigurationException("Unknown import mode '{0}'. Choose one of {1}".format(settings.import_mode, IMPORT_MODES))
+
+        watched = set()
+        for route in settings.routes:
+            watched.add(self.check_route(route, settings.routes))
+
+        # Error out if we have no directories to watch
+        if len(watched) > 0:
+            logger.debug("Found at least one directory to watch for imported data")
         else:
-            logger.info("Using driver: Microsoft Access Driver (*.mdb, *.accdb)")
+            raise ConfigurationException("Could not find any directories to watch")
 
+        # Every directory must belong to a single route, otherwise we could not tell where its files go
+        if len(watched) < len(settings.routes):
+            raise ConfigurationException("More than one route is watching the same directory. Give each route its own directory")
+        return watched
 
+    def check_route(self, route, routes):
+        """Check the directories and database of a single route
+
+        Args:
+            route (Route): The route to check
+            routes (list): Every configured route, to make sure none of them watch this route's archive
+
+        Returns:
+            str: The normalized path of the directory the route watches
+
+        Raises:
+            ConfigurationException: If a directory or the database is missing
+        """
         # Filter down the list of directories to watch to only the ones that exist
-        exists = os.path.exists(opts.watch)
-        isFile = os.path.isfile(opts.watch)
+        exists = os.path.exists(route.watch)
+        isFile = os.path.isfile(route.watch)
         if not exists:
-            logger.error("Can not watch for new files in '{0}'. Directory does not exist.".format(opts.watch))
-            sys.exit(1)
+            raise ConfigurationException("Can not watch for new files in '{0}'. Directory does not exist.".format(route.watch))
         elif isFile:
-            logger.error("Can not watch for new files in '{0}'. Path is a file, not a directory.".format(opts.watch))
-            sys.exit(1)
-        else:
-            logger.debug("Adding '{0}' to the watched directories list".format(opts.watch))
-            self.watched_directories.add(opts.watch)
+            raise ConfigurationException("Can not watch for new files in '{0}'. Path is a file, not a directory.".format(route.watch))
+        logger.debug("Adding '%s' to the watched directories list", route.watch)
 
-        # Error out if we have no directories to watch
-        if len(self.watched_directories) > 0:
-            logger.debug("Found at least one directory to watch for imported data")
-        else:
-            logger.error("Could not find any directories to watch.  Exiting...")
-            sys.exit(1)
-        
         # Check if the archive directory exists
-        if not os.path.exists(opts.archive) or os.path.isfile(opts.archive):
-            logger.error("The archive directory '{0}' does not exist".format(opts.archive))
-            sys.exit(1)
+        if not os.path.exists(route.archive) or os.path.isfile(route.archive):
+            raise ConfigurationException("The archive directory '{0}' does not exist".format(route.archive))
 
         # Check if the errors archive directory exists
-        if not os.path.exists(opts.errors) or os.path.isfile(opts.errors):
-            logger.error("The errors archive directory '{0}' does not exist".format(opts.errors))
-            sys.exit(1)
+        if not os.path.exists(route.errors) or os.path.isfile(route.errors):
+            raise ConfigurationException("The errors archive directory '{0}' does not exist".format(route.errors))
 
-        # Check if the database we are importing into exists. Defer checking whether this is a valid Access database until later
-        if not os.path.exists(opts.database) or not os.path.isfile(opts.database):
-            logger.error("The database file '{0}' does not exist".format(opts.database))
-            sys.exit(1)
+        # Check if the database we are importing into exists. Defer checking whether this is a valid database until later
+        problem = route.sink.check_database()
+        if problem is not None:
+            raise ConfigurationException(problem)
 
-        # Make sure we aren't being asked to move imported data into the same folder we are watching.
+        # Make sure we aren't being asked to move imported data into a folder we are watching.
         # Use os.path.sameFile() to resolve relative paths back to absolute ones
-        arkPath = os.path.normpath(opts.archive)
-        errPath = os.path.normpath(opts.errors)
-        for path in self.watched_directories:
-            realPath = os.path.normpath(path)
+        arkPath = os.path.normpath(route.archive)
+        errPath = os.path.normpath(route.errors)
+        for other in routes:
+            realPath = os.path.normpath(other.watch)
+            if not os.path.isdir(realPath):
+                continue
             if (os.path.samefile(realPath, arkPath) or os.path.samefile(realPath, errPath)):
-                logger.error("The archive directory '{0}' or the error directory {1} is in the list of directories to watch. This "
-                "will result in an endless loop.".format(opts.archive, opts.errors))
-                logger.error("Choose a different archive directory or error directory or remove this directory from the list of watched directories")
-                sys.exit(1)
+                raise ConfigurationException("The archive directory '{0}' or the error directory {1} is in the list of directories to watch. This "
+                "will result in an endless loop. Choose a different archive directory or error directory or remove this directory from the "
+                "list of watched directories".format(route.archive, route.errors))
+        return os.path.normcase(os.path.abspath(route.watch))
     
     def main(self):
         """The main event loop
@@ -245,54 +467,117 @@ class Watcher(win32serviceutil.ServiceFramework):
                 if (self.last_wake == -1 or now - self.last_wake > SLEEP_INTERVAL):
                     logger.info("🌞🥱 Checking for any files to manually import")
                     self.last_wake = now
-                    self.manual_import()
+                    self.last_scan = now
+                    self.manual_import(full=True)
+
+                    # Files that could not be moved out of the watched directories are tried again
+                    self.archiver.retry_failed()
                     logger.info("Back to sleep 😴")
+                elif now - self.last_scan > RESCAN_INTERVAL:
+                    # A quick scan catches any files the observer missed
+                    self.last_scan = now
+                    self.manual_import(full=False)
+
+                # Apply any settings that have changed
+                if now - self.last_reload > RELOAD_INTERVAL:
+                    self.last_reload = now
+                    self.reload()
+
+                # Queue the files that failed earlier and are due another attempt
+                for f in self.retries.due():
+                    self.ingest.offer(f, force=True)
+
+                # Import any files that have finished being written. The freshest are queued first so they
+                # are also parsed first
+                for f in sorted(self.ingest.ready(), key=self.staleness.priority):
+                    check_file(f, self)
         except Exception as e:
             logger.error("Error with watchdog.  Exiting...")
             logger.exception(e)
             sys.exit(1)           
             
 
-    def manual_import(self):
+    def manual_import(self, full=True):
         """ Check for any pre-existing database files to import.  Since 
-        these already exist we won't get a on_created() callback in the Handler """
+        these already exist we won't get a on_created() callback in the Handler.
+        The files found are queued and imported from the main loop once they have settled
 
-        logger.debug("Performing manual check for database files to import")
-        to_import = []
-        for d in self.watched_directories:
-            dir = os.path.normpath(d)
-            logger.debug("Checking directory '{}'".format(dir))
-                        
-            for f in os.listdir(dir):
-                logger.debug("Found child '{}'".format(f))
-                full_path = os.path.join(d, f)
-                if os.path.isfile(full_path):
-                    logger.debug("Child is a file {}".format(f))
-                    to_import.append(full_path)
-
-        if len(to_import) == 0:
-            logger.info("No files found to import")
+        Args:
+            full (bool): List every watched directory and queue every file, including files that were
+                left behind by an earlier failed import. Otherwise only changed directories are listed
+                and only new or changed files are queued
+        """
+
+        logger.debug("Performing %s check for database files to import", 'full' if full else 'quick')
+        found = self.ingest.scan(self.watched_directories, full)
+
+        if found == 0:
+            if full:
+                logger.info("No files found to import")
         else:
-            logger.info("Found {} existing files in the watched directories.".format(len(to_import)))
-            for f in to_import:
-                check_file(f)
+            logger.info("Found %s existing files in the watched directories.", found)
 
     
     
 
-def check_file(path: str):
+def read_opts(config: Config):
+    """Read the service settings
+
+    Args:
+        config (Config): The settings snapshot to read from
+
+    Returns:
+        SimpleNamespace: The options, with the configured Routes in routes
     """
-    Check the file path to see if it contains an Excel file.
-    This check is done strictly by the file extension
+    settings = types.SimpleNamespace()
+    settings.log_file = config.read_key('log_file', "C:\\db\\logs\\watcher.log")
+    settings.watch = config.read_key('watch', "C:\\import")
+    settings.archive = config.read_key('archive', "C:\import\\archive")
+    settings.errors = config.read_key('errors', "C:\\import\\archive\\errors")
+    settings.database = config.read_key('database', "C:\\db\\database.accdb")
+    settings.sink = config.read_key('sink', "access")
+    settings.workers = int(config.read_key('workers', "0"))
+    settings.import_mode = config.read_key('import_mode', "insert")
+    settings.bulk_threshold = int(config.read_key('bulk_threshold', "0"))
+    settings.max_attempts = int(config.read_key('max_attempts', "8"))
+    settings.cache_size = int(config.read_key('cache_size', "256"))
+    settings.archive_compression = config.read_key('archive_compression', "")
+    settings.journal = config.read_key('journal', "0") == "1"
+
+    # The history of imported files and the import metrics are kept next to the log file
+    settings.history = os.path.join(os.path.dirname(settings.log_file), 'imports.sqlite')
+    settings.metrics = os.path.join(os.path.dirname(settings.log_file), 'metrics.json')
+    settings.cache = os.path.join(os.path.dirname(settings.log_file), 'cache')
+
+    # Each watched directory is imported into its own database. Without any routes configured the
+    # watch, database, archive and errors options make up the only route
+    settings.routes = read_routes(config.read_key, settings)
+    return settings
+
+
+def check_file(path: str, watcher: Watcher):
     """
-    logger.info("Checking file '{0}'".format(path))
+    Check the file path to see if it contains an Excel or CSV file.
+    This check is done strictly by the file extension. The file is queued with the route that
+    watches its directory and imported by that route's writer
+    """
+    logger.info("Checking file '%s'", path)
     isDb = list(filter(path.endswith, IMPORT_FILE_TYPES))
-    if isDb:
-        #begin import
-        logger.info("File {} looks like an Excel file, beginning import".format(path))
-        import_file(path)
+    if isDb and watcher.archiver.is_pending(path):
+        # The file has been imported and is on its way to the archive
+        logger.info("File %s is being archived, skipping...", path)
+    elif isDb and not watcher.retries.eligible(path):
+        # The file failed earlier and has not changed. Leave it until its next attempt is due
+        logger.info("File %s is waiting to be retried, skipping...", path)
+    elif isDb:
+        route = next((r for r in watcher.routes if r.owns(path)), None)
+        if route is None:
+            logger.warning("File %s is not in the directory of any route, skipping...", path)
+            return
+        logger.info("File %s looks like an Excel or CSV file, queueing import on route '%s'", path, route.name)
+        route.pipeline.submit(path)
     else:
-        logger.info("File {} does not look like an Excel file, skipping...".format(path))
+        logger.info("File %s does not look like an Excel or CSV file, skipping...", path)
     
     
 def test_permissions(file):
@@ -305,15 +590,32 @@ def test_permissions(file):
         return False
 
     
-def import_file(file: str):
+def import_file(file: str, watcher: Watcher, route, parsed=None):
+    """Import a file and move it to the archive or errors directory depending on the outcome
+
+    Args:
+        file (str): The file to import
+        watcher (Watcher): The service, which holds the import history
+        route (Route): Where the file is imported to, with the connections to its database
+        parsed (Future): In pipeline mode, resolves to the ParsedFile read by a parser process. Any
+            error raised while parsing is handled the same way as if the file was read here
+    """
     logger.info("╭╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼")
     logger.info("╽")
-    logger.info("╽ Beginning import of {}".format(file))
+    logger.info("╽ Beginning import of %s", file)
     logger.info("╽")
     logger.info("╰╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼")
 
     #should the file be moved to the archive directory after the import?
     moveFile = 'Skipped'
+    importer = None
+    #Set when the import failed with an error that may go away if the file is tried again later
+    retryError = None
+    timer = ImportTimer(file)
+    try:
+        size = os.path.getsize(file)
+    except OSError:
+        size = None
 
     try:
         # Before we begin the import check that we have read and write access to the file.
@@ -322,24 +624,34 @@ def import_file(file: str):
         if not writable:
             raise ImportException("Could not establish read and write access to file. Skipping import")
 
-        importer = Importer(opts.database, file)
-        importer.begin_import()
+        with route.pool.connection(timer) as conn:
+            importer = Importer(route.database, file, connection=conn, table=route.table, history=watcher.history, mode=opts.import_mode,
+                timer=timer, bulk_threshold=opts.bulk_threshold, cache=watcher.cache, sink=route.sink,
+                fingerprints=watcher.fingerprints, journal=watcher.journal)
+            importer.begin_import(parsed.result() if parsed is not None else None)
         moveFile = 'Archived'
+        if watcher.staleness.is_stale(importer.date_range):
+            logger.warning("The file holds transactions from %s through %s, older than %.0f days",
+                importer.date_range[0], importer.date_range[1], watcher.staleness.max_age_ms / 86400000)
+    except DuplicateFileException as e:
+        logger.error("Unable to import data from file: %s", e.message)
+        logger.error("The file will not be imported again.")
+        moveFile = 'Duplicate'
     except ImportException as e:
-        logger.warning("Unable to import data from file: {0}".format(e.message))
+        logger.warning("Unable to import data from file: %s", e.message)
         logger.warning("This is a recoverable error. The import will be attempted again later")
         logging.exception(e, exc_info=True)
+        retryError = e.message
     except FileFormatException as e:
-        logger.error("Unable to import data from file: {0}".format(e.message))
+        logger.error("Unable to import data from file: %s", e.message)
         logger.error("This is a non-recoverable error. The import will not be attempted again later.")
         moveFile = 'Error'
         logging.exception(e, exc_info=True)
-    except pyodbc.Error as e:
+    except route.sink.errors as e:
         # Check if this a known SQL error code. Some SQL errors we may be able to recover from. Others will
         #+ require the file to be moved to the errors directory
-        logger.error("Unable to import data from file: {0}".format(str(e)))
-        errCode = e.args[0]
-        connErrPat = re.compile("^0800[12347]$") # Pattern to match a connection error code
+        logger.error("Unable to import data from file: %s", e)
+        errCode = route.sink.error_code(e)
 
         # Check for the unrecoverable errors first
         if (errCode == '23000'):                       # Key constraint violation. Trying to import data twice
@@ -347,6 +659,9 @@ def import_file(file: str):
             moveFile = 'Error'
         elif errCode == 'HY000':                       # General error. Could occur due to missing field value, because the file was locked, or because the Access database is corrupted.
             logger.error("Since this was a database error this may be recoverable.  The import will be attempted again later")
+            retryError = str(e)
+        elif route.sink.is_connection_error(e):                   # Connection error. The connection will be reopened for the next import
+            logger.error("Lost the connection to the database. The import will be attempted again later")
         logging.exception(e, exc_info=True)
     except Exception as e:
         logger.error("Unable to import data from file for an unknown reason")
@@ -354,33 +669,54 @@ def import_file(file: str):
         moveFile = 'Error'
         logging.exception(e, exc_info=True)
     finally:
+        if retryError is not None and watcher.retries.failed(file, retryError):
+            logger.error("The import has failed too many times. The file will not be imported again.")
+            moveFile = 'Error'
+        elif moveFile != 'Skipped':
+            watcher.retries.forget(file)
+        watcher.metrics.gauge('retry_waiting', watcher.retries.waiting())
+        watcher.metrics.gauge('ingest_settling', watcher.ingest.depth())
+        watcher.metrics.gauge('route_{}_queued'.format(route.name), route.pipeline.depth())
+        for name, value in queue_gauges(route.pipeline.waiting()).items():
+            watcher.metrics.gauge('route_{0}_{1}'.format(route.name, name), value)
+        watcher.metrics.gauge('archive_pending', watcher.archiver.depth())
+        watcher.metrics.gauge('archive_failed', watcher.archiver.failures())
+
+        # With the journal the batches committed before the error stay in the database. Importing the same
+        #+ file again carries on from the last of them
+        if moveFile == 'Error' and watcher.journal is not None and importer is not None and importer.rows_written:
+            logger.warning("%s records committed before the error remain in the database", importer.rows_written)
+
+        # Duplicates keep the history entry of the original import
+        if moveFile in ('Archived', 'Error') and importer is not None and importer.digest is not None:
+            watcher.history.record(importer.digest, file, moveFile, importer.rows_written)
+
         if moveFile != 'Skipped':
             try:
                 archive_directory = None
                 if moveFile == 'Archived':
-                    archive_directory = opts.archive
-                elif moveFile == 'Error':
-                    archive_directory = opts.errors
-
-                postfix = datetime.today().strftime('%Y-%m-%d-%H-%M-%S-%f')
-
-                newName = "{0}.{1}".format(
-                    os.path.basename(file),
-                    postfix
-                )
-
-                newPath = os.path.join(archive_directory, newName)
-                logger.info("Archiving file as '{0}'.".format(newPath))
-                shutil.move(file, newPath)
+                    archive_directory = route.archive
+                elif moveFile in ('Error', 'Duplicate'):
+                    archive_directory = route.errors
+
+                # Files that go to the errors directory are left uncompressed so they can be opened and fixed
+                with timer.stage('archive'):
+                    newPath = watcher.archiver.archive(file, archive_directory, compress=moveFile == 'Archived')
+                logger.info("Archiving file as '%s'.", newPath)
             except Exception as e:
-                logger.error("Unable to move file '{0}'->'{1}: {2}".format(file, newPath, e))
+                logger.error("Unable to move file '%s' to '%s': %s", file, archive_directory, e)
                 logger.exception(e)
 
+        timer.finish(moveFile, importer.rows_written if importer is not None else None, size)
+        watcher.metrics.record(timer)
+
     
     logger.info("╭╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼")
     logger.info("╽")
-    logger.info("╽ Finished import of {}".format(file))
-    logger.info("╽ Status: {}".format(moveFile))
+    logger.info("╽ Finished import of %s (route '%s')", file, route.name)
+    logger.info("╽ Status: %s", moveFile)
+    logger.info("╽ Time: %.2f seconds (%.0f records/sec)", timer.total, timer.summary()['rows_per_second'])
+    logger.info("╽ Stages: %s", timer.describe())
     logger.info("╽")
     logger.info("╰╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼╼")     
         
@@ -388,14 +724,28 @@ def import_file(file: str):
 
 class Handler(events.FileSystemEventHandler):
     """
-    The handler is only interested in file creation events.  The Watcher will decide which
-    of these files triggers an import
+    The handler is only interested in files being created, written or moved into a watched
+    directory. The files are queued and the Watcher will decide which of these files triggers
+    an import once they have finished being written
     """
+    def __init__(self, watcher: Watcher):
+        super().__init__()
+        self.watcher = watcher
+
     def on_created(self, event):
         if not event.is_directory:    
             src = event.src_path
-            logger.info("File created: '{0}'".format(src))
-            check_file(event.src_path)
+            logger.info("File created: '%s'", src)
+            self.watcher.ingest.offer(src)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.ingest.offer(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            logger.info("File moved: '%s'", event.dest_path)
+            self.watcher.ingest.offer(event.dest_path)
         
 
 
@@ -406,7 +756,7 @@ def log_to_file():
     fh.setFormatter(formatter)
 
     # add the handlers to the logger
-    logger.addHandler(fh)
+    log_queue.add_handler(fh)
 
 def log_access_driver_error():
     #check if we are running in the 32 or 64 bit version of Python
@@ -416,7 +766,7 @@ def log_access_driver_error():
     logger.info("║ Download the latest ACE driver                                      ║")
     logger.info("║ https://www.microsoft.com/en-US/download/details.aspx?id=13255      ║")
     logger.info("║                                                                     ║")
-    logger.info("║ You will need to download the {0}bit version of the driver to work   ║".format(bitVer))
+    logger.info("║ You will need to download the %sbit version of the driver to work   ║", bitVer)
     logger.info("║ with this version of Python                                         ║")
     logger.info("║                                                                     ║")
     logger.info("╚═════════════════════════════════════════════════════════════════════╝")
@@ -424,7 +774,7 @@ def log_access_driver_error():
 if __name__ == '__main__':
     sh = logging.StreamHandler()
     sh.setLevel(logging.DEBUG)
-    logging.getLogger().addHandler(sh)
+    log_queue.add_handler(sh)
     Registry.write_default_opts()
     win32serviceutil.HandleCommandLine(Watcher)
 